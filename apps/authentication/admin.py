@@ -3,4 +3,11 @@ from apps.authentication.models import *
 # Register your models here.
 
 admin.site.register(Role)
-admin.site.register(Users)
\ No newline at end of file
+admin.site.register(Users)
+
+@admin.register(OtpDelivery)
+class OtpDeliveryAdmin(admin.ModelAdmin):
+    list_display = ('id', 'channel', 'recipient', 'status', 'attempts', 'next_attempt_at', 'created_at', 'sent_at')
+    list_filter = ('channel', 'status')
+    search_fields = ('recipient',)
+    exclude = ('otp',)
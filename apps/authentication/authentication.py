@@ -0,0 +1,167 @@
+"""
+Claims-based JWT authentication.
+
+Access tokens carry the fields the request path needs (role category, staff
+and superuser flags), so authenticating a request is a signature check plus
+in-memory lookups. Subscription status is not a claim: it is read from the
+shared cache (apps.authentication.subscriptions), so a cancelled plan shuts
+out tokens issued before it. SubscriptionCheckMiddleware runs before DRF
+has read the token, so authenticate() checks it instead. The Users row is
+only fetched when a view touches something the claims do not cover.
+
+Deactivated or deleted accounts, and users whose role, staff or superuser
+flag changes, get a TokenRevocation row: tokens issued before it are
+rejected. Rows are kept for one access token lifetime. Each process reads
+them through a copy reloaded every TOKEN_REVOCATION_REFRESH seconds, so a
+revocation applies at once in the process that made it and within that
+window everywhere else.
+"""
+import threading
+import time
+from django.conf import settings
+from django.utils import timezone
+from django.utils.functional import SimpleLazyObject
+from rest_framework.exceptions import PermissionDenied
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import AuthenticationFailed, InvalidToken
+from rest_framework_simplejwt.settings import api_settings
+from rest_framework_simplejwt.tokens import RefreshToken
+from apps.authentication import subscriptions
+
+
+class RevocationList:
+    """
+    This process's copy of the live TokenRevocation rows: user id (as a
+    string, like the token claim) -> revoked at, in epoch seconds.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.users = {}
+        self.loaded_at = None
+
+    def revoked_at(self, user_id):
+        now = time.time()
+        if self.loaded_at is None or now - self.loaded_at >= settings.TOKEN_REVOCATION_REFRESH:
+            users = self.load()
+            with self.lock:
+                self.users, self.loaded_at = users, now
+        return self.users.get(str(user_id))
+
+    @staticmethod
+    def load():
+        from apps.authentication.models import TokenRevocation
+        rows = TokenRevocation.objects.filter(revoked_at__gte=timezone.now() - api_settings.ACCESS_TOKEN_LIFETIME)
+        return {str(user_id): revoked_at.timestamp() for user_id, revoked_at in rows.values_list('user_id', 'revoked_at')}
+
+    def add(self, user_ids, revoked_at):
+        with self.lock:
+            self.users = {**self.users, **{str(user_id): revoked_at for user_id in user_ids}}
+
+    def reset(self):
+        with self.lock:
+            self.users, self.loaded_at = {}, None
+
+
+revocations = RevocationList()
+
+
+def revoke_user_tokens(*user_ids):
+    from apps.authentication.models import TokenRevocation
+    now = timezone.now()
+    TokenRevocation.objects.bulk_create([TokenRevocation(user_id=user_id, revoked_at=now) for user_id in user_ids],
+                                        update_conflicts=True, unique_fields=['user_id'], update_fields=['revoked_at'])
+    # Older rows no longer match any unexpired token
+    TokenRevocation.objects.filter(revoked_at__lt=now - api_settings.ACCESS_TOKEN_LIFETIME).delete()
+    revocations.add(user_ids, now.timestamp())
+
+
+def is_revoked(user_id, issued_at):
+    revoked_at = revocations.revoked_at(user_id)
+    return revoked_at is not None and (issued_at is None or issued_at <= revoked_at)
+
+
+class ClaimsRefreshToken(RefreshToken):
+    """
+    RefreshToken that also stores the user claims; access tokens made from it
+    copy them.
+    """
+
+    @classmethod
+    def for_user(cls, user):
+        token = super().for_user(user)
+        token['role_category'] = user.role.role_category if user.role_id else None
+        token['is_staff'] = user.is_staff
+        token['is_superuser'] = user.is_superuser
+        return token
+
+
+class ClaimsUser(SimpleLazyObject):
+    """
+    Authenticated user built from token claims. Any attribute outside the
+    claims (user.role, user.email, assigning it to a ForeignKey, ...) loads
+    the Users row once.
+    """
+    is_authenticated = True
+    is_anonymous = False
+    is_active = True
+
+    def __init__(self, token):
+        self.__dict__['token'] = token
+        super().__init__(self.load)
+
+    def load(self):
+        from apps.authentication.models import Users
+        try:
+            return Users.objects.select_related('role').get(pk=self.id)
+        except Users.DoesNotExist:
+            raise AuthenticationFailed("User not found", code="user_not_found")
+
+    @property
+    def id(self):
+        return self.token[api_settings.USER_ID_CLAIM]
+
+    pk = id
+
+    @property
+    def role_category(self):
+        return self.token['role_category']
+
+    @property
+    def is_staff(self):
+        return self.token['is_staff']
+
+    @property
+    def is_superuser(self):
+        return self.token['is_superuser']
+
+    @property
+    def has_active_subscription(self):
+        return subscriptions.has_active_subscription(self.id)
+
+    def __bool__(self):
+        return True
+
+    def __str__(self):
+        return str(self.id)
+
+    def __repr__(self):
+        return f"<ClaimsUser: {self.id}>"
+
+
+class ClaimsJWTAuthentication(JWTAuthentication):
+    def authenticate(self, request):
+        result = super().authenticate(request)
+        if result is not None and not subscriptions.may_use_api(result[0]):
+            raise PermissionDenied(subscriptions.EXPIRED)
+        return result
+
+    def get_user(self, validated_token):
+        if api_settings.USER_ID_CLAIM not in validated_token:
+            raise InvalidToken("Token contained no recognizable user identification")
+        if is_revoked(validated_token[api_settings.USER_ID_CLAIM], validated_token.get('iat')):
+            raise AuthenticationFailed("User is inactive", code="user_inactive")
+        if 'role_category' not in validated_token:
+            # Issued before claims were added to tokens
+            return super().get_user(validated_token)
+        return ClaimsUser(validated_token)
@@ -0,0 +1,170 @@
+"""
+OTP delivery queue.
+
+Views call enqueue_otp(), which inserts an OtpDelivery row and returns. The
+otp_worker command drains the table. It claims due jobs in batches, sends
+every email of a batch over one SMTP connection and every SMS through one
+HTTP session (both with timeouts), and retries failures with exponential
+backoff and jitter. A code that cannot be delivered within
+OTP_MAX_AGE_SECONDS is dropped rather than sent stale.
+
+metrics() reports queue depth, the age of the oldest waiting job and
+delivery latency.
+"""
+import logging
+import random
+import signal
+import time
+import uuid
+from datetime import timedelta
+import requests
+from django.conf import settings
+from django.core.mail import get_connection
+from django.db.models import Count, Q
+from django.utils import timezone
+from apps.authentication.models import OtpDelivery
+from apps.authentication.utils import send_mobial_otp, send_otp_email
+
+logger = logging.getLogger(__name__)
+
+METRICS_WINDOW = timedelta(hours=1)
+METRICS_SAMPLE = 1000
+
+
+def enqueue_otp(channel, recipient, otp):
+    return OtpDelivery.objects.create(channel=channel, recipient=recipient, otp=str(otp))
+
+
+def backoff(attempts):
+    # 2s, 4s, 8s, ... capped, with jitter so a gateway outage does not end in a thundering herd
+    delay = min(settings.OTP_RETRY_BASE_SECONDS * 2 ** (attempts - 1), settings.OTP_RETRY_MAX_SECONDS)
+    return timedelta(seconds=delay * random.uniform(0.5, 1.0))
+
+
+def claim_batch(size=None):
+    """
+    Marks up to size due jobs as sending under a fresh claim token and
+    returns them. Jobs left in sending by a dead worker are due again
+    after OTP_CLAIM_TIMEOUT_SECONDS.
+    """
+    now = timezone.now()
+    stale = now - timedelta(seconds=settings.OTP_CLAIM_TIMEOUT_SECONDS)
+    due = (OtpDelivery.objects.filter(Q(status='pending', next_attempt_at__lte=now) | Q(status='sending', claimed_at__lt=stale))
+           .order_by('next_attempt_at', 'id').values_list('id', flat=True)[:size or settings.OTP_BATCH_SIZE])
+    claim = uuid.uuid4().hex
+    # Re-checking the status makes the claim safe against another worker taking the same ids
+    OtpDelivery.objects.filter(Q(status='pending') | Q(status='sending', claimed_at__lt=stale), id__in=list(due)).update(
+        status='sending', claim=claim, claimed_at=now)
+    return list(OtpDelivery.objects.filter(claim=claim, status='sending').order_by('id'))
+
+
+def send_batch(jobs):
+    """
+    Sends jobs and returns {job id: error message or None}.
+    """
+    results = {}
+    emails = [job for job in jobs if job.channel == 'email']
+    texts = [job for job in jobs if job.channel == 'sms']
+    if emails:
+        connection = get_connection(timeout=settings.EMAIL_TIMEOUT)
+        try:
+            connection.open()
+            for job in emails:
+                try:
+                    send_otp_email(job.recipient, job.otp, connection=connection)
+                    results[job.id] = None
+                except Exception as e:
+                    results[job.id] = f"{type(e).__name__}: {e}"
+        except Exception as e:
+            # Could not reach the SMTP server at all: fail the rest of the batch without trying each one
+            for job in emails:
+                results.setdefault(job.id, f"{type(e).__name__}: {e}")
+        finally:
+            connection.close()
+    if texts:
+        if not settings.FAST2SMS_API_KEY:
+            for job in texts:
+                results[job.id] = "FAST2SMS_API_KEY is not set"
+        else:
+            with requests.Session() as session:
+                for job in texts:
+                    try:
+                        send_mobial_otp(job.recipient, job.otp, session=session)
+                        results[job.id] = None
+                    except requests.RequestException as e:
+                        results[job.id] = f"{type(e).__name__}: {e}"
+    return results
+
+
+def process_batch(size=None):
+    """
+    Claims, sends and records one batch. Returns the number of jobs handled.
+    """
+    jobs = claim_batch(size)
+    if not jobs:
+        return 0
+    results = send_batch(jobs)
+    now = timezone.now()
+    expired = now - timedelta(seconds=settings.OTP_MAX_AGE_SECONDS)
+    for job in jobs:
+        error = results.get(job.id)
+        job.attempts += 1
+        job.claim = ""
+        if error is None:
+            job.status, job.sent_at, job.otp, job.last_error = 'sent', now, "", ""
+            continue
+        job.last_error = error
+        if job.attempts >= settings.OTP_MAX_ATTEMPTS or job.created_at <= expired:
+            job.status, job.otp = 'failed', ""
+            logger.warning("OTP %s delivery %s failed for good: %s", job.channel, job.id, error)
+        else:
+            job.status, job.next_attempt_at = 'pending', now + backoff(job.attempts)
+    OtpDelivery.objects.bulk_update(jobs, ['status', 'attempts', 'claim', 'sent_at', 'otp', 'last_error', 'next_attempt_at'])
+    return len(jobs)
+
+
+def run_worker(once=False, poll=None):
+    """
+    Processes batches until stopped (SIGINT/SIGTERM), sleeping poll seconds
+    whenever the queue is empty. once=True drains what is due and returns.
+    """
+    poll = settings.OTP_WORKER_POLL_SECONDS if poll is None else poll
+    stopping = []
+    if not once:
+        for sig in (signal.SIGINT, signal.SIGTERM):
+            signal.signal(sig, lambda *args: stopping.append(True))
+    handled = 0
+    while not stopping:
+        count = process_batch()
+        handled += count
+        if count == 0:
+            if once:
+                break
+            time.sleep(poll)
+    return handled
+
+
+def metrics():
+    """
+    Queue depth by status, the age of the oldest due job, and delivery
+    latency (enqueue to sent) over the last hour.
+    """
+    now = timezone.now()
+    depth = dict(OtpDelivery.objects.filter(status__in=('pending', 'sending')).values_list('status').annotate(n=Count('id')))
+    oldest = OtpDelivery.objects.filter(status='pending', next_attempt_at__lte=now).order_by('created_at').values_list('created_at', flat=True).first()
+    since = now - METRICS_WINDOW
+    latencies = sorted((sent - created).total_seconds() * 1000 for created, sent in
+                       OtpDelivery.objects.filter(status='sent', sent_at__gte=since).order_by('-sent_at')
+                       .values_list('created_at', 'sent_at')[:METRICS_SAMPLE])
+
+    def pct(p):
+        return round(latencies[min(int(len(latencies) * p / 100), len(latencies) - 1)], 1) if latencies else None
+
+    return {
+        'pending': depth.get('pending', 0),
+        'sending': depth.get('sending', 0),
+        'oldest_due_age_s': round((now - oldest).total_seconds(), 1) if oldest else None,
+        'sent_last_hour': OtpDelivery.objects.filter(status='sent', sent_at__gte=since).count(),
+        'failed_last_hour': OtpDelivery.objects.filter(status='failed', created_at__gte=since).count(),
+        'latency_ms': {'p50': pct(50), 'p95': pct(95), 'max': latencies[-1] if latencies else None, 'samples': len(latencies)},
+    }
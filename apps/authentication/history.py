@@ -0,0 +1,148 @@
+"""
+Cheaper audit history for the hot auth models.
+
+SelectiveHistoricalRecords is simple_history's HistoricalRecords with two
+changes:
+
+- tracked=[...] is an allow-list. An update only writes a history row
+  when one of those fields changed since the instance was loaded or last
+  saved. Creates and deletes are always recorded. Combine it with
+  excluded_fields for high-churn columns such as Users.otp, which then
+  never reach the history table at all.
+- Rows are buffered instead of saved one by one. A row made inside a
+  transaction joins the buffer only when that transaction commits (and
+  never if it rolls back). The buffer is written with one bulk_create per
+  history model when the outermost history_batch() ends;
+  HistoryBufferMiddleware wraps every request in one. Outside a batch,
+  rows are written as soon as they exist, as before.
+"""
+from contextlib import contextmanager
+from functools import partial
+from asgiref.local import Local
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, transaction
+from django.db.models.fields.files import FieldFile
+from django.db.models.signals import post_init
+from django.utils import timezone
+from simple_history.models import HistoricalRecords
+from simple_history.signals import post_create_historical_record, pre_create_historical_record
+
+_state = Local()
+UNKNOWN = object()
+
+
+def _value(instance, field):
+    # Deferred columns are not loaded just to compare them
+    value = instance.__dict__.get(field.attname, UNKNOWN)
+    return value.name if isinstance(value, FieldFile) else value
+
+
+@contextmanager
+def history_batch():
+    """
+    Collects history rows written inside the block and bulk-creates them
+    at the end. Nested batches join the outer one.
+    """
+    if getattr(_state, 'rows', None) is not None:
+        yield
+        return
+    _state.rows = []
+    try:
+        yield
+    finally:
+        rows, _state.rows = _state.rows, None
+        flush(rows)
+
+
+def flush(rows):
+    groups = {}
+    for records, history_instance, instance, using in rows:
+        groups.setdefault((history_instance.__class__, using), []).append((records, history_instance, instance))
+    for (model, using), group in groups.items():
+        if len(group) == 1:
+            # A lone row skips bulk_create's BEGIN/COMMIT
+            group[0][1].save(using=using)
+        else:
+            model.objects.using(using).bulk_create([history_instance for _, history_instance, _ in group])
+        for records, history_instance, instance in group:
+            records.created(history_instance, instance, using)
+
+
+class HistoryBufferMiddleware:
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        with history_batch():
+            return self.get_response(request)
+
+
+class SelectiveHistoricalRecords(HistoricalRecords):
+    def __init__(self, *args, tracked=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.tracked = tuple(tracked) if tracked is not None else None
+
+    def finalize(self, sender, **kwargs):
+        super().finalize(sender, **kwargs)
+        if self.tracked is not None and sender is self.cls:
+            post_init.connect(self.remember, sender=sender, weak=False, dispatch_uid=f"history_snapshot_{sender._meta.label}")
+
+    def tracked_fields(self, instance):
+        return [instance._meta.get_field(name) for name in self.tracked]
+
+    def remember(self, instance, **kwargs):
+        instance._history_snapshot = {field.attname: _value(instance, field) for field in self.tracked_fields(instance)}
+
+    def changed(self, instance, update_fields):
+        if update_fields is not None:
+            names = {instance._meta.get_field(name).name for name in update_fields}
+            if names.isdisjoint(self.tracked):
+                return False
+        snapshot = getattr(instance, '_history_snapshot', {})
+        return any(snapshot.get(field.attname, UNKNOWN) is UNKNOWN or snapshot[field.attname] != _value(instance, field)
+                   for field in self.tracked_fields(instance))
+
+    def post_save(self, instance, created, using=None, **kwargs):
+        if self.tracked is not None and not kwargs.get('raw', False):
+            if not created and not self.changed(instance, kwargs.get('update_fields')):
+                return
+            if getattr(settings, 'SIMPLE_HISTORY_ENABLED', True) and not hasattr(instance, 'skip_history_when_saving'):
+                self.remember(instance)
+        super().post_save(instance, created, using=using, **kwargs)
+
+    def create_historical_record(self, instance, history_type, using=None):
+        if self.m2m_fields:
+            # m2m snapshots need the saved history row; keep simple_history's path
+            return super().create_historical_record(instance, history_type, using=using)
+        using = using if self.use_base_model_db else None
+        manager = getattr(instance, self.manager_name)
+        history_date = getattr(instance, '_history_date', timezone.now())
+        history_user = self.get_history_user(instance)
+        history_change_reason = self.get_change_reason_for_object(instance, history_type, using)
+        attrs = {field.attname: getattr(instance, field.attname) for field in self.fields_included(instance)}
+        if getattr(manager.model, 'history_relation', None) is not None:
+            attrs['history_relation'] = instance
+        history_instance = manager.model(history_date=history_date, history_type=history_type, history_user=history_user,
+                                         history_change_reason=history_change_reason, **attrs)
+        pre_create_historical_record.send(sender=manager.model, instance=instance, history_date=history_date,
+                                          history_user=history_user, history_change_reason=history_change_reason,
+                                          history_instance=history_instance, using=using)
+        row = (self, history_instance, instance, using)
+        connection = transaction.get_connection(using or instance._state.db or DEFAULT_DB_ALIAS)
+        if connection.in_atomic_block:
+            transaction.on_commit(partial(self.buffer, row), using=connection.alias)
+        else:
+            self.buffer(row)
+
+    def buffer(self, row):
+        rows = getattr(_state, 'rows', None)
+        if rows is None:
+            flush([row])
+        else:
+            rows.append(row)
+
+    def created(self, history_instance, instance, using):
+        post_create_historical_record.send(sender=history_instance.__class__, instance=instance,
+                                           history_instance=history_instance, history_date=history_instance.history_date,
+                                           history_user=history_instance.history_user,
+                                           history_change_reason=history_instance.history_change_reason, using=using)
@@ -0,0 +1,18 @@
+import json
+from django.core.management.base import BaseCommand
+from apps.authentication.delivery import metrics, run_worker
+
+
+class Command(BaseCommand):
+    help = "Deliver queued OTP emails and SMS until stopped (SIGINT/SIGTERM)."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--once", action="store_true", help="Deliver what is due now, then exit.")
+        parser.add_argument("--stats", action="store_true", help="Print queue depth and delivery latency, then exit.")
+
+    def handle(self, *args, **options):
+        if options["stats"]:
+            self.stdout.write(json.dumps(metrics(), indent=2))
+            return
+        handled = run_worker(once=options["once"])
+        self.stdout.write(self.style.SUCCESS(f"{handled} deliveries processed"))
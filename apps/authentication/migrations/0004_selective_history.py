@@ -0,0 +1,17 @@
+# Generated by Django 5.2.7 on 2026-10-18 09:55
+
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('authentication', '0003_otp_delivery'),
+    ]
+
+    operations = [
+        migrations.RemoveField(
+            model_name='historicalusers',
+            name='otp',
+        ),
+    ]
@@ -0,0 +1,24 @@
+# Generated by Django 5.2.7 on 2026-10-18 11:46
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('authentication', '0006_restaurant_member'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TokenRevocation',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('user_id', models.BigIntegerField(unique=True)),
+                ('revoked_at', models.DateTimeField(db_index=True)),
+            ],
+            options={
+                'db_table': 'token_revocation',
+            },
+        ),
+    ]
@@ -3,7 +3,7 @@ from django.db import models
 from django.contrib.auth.models import AbstractBaseUser, BaseUserManager, PermissionsMixin
 from django.utils import timezone
 from datetime import timedelta
-from simple_history.models import HistoricalRecords
+from apps.authentication.history import SelectiveHistoricalRecords
 
 # ===============================
 #  USER MANAGEMENT
@@ -52,7 +52,7 @@ class Role(models.Model):
     role_category = models.CharField(max_length=100, choices=ROLE_CATEGORIES, default="customer")
     created_at = models.DateTimeField(auto_now_add=True)
 
-    history = HistoricalRecords()
+    history = SelectiveHistoricalRecords(tracked=['role_name', 'role_category'])
 
     def __str__(self):
         return self.role_name
@@ -86,11 +86,19 @@ class Users(AbstractBaseUser, PermissionsMixin):
     REQUIRED_FIELDS = ["username", "phone"]
 
     objects = UserManager()
-    history = HistoricalRecords()
+    # otp changes on every code sent and last_login on every login; neither is worth a history row
+    history = SelectiveHistoricalRecords(excluded_fields=['otp'], tracked=[
+        'first_name', 'last_name', 'phone', 'email', 'username', 'password', 'profile_image', 'firebase_id',
+        'date_of_birth', 'address', 'role', 'is_active', 'is_superuser', 'is_staff'])
 
     def __str__(self):
         return self.username
 
+    @property
+    def has_active_subscription(self):
+        from apps.authentication.subscriptions import has_active_subscription
+        return has_active_subscription(self.pk)
+
     class Meta:
         db_table = 'users'
 
@@ -101,7 +109,7 @@ class UserRole(models.Model):
     created_by = models.ForeignKey(Users, on_delete=models.SET_NULL, null=True, related_name="created_roles")
     created_at = models.DateTimeField(auto_now_add=True)
 
-    history = HistoricalRecords()
+    history = SelectiveHistoricalRecords()
 
     def __str__(self):
         return f"{self.user.username} - {self.role.role_name}"
@@ -127,7 +135,7 @@ class Restaurant(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
-    history = HistoricalRecords()
+    history = SelectiveHistoricalRecords(tracked=['owner', 'name', 'address', 'contact_number', 'email', 'logo', 'is_active'])
 
     def __str__(self):
         return self.name
@@ -135,6 +143,21 @@ class Restaurant(models.Model):
     class Meta:
         db_table = "restaurant"
 
+# Restaurant Staff (who besides the owner works on a restaurant's catalog, orders and kitchen)
+class RestaurantMember(models.Model):
+    restaurant = models.ForeignKey(Restaurant, on_delete=models.CASCADE, related_name='members')
+    user = models.ForeignKey(Users, on_delete=models.CASCADE, related_name='restaurant_memberships')
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    history = SelectiveHistoricalRecords()
+
+    def __str__(self):
+        return f"{self.user.username} @ {self.restaurant.name}"
+
+    class Meta:
+        db_table = "restaurant_member"
+        unique_together = ("restaurant", "user")
+
 # Subscription Plan (Defines pricing & duration)
 class SubscriptionPlan(models.Model):
     PLAN_CHOICES = [
@@ -150,7 +173,7 @@ class SubscriptionPlan(models.Model):
     is_active = models.BooleanField(default=True)
 
     created_at = models.DateTimeField(auto_now_add=True)
-    history = HistoricalRecords()
+    history = SelectiveHistoricalRecords()
 
     def __str__(self):
         return f"{self.name} - ₹{self.price}"
@@ -168,7 +191,7 @@ class RestaurantSubscription(models.Model):
     payment_reference = models.CharField(max_length=200, blank=True, null=True)
 
     created_at = models.DateTimeField(auto_now_add=True)
-    history = HistoricalRecords()
+    history = SelectiveHistoricalRecords(tracked=['plan', 'start_date', 'end_date', 'is_active', 'payment_reference'])
 
     def save(self, *args, **kwargs):
         # Auto set end date based on plan duration
@@ -201,11 +224,50 @@ class PaymentTransaction(models.Model):
     ], default='pending')
     payment_method = models.CharField(max_length=50, blank=True, null=True)
     created_at = models.DateTimeField(auto_now_add=True)
+    # Status changes move it too; the payment rollups refresh from it
+    updated_at = models.DateTimeField(auto_now=True, db_index=True)
 
-    history = HistoricalRecords()
+    history = SelectiveHistoricalRecords(tracked=['restaurant', 'plan', 'transaction_id', 'amount', 'payment_status', 'payment_method'])
 
     def __str__(self):
         return f"{self.restaurant.name} - {self.transaction_id}"
 
     class Meta:
         db_table = "payment_transaction"
+
+# Access Token Revocations (read by ClaimsJWTAuthentication, see apps/authentication/authentication.py)
+class TokenRevocation(models.Model):
+    # Not a ForeignKey: a deleted user's tokens stay revoked
+    user_id = models.BigIntegerField(unique=True)
+    revoked_at = models.DateTimeField(db_index=True)
+
+    def __str__(self):
+        return f"user {self.user_id} revoked at {self.revoked_at}"
+
+    class Meta:
+        db_table = "token_revocation"
+
+# OTP Delivery Queue (drained by the otp_worker command, see apps/authentication/delivery.py)
+class OtpDelivery(models.Model):
+    CHANNEL_CHOICES = [('email', 'Email'), ('sms', 'SMS')]
+    STATUS_CHOICES = [('pending', 'Pending'), ('sending', 'Sending'), ('sent', 'Sent'), ('failed', 'Failed')]
+
+    channel = models.CharField(max_length=10, choices=CHANNEL_CHOICES)
+    recipient = models.CharField(max_length=254)
+    # Cleared once the job is finished
+    otp = models.CharField(max_length=10, blank=True, default="")
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default='pending')
+    attempts = models.PositiveSmallIntegerField(default=0)
+    next_attempt_at = models.DateTimeField(default=timezone.now)
+    claim = models.CharField(max_length=32, blank=True, default="")
+    claimed_at = models.DateTimeField(blank=True, null=True)
+    last_error = models.TextField(blank=True, default="")
+    created_at = models.DateTimeField(default=timezone.now)
+    sent_at = models.DateTimeField(blank=True, null=True)
+
+    def __str__(self):
+        return f"{self.channel} to {self.recipient} ({self.status})"
+
+    class Meta:
+        db_table = "otp_delivery"
+        indexes = [models.Index(fields=['status', 'next_attempt_at'], name='otp_delivery_due')]
@@ -0,0 +1,81 @@
+from functools import partial
+from django.db import transaction
+from django.db.models.signals import post_init, post_save, post_delete, pre_delete, pre_save
+from apps.authentication.models import Role, Users, Restaurant, RestaurantMember, RestaurantSubscription, PaymentTransaction
+from apps.authentication.subscriptions import invalidate
+from apps.authentication.authentication import revoke_user_tokens
+
+# ============================================================
+# SUBSCRIPTION STATUS — drops cached status of the restaurant's owner and members
+# ============================================================
+def restaurant_people(restaurant_id):
+    rows = Restaurant.objects.filter(pk=restaurant_id).values_list('owner_id', 'members__user_id')
+    return {user_id for row in rows for user_id in row if user_id is not None}
+
+def invalidate_restaurant_people(sender, instance, **kwargs):
+    invalidate(*restaurant_people(instance.restaurant_id))
+
+def invalidate_people(sender, instance, **kwargs):
+    invalidate(instance.owner_id, *restaurant_people(instance.pk))
+
+def invalidate_previous_owner(sender, instance, raw=False, **kwargs):
+    # A restaurant handed to another owner also changes the previous owner's status
+    if instance.pk and not raw:
+        invalidate(Restaurant.objects.filter(pk=instance.pk).values_list('owner_id', flat=True).first())
+
+def invalidate_member(sender, instance, **kwargs):
+    invalidate(instance.user_id)
+
+for model in (RestaurantSubscription, PaymentTransaction):
+    post_save.connect(invalidate_restaurant_people, sender=model, dispatch_uid=f'subscription_status_save_{model.__name__}')
+    post_delete.connect(invalidate_restaurant_people, sender=model, dispatch_uid=f'subscription_status_delete_{model.__name__}')
+pre_save.connect(invalidate_previous_owner, sender=Restaurant, dispatch_uid='subscription_status_restaurant_owner')
+post_save.connect(invalidate_people, sender=Restaurant, dispatch_uid='subscription_status_save_Restaurant')
+post_delete.connect(invalidate_people, sender=Restaurant, dispatch_uid='subscription_status_delete_Restaurant')
+post_save.connect(invalidate_member, sender=RestaurantMember, dispatch_uid='subscription_status_save_RestaurantMember')
+post_delete.connect(invalidate_member, sender=RestaurantMember, dispatch_uid='subscription_status_delete_RestaurantMember')
+
+# ============================================================
+# TOKEN REVOCATION — access tokens carry claims and are not checked against the users table
+# ============================================================
+# What a live access token depends on: its claims (see ClaimsRefreshToken) and the account being active
+TOKEN_FIELDS = ('role_id', 'is_staff', 'is_superuser', 'is_active')
+
+def token_fields(instance):
+    return tuple(instance.__dict__.get(name) for name in TOKEN_FIELDS)
+
+def remember_token_fields(sender, instance, **kwargs):
+    instance._token_fields = token_fields(instance)
+
+def revoke_changed_user(sender, instance, created=False, raw=False, **kwargs):
+    fields = token_fields(instance)
+    if not raw and not created and fields != getattr(instance, '_token_fields', None):
+        # After commit, so a token issued in between cannot carry the old claims
+        transaction.on_commit(partial(revoke_user_tokens, instance.pk))
+    instance._token_fields = fields
+
+def revoke_deleted_user(sender, instance, **kwargs):
+    transaction.on_commit(partial(revoke_user_tokens, instance.pk))
+
+def remember_role_category(sender, instance, **kwargs):
+    instance._token_category = instance.__dict__.get('role_category')
+
+def revoke_role_users(sender, instance, created=False, raw=False, **kwargs):
+    if not raw and not created and instance.role_category != getattr(instance, '_token_category', None):
+        user_ids = list(instance.users.values_list('id', flat=True))
+        if user_ids:
+            transaction.on_commit(partial(revoke_user_tokens, *user_ids))
+    instance._token_category = instance.role_category
+
+def revoke_deleted_role_users(sender, instance, **kwargs):
+    # Its users' role is set to NULL without signals
+    user_ids = list(instance.users.values_list('id', flat=True))
+    if user_ids:
+        transaction.on_commit(partial(revoke_user_tokens, *user_ids))
+
+post_init.connect(remember_token_fields, sender=Users, dispatch_uid='jwt_remember_user')
+post_save.connect(revoke_changed_user, sender=Users, dispatch_uid='jwt_revoke_changed_user')
+post_delete.connect(revoke_deleted_user, sender=Users, dispatch_uid='jwt_revoke_deleted_user')
+post_init.connect(remember_role_category, sender=Role, dispatch_uid='jwt_remember_role')
+post_save.connect(revoke_role_users, sender=Role, dispatch_uid='jwt_revoke_role_users')
+pre_delete.connect(revoke_deleted_role_users, sender=Role, dispatch_uid='jwt_revoke_deleted_role_users')
@@ -0,0 +1,88 @@
+"""
+Cached subscription status per user, checked on every request: for token
+users by ClaimsJWTAuthentication, for session users by
+SubscriptionCheckMiddleware.
+
+A status is resolved from the database once, then kept in a bounded
+process-local LRU and in the shared cache. Neither entry outlives the
+subscription's end_date, so an expiring plan is noticed on time without a
+query. Signals call invalidate() when a subscription, payment, restaurant
+or membership changes.
+"""
+import threading
+import time
+from collections import OrderedDict
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Q
+from django.utils import timezone
+
+# Cache key -> (active, expires at), least recently refreshed first
+_local = OrderedDict()
+_local_lock = threading.Lock()
+
+
+EXPIRED = {"errors": {"subscription": ["Your restaurant subscription has expired. Please renew to continue."]}}
+
+
+def cache_key(user_id):
+    return f"subscription:{user_id}"
+
+
+def resolve(user_id):
+    """
+    Returns (active, valid_until) from the database. valid_until is the
+    epoch time at which the answer may change on its own, or None.
+    """
+    from apps.authentication.models import RestaurantSubscription
+    now = timezone.now()
+    # Owners and members of a restaurant both work under its subscription
+    ends = list(RestaurantSubscription.objects.filter(
+        Q(restaurant__owner_id=user_id) | Q(restaurant__members__user_id=user_id),
+        restaurant__is_active=True, is_active=True, start_date__lte=now,
+    ).exclude(end_date__lte=now).values_list('end_date', flat=True))
+    if not ends:
+        return False, None
+    if None in ends:
+        return True, None
+    return True, max(ends).timestamp()
+
+
+def has_active_subscription(user_id):
+    # Keyed like the shared cache, so a user id given as int or str shares one entry
+    key = cache_key(user_id)
+    now = time.time()
+    entry = _local.get(key)
+    if entry is None or entry[1] <= now:
+        entry = cache.get(key)
+        if entry is None or entry[1] <= now:
+            active, valid_until = resolve(user_id)
+            expires = now + settings.SUBSCRIPTION_CACHE_TIMEOUT
+            if valid_until is not None:
+                expires = min(expires, valid_until)
+            entry = (active, expires)
+            cache.set(key, entry, max(1, int(expires - now)))
+        # The local copy is kept briefly so changes made in other processes show up quickly
+        local = (entry[0], min(entry[1], now + settings.SUBSCRIPTION_LOCAL_TIMEOUT))
+        with _local_lock:
+            _local[key] = local
+            _local.move_to_end(key)
+            # Users not seen lately are read from the shared cache on their next request
+            while len(_local) > settings.SUBSCRIPTION_LOCAL_USERS:
+                _local.popitem(last=False)
+    return entry[0]
+
+
+def may_use_api(user):
+    # Superusers are never shut out
+    return user.is_superuser or user.has_active_subscription
+
+
+def invalidate(*user_ids):
+    for user_id in user_ids:
+        if user_id is None:
+            continue
+        key = cache_key(user_id)
+        cache.delete(key)
+        with _local_lock:
+            _local.pop(key, None)
@@ -1,3 +1,230 @@
-from django.test import TestCase
+from datetime import timedelta
+from unittest import mock
+import requests
+from django.core import mail
+from django.db import connection, transaction
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from rest_framework.test import APIClient, APIRequestFactory
+from rest_framework_simplejwt.exceptions import AuthenticationFailed
+from rest_framework_simplejwt.tokens import RefreshToken
+from apps.authentication import delivery, subscriptions
+from apps.authentication.authentication import ClaimsJWTAuthentication, ClaimsRefreshToken, ClaimsUser, revocations
+from apps.authentication.history import history_batch
+from apps.authentication.models import OtpDelivery, Restaurant, RestaurantMember, RestaurantSubscription, Role, TokenRevocation, Users
 
-# Create your tests here.
+
+class SubscriptionStatusTests(TestCase):
+    def setUp(self):
+        self.owner = Users.objects.create_user(email='owner@example.com', username='owner', phone='1', password='x')
+        self.subscription = RestaurantSubscription.objects.create(
+            restaurant=Restaurant.objects.create(owner=self.owner, name="Spice"), end_date=timezone.now() + timedelta(days=30))
+
+    def test_tokens_see_a_cancelled_subscription_at_once(self):
+        user = ClaimsUser(ClaimsRefreshToken.for_user(self.owner).access_token)
+        self.assertTrue(user.has_active_subscription)
+        with CaptureQueriesContext(connection) as queries:
+            self.assertTrue(user.has_active_subscription)
+        self.assertEqual(len(queries), 0)
+        self.subscription.is_active = False
+        self.subscription.save()
+        self.assertFalse(user.has_active_subscription)
+        self.assertFalse(subscriptions.has_active_subscription(self.owner.pk))
+
+    def test_changes_invalidate_the_cached_status(self):
+        restaurant = self.subscription.restaurant
+        self.assertTrue(subscriptions.has_active_subscription(self.owner.pk))
+        with CaptureQueriesContext(connection) as queries:
+            self.assertTrue(subscriptions.has_active_subscription(str(self.owner.pk)))
+        self.assertEqual(len(queries), 0)
+        restaurant.is_active = False
+        restaurant.save()
+        self.assertFalse(subscriptions.has_active_subscription(self.owner.pk))
+        restaurant.is_active = True
+        restaurant.save()
+        self.assertTrue(subscriptions.has_active_subscription(self.owner.pk))
+        # Handing the restaurant over changes both owners' status
+        buyer = Users.objects.create_user(email='buyer@example.com', username='buyer', phone='2', password='x')
+        self.assertFalse(subscriptions.has_active_subscription(buyer.pk))
+        restaurant.owner = buyer
+        restaurant.save()
+        self.assertEqual((subscriptions.has_active_subscription(self.owner.pk), subscriptions.has_active_subscription(buyer.pk)), (False, True))
+        self.subscription.delete()
+        self.assertFalse(subscriptions.has_active_subscription(buyer.pk))
+
+    def test_members_share_their_restaurants_subscription(self):
+        cook = Users.objects.create_user(email='cook@example.com', username='cook', phone='2', password='x')
+        self.assertFalse(subscriptions.has_active_subscription(cook.pk))
+        member = RestaurantMember.objects.create(restaurant=self.subscription.restaurant, user=cook)
+        self.assertTrue(subscriptions.has_active_subscription(cook.pk))
+        self.subscription.is_active = False
+        self.subscription.save()
+        self.assertFalse(subscriptions.has_active_subscription(cook.pk))
+        self.subscription.is_active = True
+        self.subscription.save()
+        self.assertTrue(subscriptions.has_active_subscription(cook.pk))
+        member.delete()
+        self.assertFalse(subscriptions.has_active_subscription(cook.pk))
+
+    def test_token_users_need_a_subscription_too(self):
+        client = APIClient()
+        client.credentials(HTTP_AUTHORIZATION=f"Bearer {ClaimsRefreshToken.for_user(self.owner).access_token}")
+        self.assertEqual(client.get('/api/auth/user/profile/').status_code, 200)
+        self.subscription.is_active = False
+        self.subscription.save()
+        refused = client.get('/api/auth/user/profile/')
+        self.assertEqual((refused.status_code, list(refused.json()['errors'])), (403, ['subscription']))
+        # Superusers are never shut out
+        self.owner.is_superuser = True
+        self.owner.save()
+        client.credentials(HTTP_AUTHORIZATION=f"Bearer {ClaimsRefreshToken.for_user(self.owner).access_token}")
+        self.assertEqual(client.get('/api/auth/user/profile/').status_code, 200)
+
+    @override_settings(SUBSCRIPTION_LOCAL_USERS=2)
+    def test_the_local_copy_keeps_only_recent_users(self):
+        for user_id in (101, 102, 103):
+            subscriptions.has_active_subscription(user_id)
+        self.assertEqual(list(subscriptions._local), [subscriptions.cache_key(102), subscriptions.cache_key(103)])
+        # An evicted user is answered from the shared cache, without a query
+        with CaptureQueriesContext(connection) as queries:
+            self.assertFalse(subscriptions.has_active_subscription(101))
+        self.assertEqual(len(queries), 0)
+
+
+
+class ClaimsAuthenticationTests(TestCase):
+    def setUp(self):
+        revocations.reset()
+        self.role = Role.objects.create(role_name="Chef", role_category='chef')
+        self.user = Users.objects.create_user(email='cook@example.com', username='cook', phone='1', password='x')
+        self.user.role = self.role
+        self.user.save()
+        RestaurantSubscription.objects.create(restaurant=Restaurant.objects.create(owner=self.user, name="Spice"))
+
+    def authenticate(self, token):
+        request = APIRequestFactory().get('/', HTTP_AUTHORIZATION=f"Bearer {token}")
+        return ClaimsJWTAuthentication().authenticate(request)[0]
+
+    def test_claims_answer_without_loading_the_user(self):
+        token = ClaimsRefreshToken.for_user(self.user).access_token
+        self.authenticate(token)
+        with CaptureQueriesContext(connection) as queries:
+            user = self.authenticate(token)
+            self.assertEqual((user.pk, user.role_category, user.is_staff, user.is_superuser),
+                             (str(self.user.pk), 'chef', False, False))
+        self.assertEqual(len(queries), 0)
+        with CaptureQueriesContext(connection) as queries:
+            self.assertEqual((user.email, user.role.role_name), ('cook@example.com', "Chef"))
+        self.assertEqual(len(queries), 1)
+
+    def test_tokens_without_claims_load_the_user(self):
+        user = self.authenticate(RefreshToken.for_user(self.user).access_token)
+        self.assertIsInstance(user, Users)
+        self.assertEqual(user.pk, self.user.pk)
+
+    def test_changed_claims_revoke_earlier_tokens(self):
+        def update(instance, **fields):
+            for name, value in fields.items():
+                setattr(instance, name, value)
+            instance.save()
+
+        changes = [
+            ('untracked', lambda: update(self.user, first_name="Ravi")),
+            ('is_staff', lambda: update(self.user, is_staff=True)),
+            ('role_category', lambda: update(Role.objects.get(pk=self.role.pk), role_category='waiter')),
+            ('role', lambda: update(self.user, role=None)),
+            ('is_active', lambda: update(self.user, is_active=False)),
+        ]
+        for name, change in changes:
+            with self.subTest(name):
+                tokens = [ClaimsRefreshToken.for_user(self.user).access_token, RefreshToken.for_user(self.user).access_token]
+                with self.captureOnCommitCallbacks(execute=True):
+                    change()
+                if name == 'untracked':
+                    self.assertFalse(TokenRevocation.objects.exists())
+                    self.assertEqual(self.authenticate(tokens[0]).pk, str(self.user.pk))
+                    continue
+                # Read from the database, as another process would
+                revocations.reset()
+                for token in tokens:
+                    with self.assertRaises(AuthenticationFailed):
+                        self.authenticate(token)
+        # Tokens issued after the revocation are accepted
+        TokenRevocation.objects.update(revoked_at=timezone.now() - timedelta(seconds=2))
+        revocations.reset()
+        update(self.user, is_active=True)
+        self.assertEqual(self.authenticate(ClaimsRefreshToken.for_user(self.user).access_token).pk, str(self.user.pk))
+
+class OtpDeliveryTests(TestCase):
+    def test_worker_sends_queued_emails_over_one_connection(self):
+        for n in range(3):
+            delivery.enqueue_otp('email', f"user{n}@example.com", f"12345{n}")
+        with mock.patch('apps.authentication.delivery.get_connection', wraps=delivery.get_connection) as connect:
+            self.assertEqual(delivery.run_worker(once=True), 3)
+        self.assertEqual(connect.call_count, 1)
+        self.assertEqual(sorted(m.to[0] for m in mail.outbox), ["user0@example.com", "user1@example.com", "user2@example.com"])
+        self.assertEqual(set(OtpDelivery.objects.values_list('status', 'otp', 'attempts')), {('sent', '', 1)})
+        self.assertEqual(delivery.metrics()['latency_ms']['samples'], 3)
+
+    @override_settings(FAST2SMS_API_KEY='key')
+    def test_failed_sms_is_retried_with_backoff_then_dropped(self):
+        job = delivery.enqueue_otp('sms', '9000000000', '654321')
+        with mock.patch('apps.authentication.delivery.send_mobial_otp', side_effect=requests.Timeout("gateway timed out")):
+            delivery.process_batch()
+            job.refresh_from_db()
+            self.assertEqual((job.status, job.attempts, job.otp), ('pending', 1, '654321'))
+            self.assertIn("gateway timed out", job.last_error)
+            self.assertGreater(job.next_attempt_at, timezone.now())
+            # Not due yet
+            self.assertEqual(delivery.process_batch(), 0)
+            OtpDelivery.objects.filter(id=job.id).update(next_attempt_at=timezone.now(),
+                                                         created_at=timezone.now() - timedelta(hours=1))
+            delivery.process_batch()
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.attempts, job.otp), ('failed', 2, ''))
+
+    def test_stale_claims_are_picked_up_again(self):
+        job = delivery.enqueue_otp('email', "user@example.com", "111111")
+        self.assertEqual(len(delivery.claim_batch()), 1)
+        self.assertEqual(delivery.claim_batch(), [])
+        OtpDelivery.objects.filter(id=job.id).update(claimed_at=timezone.now() - timedelta(hours=1))
+        self.assertEqual([j.id for j in delivery.claim_batch()], [job.id])
+
+
+class SelectiveHistoryTests(TestCase):
+    def setUp(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.user = Users.objects.create_user(email='cook@example.com', username='cook', phone='1', password='x')
+
+    def test_only_allow_listed_changes_are_recorded(self):
+        self.assertEqual(self.user.history.count(), 1)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.user.otp = 123456
+            self.user.save(update_fields=['otp'])
+            user = Users.objects.get(pk=self.user.pk)
+            user.otp, user.last_login = 654321, timezone.now()
+            user.save()
+            user.first_name = "Ravi"
+            user.save()
+        self.assertEqual([h.history_type for h in self.user.history.order_by('history_id')], ['+', '~'])
+        self.assertEqual(self.user.history.latest().first_name, "Ravi")
+
+    def test_rows_wait_for_commit_and_are_written_together(self):
+        with CaptureQueriesContext(connection) as captured, history_batch():
+            with self.captureOnCommitCallbacks(execute=True):
+                for n in range(3):
+                    self.user.first_name = f"Name {n}"
+                    self.user.save(update_fields=['first_name'])
+                try:
+                    with transaction.atomic():
+                        self.user.last_name = "Rolled back"
+                        self.user.save()
+                        raise RuntimeError
+                except RuntimeError:
+                    pass
+            self.assertEqual(self.user.history.count(), 1)
+        inserts = [q for q in captured.captured_queries if q['sql'].startswith('INSERT INTO "authentication_historicalusers"')]
+        self.assertEqual(len(inserts), 1)
+        self.assertEqual(list(self.user.history.order_by('history_id').values_list('first_name', 'last_name'))[1:],
+                         [("Name 0", None), ("Name 1", None), ("Name 2", None)])
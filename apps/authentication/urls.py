@@ -6,4 +6,5 @@ urlpatterns = [
     path('login/', LoginView.as_view(), name='login'), 
     path('user/profile/', UserProfileView.as_view(), name='user-profile'),
     path('user/profile/', get_user_profile, name='user-profile'),
+    path('otp/metrics/', otp_metrics, name='otp-metrics'),
 ]
\ No newline at end of file
@@ -2,7 +2,7 @@ import random
 from django.core.mail import send_mail
 import requests
 import json
-from core import settings
+from django.conf import settings
 
 def generate_otp(length=6):
     """
@@ -11,9 +11,10 @@ def generate_otp(length=6):
     otp = ''.join([str(random.randint(0, 9)) for _ in range(length)])
     return otp
 
-def send_otp_email(user_email, otp_code):
+def send_otp_email(user_email, otp_code, connection=None):
     """
-    Sends an OTP email to the user.
+    Sends an OTP email to the user. Pass an open mail connection to reuse
+    one SMTP session for several messages.
     """
     subject = "Your OTP Code"
     message = f"Your OTP code is {otp_code}"
@@ -26,34 +27,28 @@ def send_otp_email(user_email, otp_code):
         from_email,
         recipient_list,
         fail_silently=False,
+        connection=connection,
     )
 
 
-def send_mobial_otp(mobile, otp):
+def send_mobial_otp(mobile, otp, session=None):
+    """
+    Sends an OTP SMS through Fast2SMS. Raises requests.RequestException on
+    failure; pass a requests.Session to reuse its connection.
+    """
     url = "https://www.fast2sms.com/dev/bulkV2"
     payload = {
-        
-        "route" : "otp",
-        "variables_values" : "123456",
-        "numbers" : "9985462090",
-        # "route": "otp",
-        # "variables_values": otp,
-        # "numbers":mobile
+        "route": "otp",
+        "variables_values": otp,
+        "numbers": mobile,
     }
 
     headers = {
-        
-       "authorization":"LOZC9VFJiSaMe2DGE4uzkXngTqv07d1xwjh5BW3Uo86RysAtQNIw4OVfF57D6rySmh12sRLqYWdcl0ni",
-        # "authorization": settings.FAST2SMS_API_KEY, 
+        "authorization": settings.FAST2SMS_API_KEY,
         "Content-Type": "application/json"
     }
 
-    try:
-        response = requests.post(url, headers=headers, data=json.dumps(payload))
-        response.raise_for_status()
-        print(response.text)
-        return response.text
-    except requests.exceptions.RequestException as e:
-        print(f"Error: {e}")
-        return str(e)
-    
\ No newline at end of file
+    response = (session or requests).post(url, headers=headers, data=json.dumps(payload),
+                                          timeout=(settings.OTP_CONNECT_TIMEOUT, settings.OTP_SEND_TIMEOUT))
+    response.raise_for_status()
+    return response.text
@@ -5,9 +5,10 @@ import json
 from django.contrib.auth import authenticate,get_user_model
 from rest_framework.response import Response
 from rest_framework import status, generics
-from rest_framework_simplejwt.tokens import RefreshToken
+from apps.authentication.authentication import ClaimsRefreshToken
 from django.contrib.auth.hashers import make_password
 from apps.authentication.utils import *
+from apps.authentication.delivery import enqueue_otp, metrics as otp_delivery_metrics
 from .models import Users
 from .serializers import *
 from django.views.decorators.csrf import csrf_exempt
@@ -16,7 +17,7 @@ from rest_framework import generics, permissions
 from rest_framework_simplejwt.views import TokenObtainPairView
 # method apis 
 from rest_framework.decorators import api_view, permission_classes
-from rest_framework.permissions import IsAuthenticated
+from rest_framework.permissions import IsAdminUser, IsAuthenticated
 # from django.core.mail import send_mail
 
 from django.http import JsonResponse
@@ -58,7 +59,7 @@ class LoginView(generics.GenericAPIView):
 
         user = authenticate(email=email, password=password)
         if user:
-            refresh = RefreshToken.for_user(user)
+            refresh = ClaimsRefreshToken.for_user(user)
             return Response({
                 'refresh': str(refresh),
                 'access': str(refresh.access_token),
@@ -130,10 +131,9 @@ def send_otp(request,user_id):
         
             oUser = Users.objects.get(id=user_id)
             otp_code = generate_otp()
-            user_email = oUser.email
-            send_otp_email(user_email, otp_code)
             oUser.otp = otp_code
-            oUser.save()
+            oUser.save(update_fields=['otp'])
+            enqueue_otp('email', oUser.email, otp_code)
           
             return JsonResponse({"message": "OTP sent registered email!"}, status=200)
 
@@ -184,9 +184,9 @@ def request_password_reset(request):
     try:
         oUser = Users.objects.get(email=email)
         otp_code = generate_otp()
-        send_otp_email(oUser.email, otp_code)
         oUser.otp = otp_code
-        oUser.save()
+        oUser.save(update_fields=['otp'])
+        enqueue_otp('email', oUser.email, otp_code)
 
         return Response({"message": "OTP sent to your email."}, status=status.HTTP_200_OK)
 
@@ -246,12 +246,9 @@ def mobial_otp_request(request):
            
             otp_code = generate_otp()
             user.otp = otp_code
-            user.save()
-
-            print(otp_code)
-            
-            # send_mobial_otp(phone,otp_code)
-            return JsonResponse({"success": True,'message': 'OTP Sent. Register Phone number successfully!','user_id':user.Id}, status=status.HTTP_200_OK)
+            user.save(update_fields=['otp'])
+            enqueue_otp('sms', phone, otp_code)
+            return JsonResponse({"success": True,'message': 'OTP Sent. Register Phone number successfully!','user_id':user.id}, status=status.HTTP_200_OK)
         else:
             return JsonResponse({'error': 'User not found or inactive'}, status=status.HTTP_400_BAD_REQUEST)
 
@@ -267,7 +264,7 @@ def verify_mobial_otp(request):
             user = Users.objects.get(phone=phone_number, is_active=True)
             if user:
                 if user.otp == int(otp):
-                    refresh = RefreshToken.for_user(user)
+                    refresh = ClaimsRefreshToken.for_user(user)
                     return Response({
                         'refresh': str(refresh),
                         'access': str(refresh.access_token),
@@ -281,4 +278,11 @@ def verify_mobial_otp(request):
                 return JsonResponse({'error': 'User not found or inactive'}, status=status.HTTP_400_BAD_REQUEST)
 
         except Users.DoesNotExist:
-             return JsonResponse({'error': 'Phone number does not exist'}, status=status.HTTP_404_NOT_FOUND)
\ No newline at end of file
+             return JsonResponse({'error': 'Phone number does not exist'}, status=status.HTTP_404_NOT_FOUND)
+
+
+@api_view(['GET'])
+@permission_classes([IsAdminUser])
+def otp_metrics(request):
+    # Queue depth and delivery latency of the OTP queue, for monitoring
+    return Response({"message": "OTP delivery metrics", "data": otp_delivery_metrics()}, status=status.HTTP_200_OK)
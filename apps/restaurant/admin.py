@@ -1,44 +1,94 @@
 from django.contrib import admin
 from django.utils.html import format_html
 from apps.restaurant.models import *
+from apps.restaurant import tenancy
+from apps.restaurant.search import search_products
+
+ADMIN_SEARCH_LIMIT = 1000
+
+# ================== TENANT ADMIN =====================
+class TenantAdmin(admin.ModelAdmin):
+    # The admin works across restaurants; the default managers only see the request's catalog
+    def get_queryset(self, request):
+        qs = self.model.all_objects.get_queryset()
+        ordering = self.get_ordering(request)
+        return qs.order_by(*ordering) if ordering else qs
+
+    def formfield_for_foreignkey(self, db_field, request, **kwargs):
+        if hasattr(db_field.related_model, 'all_objects'):
+            kwargs.setdefault('queryset', db_field.related_model.all_objects.all())
+        return super().formfield_for_foreignkey(db_field, request, **kwargs)
+
+    def formfield_for_manytomany(self, db_field, request, **kwargs):
+        if hasattr(db_field.related_model, 'all_objects'):
+            kwargs.setdefault('queryset', db_field.related_model.all_objects.all())
+        return super().formfield_for_manytomany(db_field, request, **kwargs)
 
 # ================== PRODUCT ITEM ADMIN =====================
-class ProductItemAdmin(admin.ModelAdmin):
+class ProductItemAdmin(TenantAdmin):
     list_display = (
-        'id', 'name', 'main_category', 'sub_category', 'is_active',
+        'id', 'restaurant', 'name', 'main_category', 'sub_category', 'is_active',
         'is_available', 'stock_available', 'price', 'currency_symbol',
         'rating_avg', 'created_by'
     )
     list_filter = ('main_category', 'sub_category', 'is_active', 'is_available')
     search_fields = ('name', 'description')
-    readonly_fields = ('slug', 'rating_avg', 'created_at', 'updated_at')
+    readonly_fields = ('slug', 'rating_avg', 'rating_sum', 'rating_count', 'rating_1', 'rating_2',
+                       'rating_3', 'rating_4', 'rating_5', 'created_at', 'updated_at')
+
+    def get_search_results(self, request, queryset, search_term):
+        # Served by the product_search FTS index instead of LIKE '%..%' scans
+        if not search_term.strip():
+            return queryset, False
+        return queryset.filter(id__in=search_products(search_term, limit=ADMIN_SEARCH_LIMIT, active_only=False,
+                                                                 restaurant_id=tenancy.ALL)), False
 
 # ================== OFFER ADMIN =====================
-class OfferAdmin(admin.ModelAdmin):
-    list_display = ('id', 'name', 'offer_type', 'discount_value', 'active', 'start_date', 'end_date')
+class OfferAdmin(TenantAdmin):
+    list_display = ('id', 'restaurant', 'name', 'offer_type', 'discount_value', 'active', 'start_date', 'end_date')
     list_filter = ('offer_type', 'active')
     search_fields = ('name', 'description')
 
 # ================== PRODUCT REVIEW ADMIN =====================
-class ProductReviewAdmin(admin.ModelAdmin):
+class ProductReviewAdmin(TenantAdmin):
     list_display = ('id', 'product', 'rating', 'created_at')
     list_filter = ('rating',)
     search_fields = ('product__name',)
 
 # ================== CATEGORY ADMINS =====================
-class MainCategoryAdmin(admin.ModelAdmin):
-    list_display = ('id', 'name', 'is_active', 'display_order')
+class MainCategoryAdmin(TenantAdmin):
+    list_display = ('id', 'restaurant', 'name', 'is_active', 'display_order')
     list_filter = ('is_active',)
     search_fields = ('name',)
 
-class SubCategoryAdmin(admin.ModelAdmin):
+    def get_queryset(self, request):
+        return super().get_queryset(request).with_display_order()
+
+class SubCategoryAdmin(TenantAdmin):
     list_display = ('id', 'main_category', 'name', 'is_active', 'display_order')
     list_filter = ('main_category', 'is_active')
     search_fields = ('name',)
 
+    def get_queryset(self, request):
+        return super().get_queryset(request).with_display_order()
+
+# ================== ORDER ADMIN =====================
+class OrderItemInline(admin.TabularInline):
+    model = OrderItem
+    extra = 0
+    readonly_fields = ('product', 'name', 'quantity', 'unit_price', 'unit_discount', 'applied_offer',
+                       'tax_percentage', 'unit_tax', 'line_total', 'prepare_time')
+
+class OrderAdmin(admin.ModelAdmin):
+    list_display = ('id', 'placed_by', 'status', 'total', 'created_at')
+    list_filter = ('status',)
+    readonly_fields = ('subtotal', 'discount', 'tax', 'total', 'created_at', 'updated_at')
+    inlines = [OrderItemInline]
+
 # ================== REGISTER MODELS =====================
 admin.site.register(MainCategory, MainCategoryAdmin)
 admin.site.register(SubCategory, SubCategoryAdmin)
 admin.site.register(ProductItem, ProductItemAdmin)
 admin.site.register(Offer, OfferAdmin)
 admin.site.register(ProductReview, ProductReviewAdmin)
+admin.site.register(Order, OrderAdmin)
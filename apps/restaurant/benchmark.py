@@ -0,0 +1,403 @@
+"""
+Endpoint benchmarks: seeds a synthetic menu of a chosen size, times every
+route of the restaurant and authentication apps through the test client and
+compares latency and query counts against a stored baseline.
+
+Run it with `python manage.py benchmark_api`, which works on a throwaway
+test database. `python manage.py benchmark_orders` races concurrent order
+placements for a few products and checks that none were oversold.
+"""
+import io
+import json
+import random
+import statistics
+import threading
+import time
+from contextlib import ExitStack
+from datetime import timedelta
+from decimal import Decimal, ROUND_HALF_UP
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connections, transaction
+from django.test.utils import override_settings
+from django.urls import URLPattern, reverse
+from django.utils import timezone
+from rest_framework.test import APIClient
+from apps.authentication import subscriptions
+from apps.authentication.authentication import ClaimsRefreshToken, revocations
+from apps.authentication.models import Restaurant, RestaurantSubscription, Users
+from apps.authentication.urls import urlpatterns as authentication_urls
+from apps.restaurant.middleware.query_budget import QueryRecorder
+from apps.restaurant.models import CatalogVersion, MainCategory, SubCategory, ProductItem, Offer, ProductReview, OrderItem
+from apps.restaurant.orders import OrderRejected, place_order
+from apps.restaurant.ranking import rank_sequence
+from apps.restaurant.urls import urlpatterns as restaurant_urls
+
+DEFAULT_SHAPE = {'categories': 5, 'subcategories': 4, 'products': 10, 'offers': 20, 'reviews': 3}
+BENCHMARK_PASSWORD = 'benchmark-password'
+
+# ============================================================
+# SYNTHETIC MENU
+# ============================================================
+def seed_menu(categories=5, subcategories=4, products=10, offers=20, reviews=3, seed=0):
+    """
+    Creates categories x subcategories x products (per subcategory), a pool
+    of offers linked to random products, and reviews per product. Returns
+    the ids the route specs need.
+    """
+    rng = random.Random(seed)
+    now = timezone.now()
+    with transaction.atomic():
+        user = Users.objects.create_user(email='benchmark@example.com', username='benchmark', phone='0000000000',
+                                         password=BENCHMARK_PASSWORD)
+        # Staff, so kitchen and order status routes answer too
+        Users.objects.filter(pk=user.pk).update(is_staff=True)
+        user.is_staff = True
+        # With a subscription, or every route would answer 403
+        RestaurantSubscription.objects.create(restaurant=Restaurant.objects.create(owner=user, name="Benchmark Restaurant"))
+        mains = MainCategory.objects.bulk_create([
+            MainCategory(name=f"Category {c}", rank=key) for c, key in enumerate(rank_sequence(categories))
+        ])
+        subs = SubCategory.objects.bulk_create([
+            SubCategory(main_category=main, name=f"Sub {main.id}-{s}", rank=key)
+            for main in mains for s, key in enumerate(rank_sequence(subcategories))
+        ])
+        items = ProductItem.objects.bulk_create([
+            ProductItem(main_category_id=sub.main_category_id, sub_category=sub, name=f"Dish {sub.id}-{p}",
+                        slug=f"dish-{sub.id}-{p}", rank=key, price=Decimal(rng.randint(50, 2000)) / 10,
+                        tax_percentage=Decimal('5.00'), prepare_time=rng.randint(5, 40),
+                        stock_available=rng.randint(0, 100), created_by=user)
+            for sub in subs for p, key in enumerate(rank_sequence(products))
+        ])
+        pool = Offer.objects.bulk_create([
+            Offer(name=f"Offer {o}", offer_type=rng.choice(['flat', 'percent']), discount_value=rng.randint(1, 20),
+                  start_date=now - timedelta(days=1), end_date=now + timedelta(days=rng.randint(1, 30)))
+            for o in range(offers)
+        ])
+        if pool:
+            ProductItem.offers.through.objects.bulk_create([
+                ProductItem.offers.through(productitem_id=item.id, offer_id=offer.id)
+                for item in items for offer in rng.sample(pool, min(len(pool), rng.randint(0, 2)))
+            ])
+        rows = [ProductReview(product=item, rating=rng.randint(1, 5)) for item in items for _ in range(reviews)]
+        ProductReview.objects.bulk_create(rows)
+        # bulk_create skips ProductReview.save(), so fill the counters directly
+        for i, item in enumerate(items):
+            for row in rows[i * reviews:(i + 1) * reviews]:
+                setattr(item, f"rating_{row.rating}", getattr(item, f"rating_{row.rating}") + 1)
+                item.rating_sum += row.rating
+                item.rating_count += 1
+            if item.rating_count:
+                item.rating_avg = (Decimal(item.rating_sum) / item.rating_count).quantize(Decimal('0.1'), ROUND_HALF_UP)
+        ProductItem.objects.bulk_update(items, ['rating_avg', 'rating_sum', 'rating_count',
+                                                'rating_1', 'rating_2', 'rating_3', 'rating_4', 'rating_5'])
+        CatalogVersion.bump()
+    return {
+        'user': user,
+        'main': mains[0].id,
+        'sub': subs[0].id if subs else None,
+        'product': items[0].id if items else None,
+        'offer': pool[0].id if pool else None,
+        'review': rows[0].id if rows else None,
+    }
+
+# ============================================================
+# ROUTE SPECS
+# ============================================================
+# Each spec: (url name, method) -> (kwargs(fixtures, n), data(fixtures, n), format).
+# kwargs/data run outside the timed section, so they may create rows to delete.
+def victim(model, **values):
+    return lambda fx, n: {'id': model.objects.create(**{k: v(n) if callable(v) else v for k, v in values.items()}).id}
+
+def reordered(model, n, **scope):
+    # Read at request time: other routes add and remove siblings
+    ids = list(model.objects.filter(**scope).values_list('id', flat=True))
+    return ids[::-1] if n % 2 else ids
+
+def cart(fx, n):
+    # Keep the benchmark product in stock however many iterations run
+    ProductItem.objects.filter(id=fx['product']).update(stock_available=1000, is_active=True, is_available=True)
+    return {'items': [{'product': fx['product'], 'quantity': n % 3 + 1}], 'notes': f"Order {n}"}
+
+def import_file(fx, n):
+    body = "name,main_category,sub_category,price\n" + "".join(
+        f"Imported {n}-{i},Category 0,Imported,{i + 1}.00\n" for i in range(20))
+    upload = io.BytesIO(body.encode())
+    upload.name = 'menu.csv'
+    return {'file': upload}
+
+def settlement_file(fx, n):
+    # Ten transactions arrive pending, then settle, then the settled file is replayed
+    restaurant, _ = Restaurant.objects.get_or_create(owner=fx['user'], name="Benchmark Restaurant")
+    status_ = 'pending' if n % 3 == 0 else 'success'
+    lines = ['transaction_id,restaurant,amount,status'] + [f"bench-{n // 3}-{i},{restaurant.id},499.00,{status_}" for i in range(10)]
+    upload = io.BytesIO('\n'.join(lines).encode())
+    upload.name = 'settlement.csv'
+    return {'file': upload}
+
+ROUTES = {
+    # ---------------- restaurant ----------------
+    ('product-choices', 'GET'): (None, None, None),
+    ('menu_snapshot', 'GET'): (None, None, None),
+    ('product_search', 'GET'): (None, lambda fx, n: {'q': ['dish', 'cat', 'sub 1', 'dish 2'][n % 4]}, None),
+    ('product_items_list_create', 'GET'): (None, None, None),
+    ('product_items_list_create', 'POST'): (None, lambda fx, n: {'main_category': fx['main'], 'sub_category': fx['sub'],
+                                                                  'name': f"Created {n}", 'price': '5.00'}, 'multipart'),
+    ('product_item_facets', 'GET'): (None, lambda fx, n: [{}, {'variant_type': 'Veg,Vegan'}, {'has_offer': 'true', 'max_price': '100'}][n % 3], None),
+    ('product_item_detail', 'GET'): (lambda fx, n: {'id': fx['product']}, None, None),
+    ('product_item_update', 'PUT'): (lambda fx, n: {'id': fx['product']}, lambda fx, n: {'description': f"Updated {n}"}, 'multipart'),
+    ('product_item_delete', 'DELETE'): (lambda fx, n: {'id': ProductItem.objects.create(
+        main_category_id=fx['main'], name=f"Victim {n}", price=1).id}, None, None),
+    ('product_item_reorder', 'PUT'): (None, lambda fx, n: {'main_category': fx['main'], 'sub_category': fx['sub'],
+                                                          'ids': reordered(ProductItem, n, main_category_id=fx['main'], sub_category_id=fx['sub'])}, 'json'),
+    ('product_items_import', 'POST'): (None, import_file, 'multipart'),
+    ('main_category_list_create', 'GET'): (None, None, None),
+    ('main_category_list_create', 'POST'): (None, lambda fx, n: {'name': f"Created category {n}"}, 'json'),
+    ('main_category_detail', 'GET'): (lambda fx, n: {'id': fx['main']}, None, None),
+    ('main_category_update', 'PUT'): (lambda fx, n: {'id': fx['main']}, lambda fx, n: {'description': f"Updated {n}"}, 'json'),
+    ('main_category_delete', 'DELETE'): (victim(MainCategory, name=lambda n: f"Victim category {n}"), None, None),
+    ('main_category_reorder', 'PUT'): (None, lambda fx, n: {'ids': reordered(MainCategory, n)}, 'json'),
+    ('sub_category_list_create', 'GET'): (None, None, None),
+    ('sub_category_list_create', 'POST'): (None, lambda fx, n: {'main_category': fx['main'], 'name': f"Created sub {n}"}, 'json'),
+    ('sub_category_detail', 'GET'): (lambda fx, n: {'id': fx['sub']}, None, None),
+    ('sub_category_update', 'PUT'): (lambda fx, n: {'id': fx['sub']}, lambda fx, n: {'description': f"Updated {n}"}, 'json'),
+    ('sub_category_delete', 'DELETE'): (lambda fx, n: {'id': SubCategory.objects.create(
+        main_category_id=fx['main'], name=f"Victim sub {n}").id}, None, None),
+    ('sub_category_reorder', 'PUT'): (None, lambda fx, n: {'main_category': fx['main'],
+                                                          'ids': reordered(SubCategory, n, main_category_id=fx['main'])}, 'json'),
+    ('offer_list_create', 'GET'): (None, None, None),
+    ('offer_list_create', 'POST'): (None, lambda fx, n: {'name': f"Created offer {n}", 'discount_value': '1.00'}, 'json'),
+    ('offer_detail', 'GET'): (lambda fx, n: {'id': fx['offer']}, None, None),
+    ('offer_update', 'PUT'): (lambda fx, n: {'id': fx['offer']}, lambda fx, n: {'description': f"Updated {n}"}, 'json'),
+    ('offer_delete', 'DELETE'): (victim(Offer, name=lambda n: f"Victim offer {n}", discount_value=1), None, None),
+    ('product_review_list_create', 'GET'): (None, None, None),
+    ('product_review_list_create', 'POST'): (None, lambda fx, n: {'product': fx['product'], 'rating': n % 5 + 1}, 'json'),
+    ('product_review_detail', 'GET'): (lambda fx, n: {'id': fx['review']}, None, None),
+    ('product_review_delete', 'DELETE'): (lambda fx, n: {'id': ProductReview.objects.create(
+        product_id=fx['product'], rating=n % 5 + 1).id}, None, None),
+    ('order_list_create', 'GET'): (None, None, None),
+    ('order_list_create', 'POST'): (None, cart, 'json'),
+    ('order_update', 'PUT'): (lambda fx, n: {'id': place_order(fx['user'], cart(fx, n)['items']).id}, lambda fx, n: {'status': 'preparing'}, 'json'),
+    ('kitchen_queue', 'GET'): (None, None, None),
+    ('payment_settlements_import', 'POST'): (None, settlement_file, 'multipart'),
+    ('sales_report', 'GET'): (None, lambda fx, n: {'granularity': ['day', 'hour'][n % 2]}, None),
+    ('payment_report', 'GET'): (None, lambda fx, n: {'granularity': ['day', 'hour'][n % 2], 'status': 'success'}, None),
+    ('order_detail', 'GET'): (lambda fx, n: {'id': place_order(fx['user'], cart(fx, n)['items']).id}, None, None),
+    # ---------------- authentication ----------------
+    ('register', 'POST'): (None, lambda fx, n: {'username': f"bench{n}", 'email': f"bench{n}@example.com",
+                                               'phone': f"9{n:09d}", 'password': 'secret-pass', 'role_id': 0}, 'json'),
+    ('login', 'POST'): (None, lambda fx, n: {'email': fx['user'].email, 'password': BENCHMARK_PASSWORD}, 'json'),
+    ('user-profile', 'GET'): (None, None, None),
+    ('user-profile', 'PUT'): (None, lambda fx, n: {'city': f"City {n}"}, 'multipart'),
+    ('user-profile', 'PATCH'): (None, lambda fx, n: {'state': f"State {n}"}, 'json'),
+    ('otp-metrics', 'GET'): (None, None, None),
+}
+
+
+# Responses that never end on their own (Server-Sent Events); tests drive them through the ASGI handler
+STREAMING = {'kitchen_stream'}
+
+
+def view_methods(pattern):
+    # Methods the view answers, from its class (DRF and class-based views); plain functions are GET-only
+    view = getattr(pattern.callback, 'view_class', None)
+    if view is None:
+        return ['GET']
+    return [m.upper() for m in view.http_method_names if m not in ('head', 'options') and hasattr(view, m)]
+
+
+def route_keys():
+    keys, seen = [], set()
+    for pattern in (*restaurant_urls, *authentication_urls):
+        # A later pattern with a name already seen is shadowed by the first one
+        if isinstance(pattern, URLPattern) and pattern.name and pattern.name not in seen and pattern.name not in STREAMING:
+            seen.add(pattern.name)
+            keys.extend((pattern.name, method) for method in view_methods(pattern))
+    return keys
+
+
+def route_label(key):
+    return f"{key[0]} {key[1]}"
+
+# ============================================================
+# RUNNER
+# ============================================================
+def percentile(samples, pct):
+    ordered = sorted(samples)
+    index = (len(ordered) - 1) * pct / 100
+    low = int(index)
+    high = min(low + 1, len(ordered) - 1)
+    return ordered[low] + (ordered[high] - ordered[low]) * (index - low)
+
+
+def time_route(client, key, fixtures, iterations):
+    name, method = key
+    kwargs, data, fmt = ROUTES[key]
+    samples, queries, statuses = [], [], set()
+    for n in range(iterations):
+        url = reverse(name, kwargs=kwargs(fixtures, n) if kwargs else None)
+        payload = data(fixtures, n) if data else None
+        extra = {'data': payload, 'format': fmt} if payload is not None else {}
+        recorder = QueryRecorder(threshold=settings.QUERY_REPEAT_THRESHOLD)
+        with ExitStack() as stack:
+            # Reads may be routed to the read connection; count on every connection
+            for c in connections.all():
+                stack.enter_context(c.execute_wrapper(recorder))
+            started = time.perf_counter()
+            response = getattr(client, method.lower())(url, **extra)
+            samples.append((time.perf_counter() - started) * 1000)
+        queries.append(recorder.count)
+        statuses.add(response.status_code)
+    return {
+        'route': name,
+        'method': method,
+        'status': sorted(statuses),
+        'p50_ms': round(percentile(samples, 50), 3),
+        'p90_ms': round(percentile(samples, 90), 3),
+        'p99_ms': round(percentile(samples, 99), 3),
+        'mean_ms': round(statistics.fmean(samples), 3),
+        'queries': max(queries),
+    }
+
+
+def run_benchmark(shape=None, iterations=20, seed=0):
+    """
+    Seeds the current database and returns
+    {'shape': ..., 'iterations': n, 'routes': {"name METHOD": stats}, 'missing': [...]}.
+    """
+    shape = {**DEFAULT_SHAPE, **(shape or {})}
+    cache.clear()
+    fixtures = seed_menu(seed=seed, **shape)
+    # Resolved once per user, then cached; the first route should not pay for it
+    subscriptions.has_active_subscription(fixtures['user'].pk)
+    client = APIClient()
+    client.credentials(HTTP_AUTHORIZATION=f"Bearer {ClaimsRefreshToken.for_user(fixtures['user']).access_token}")
+    keys = route_keys()
+    # The token revocation list is reloaded once per TOKEN_REVOCATION_REFRESH, not per request;
+    # load it up front so the reload does not land on whichever route is running when it falls due
+    with override_settings(TOKEN_REVOCATION_REFRESH=float('inf')):
+        revocations.reset()
+        revocations.revoked_at(fixtures['user'].pk)
+        routes = {route_label(key): time_route(client, key, fixtures, iterations) for key in keys if key in ROUTES}
+    return {
+        'shape': shape,
+        'iterations': iterations,
+        'routes': routes,
+        'missing': [route_label(key) for key in keys if key not in ROUTES],
+    }
+
+
+def compare(results, baseline, tolerance=0.5, min_delta_ms=2.0):
+    """
+    Returns a list of regressions: routes that run more queries than the
+    baseline, or whose p50 grew by more than tolerance and min_delta_ms.
+    """
+    regressions = []
+    for name, stats in results['routes'].items():
+        base = baseline.get('routes', {}).get(name)
+        if base is None:
+            continue
+        if stats['queries'] > base['queries']:
+            regressions.append(f"{name}: {stats['queries']} queries (baseline {base['queries']})")
+        delta = stats['p50_ms'] - base['p50_ms']
+        if delta > min_delta_ms and stats['p50_ms'] > base['p50_ms'] * (1 + tolerance):
+            regressions.append(f"{name}: p50 {stats['p50_ms']}ms (baseline {base['p50_ms']}ms)")
+    return regressions
+
+
+def load_baseline(path):
+    try:
+        with open(path) as fh:
+            return json.load(fh)
+    except FileNotFoundError:
+        return None
+
+# ============================================================
+# ORDER CONTENTION
+# ============================================================
+def run_order_contention(threads=8, orders=50, products=3, stock=100, seed=0, readers=0):
+    """
+    Starts threads that each try to place orders (random carts over the
+    same few products) against limited stock, at the same time, while
+    readers threads keep listing the menu. Returns counts, latencies and
+    the stock check: sold == initial stock - remaining stock, and
+    remaining >= 0. Needs a database that separate connections can share
+    (not :memory:).
+    """
+    fixtures = seed_menu(categories=1, subcategories=1, products=products, offers=2, reviews=0, seed=seed)
+    ids = list(ProductItem.objects.order_by('id').values_list('id', flat=True))
+    ProductItem.objects.filter(id__in=ids).update(stock_available=stock, max_order_quantity=stock, is_active=True, is_available=True)
+    user = fixtures['user']
+    start, done = threading.Barrier(threads + readers), threading.Event()
+    outcomes = {'placed': 0, 'rejected': 0, 'errors': []}
+    samples, read_samples, lock = [], [], threading.Lock()
+
+    def worker(index):
+        rng = random.Random(seed * 1000 + index)
+        try:
+            start.wait()
+            for _ in range(orders):
+                lines = [{'product': pid, 'quantity': rng.randint(1, 3)} for pid in rng.sample(ids, rng.randint(1, len(ids)))]
+                started = time.perf_counter()
+                try:
+                    place_order(user, lines)
+                    outcome = 'placed'
+                except OrderRejected:
+                    outcome = 'rejected'
+                except Exception as e:
+                    outcome = f"{type(e).__name__}: {e}"
+                elapsed = (time.perf_counter() - started) * 1000
+                with lock:
+                    samples.append(elapsed)
+                    if outcome in ('placed', 'rejected'):
+                        outcomes[outcome] += 1
+                    else:
+                        outcomes['errors'].append(outcome)
+        finally:
+            connections.close_all()
+
+    def reader():
+        try:
+            start.wait()
+            while not done.is_set():
+                started = time.perf_counter()
+                try:
+                    list(ProductItem.objects.filter(is_active=True).order_by('rank', 'id').values('id', 'name', 'price', 'stock_available'))
+                except Exception as e:
+                    with lock:
+                        outcomes['errors'].append(f"read {type(e).__name__}: {e}")
+                    continue
+                with lock:
+                    read_samples.append((time.perf_counter() - started) * 1000)
+        finally:
+            connections.close_all()
+
+    started = time.perf_counter()
+    pool = [threading.Thread(target=worker, args=(i,)) for i in range(threads)]
+    watchers = [threading.Thread(target=reader) for _ in range(readers)]
+    for thread in pool + watchers:
+        thread.start()
+    for thread in pool:
+        thread.join()
+    elapsed = time.perf_counter() - started
+    done.set()
+    for thread in watchers:
+        thread.join()
+
+    remaining = dict(ProductItem.objects.filter(id__in=ids).values_list('id', 'stock_available'))
+    sold = {pid: 0 for pid in ids}
+    for pid, quantity in OrderItem.objects.filter(product_id__in=ids).values_list('product_id', 'quantity'):
+        sold[pid] += quantity
+    return {
+        'threads': threads,
+        'attempts': threads * orders,
+        'placed': outcomes['placed'],
+        'rejected': outcomes['rejected'],
+        'errors': outcomes['errors'],
+        'orders_per_s': round(outcomes['placed'] / elapsed, 1) if elapsed else None,
+        'p50_ms': round(percentile(samples, 50), 3) if samples else None,
+        'p99_ms': round(percentile(samples, 99), 3) if samples else None,
+        'reads_per_s': round(len(read_samples) / elapsed, 1) if readers and elapsed else None,
+        'read_p99_ms': round(percentile(read_samples, 99), 3) if read_samples else None,
+        'oversold': {pid: sold[pid] - stock for pid in ids if sold[pid] + remaining[pid] != stock or remaining[pid] < 0},
+    }
@@ -0,0 +1,37 @@
+"""
+Counts the writes one save fans out into: category status pushed down to
+sub categories and products, and search index rebuilds for a category.
+
+totals holds per-process counts for the benchmark and tests. collect()
+gathers the cascades run inside one request, for the query report.
+"""
+import threading
+from collections import Counter
+from contextlib import contextmanager
+from asgiref.local import Local
+
+totals = Counter()
+_lock = threading.Lock()
+_current = Local()
+
+
+def record(name, rows=0):
+    with _lock:
+        totals[name] += 1
+        totals[f"{name}.rows"] += rows
+    counts = getattr(_current, 'counts', None)
+    if counts is not None:
+        counts[name] += 1
+        counts[f"{name}.rows"] += rows
+
+
+@contextmanager
+def collect():
+    outer = getattr(_current, 'counts', None)
+    _current.counts = counts = Counter()
+    try:
+        yield counts
+    finally:
+        _current.counts = outer
+        if outer is not None:
+            outer.update(counts)
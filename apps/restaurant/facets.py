@@ -0,0 +1,113 @@
+"""
+Product filters and facet counts for the menu filter sidebar.
+
+Each facet is counted with every filter applied except its own, so picking
+"Veg" still shows how many "Vegan" items there are. All counts come from one
+query grouped by sub category and "has a running offer": every other facet
+value is a conditional COUNT column, summed over the groups here.
+"""
+from functools import reduce
+from operator import and_
+from django.db.models import BooleanField, Count, ExpressionWrapper, Max, Min, Q
+from django.utils import timezone
+from apps.restaurant.models import Offer, ProductItem, VARIANT_CHOICES
+
+def running_offer():
+    """
+    Q for products with an active offer whose window contains now (the
+    PriceBook rule). Not correlated, so the database evaluates it once per
+    query however many facet columns repeat it.
+    """
+    now = timezone.now()
+    running = Offer.objects.filter(Q(end_date__isnull=True) | Q(end_date__gt=now), active=True, start_date__lte=now)
+    return Q(id__in=ProductItem.offers.through.objects.filter(offer__in=running).values('productitem_id'))
+
+
+def conditions(filters):
+    """
+    Maps validated ProductFilterSerializer data to {facet: Q}. main_category
+    narrows the scope and is not a facet.
+    """
+    conds = {}
+    if filters.get('main_category'):
+        conds['main_category'] = Q(main_category_id=filters['main_category'])
+    if filters.get('variant_type'):
+        conds['variant_type'] = Q(variant_type__in=filters['variant_type'])
+    if filters.get('sub_category'):
+        conds['sub_category'] = Q(sub_category_id__in=filters['sub_category'])
+    price = {}
+    if filters.get('min_price') is not None:
+        price['price__gte'] = filters['min_price']
+    if filters.get('max_price') is not None:
+        price['price__lte'] = filters['max_price']
+    if price:
+        conds['price'] = Q(**price)
+    for flag in ('is_available', 'is_active'):
+        if flag in filters:
+            conds[flag] = Q(**{flag: filters[flag]})
+    if 'has_offer' in filters:
+        conds['has_offer'] = running_offer() if filters['has_offer'] else ~running_offer()
+    return conds
+
+
+def filter_products(qs, filters):
+    conds = conditions(filters)
+    return qs.filter(*conds.values()) if conds else qs
+
+
+def combined(conds, *extra, without=None):
+    parts = [q for facet, q in conds.items() if facet != without] + list(extra)
+    return reduce(and_, parts) if parts else None
+
+
+def facet_counts(filters, qs=None):
+    """
+    Returns {'count': n, 'facets': {...}} for the products matching filters.
+    """
+    conds = conditions(filters)
+    scope = conds.pop('main_category', None)
+    # has_offer is a grouping key rather than a COUNT filter, so its subquery runs once
+    wanted = filters.get('has_offer')
+    conds.pop('has_offer', None)
+    qs = ProductItem.objects.all() if qs is None else qs
+    if scope is not None:
+        qs = qs.filter(scope)
+    columns = {
+        'matched': Count('id', filter=combined(conds)),
+        'in_sub': Count('id', filter=combined(conds, without='sub_category')),
+        'price_min': Min('price', filter=combined(conds, without='price')),
+        'price_max': Max('price', filter=combined(conds, without='price')),
+    }
+    for value, _ in VARIANT_CHOICES:
+        columns[f"variant_type:{value}"] = Count('id', filter=combined(conds, Q(variant_type=value), without='variant_type'))
+    for flag in ('is_available', 'is_active'):
+        columns[f"{flag}:true"] = Count('id', filter=combined(conds, Q(**{flag: True}), without=flag))
+        columns[f"{flag}:false"] = Count('id', filter=combined(conds, Q(**{flag: False}), without=flag))
+    groups = list(qs.order_by()
+                  .annotate(offer_running=ExpressionWrapper(running_offer(), output_field=BooleanField()))
+                  .values('sub_category_id', 'sub_category__name', 'sub_category__rank', 'offer_running')
+                  .annotate(**columns))
+    selected = [g for g in groups if wanted is None or bool(g['offer_running']) == wanted]
+
+    def total(column, rows=selected):
+        return sum(group[column] for group in rows)
+
+    subs = {}
+    for group in selected:
+        if group['in_sub']:
+            sub = subs.setdefault(group['sub_category_id'], {'value': group['sub_category_id'], 'label': group['sub_category__name'],
+                                                            'count': 0, 'rank': group['sub_category__rank'] or ''})
+            sub['count'] += group['in_sub']
+    prices_min = [g['price_min'] for g in selected if g['price_min'] is not None]
+    prices_max = [g['price_max'] for g in selected if g['price_max'] is not None]
+    return {
+        'count': total('matched'),
+        'facets': {
+            'variant_type': [{'value': value, 'label': label, 'count': total(f"variant_type:{value}")} for value, label in VARIANT_CHOICES],
+            'sub_category': [{k: sub[k] for k in ('value', 'label', 'count')}
+                             for sub in sorted(subs.values(), key=lambda s: (s['value'] is None, s['rank'], s['value'] or 0))],
+            'price': {'min': f"{min(prices_min):.2f}" if prices_min else None, 'max': f"{max(prices_max):.2f}" if prices_max else None},
+            **{flag: [{'value': v, 'count': total(f"{flag}:{str(v).lower()}")} for v in (True, False)] for flag in ('is_available', 'is_active')},
+            'has_offer': [{'value': v, 'count': total('matched', [g for g in groups if bool(g['offer_running']) == v])} for v in (True, False)],
+        },
+    }
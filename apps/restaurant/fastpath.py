@@ -0,0 +1,250 @@
+"""
+Read-only fast path for catalog list endpoints.
+
+Renders the same JSON bytes as SerializerClass(qs, many=True) + JSONRenderer
+without building model instances: rows come from .values(), each serializer
+field is compiled once into a converter, media URLs share one absolute
+prefix per request and the result is encoded with orjson when available.
+
+A serializer opts in by defining row_<name>(row, ctx) for each of its
+SerializerMethodFields; field_sources lists the columns those read.
+"""
+import threading
+from collections import OrderedDict
+from django.core.files.storage import default_storage
+from django.http import HttpResponse
+from django.utils.encoding import iri_to_uri
+from rest_framework import fields as drf_fields, relations, serializers
+from rest_framework.renderers import JSONRenderer
+from apps.restaurant.models import RankedModel
+from apps.restaurant.pagination import keyset_page, wants_page
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover - optional dependency
+    orjson = None
+
+# Serializer fields whose to_representation returns database values unchanged
+PASSTHROUGH = (drf_fields.CharField, drf_fields.IntegerField, drf_fields.BooleanField,
+               drf_fields.ReadOnlyField, relations.PrimaryKeyRelatedField)
+# Annotations standing in for model properties
+ANNOTATED = {'display_order': 'position'}
+# Python's json switches to exponent notation outside this range and orjson writes it differently
+PLAIN_FLOAT = (1e-4, 1e16)
+
+# Compiled plans, least recently used first. Keys are subsets of a serializer's fields, so a
+# client cycling through ?fields= combinations could still make many; only the recent ones are kept
+PLAN_CACHE_SIZE = 256
+_plans = OrderedDict()
+_plans_lock = threading.Lock()
+_declared = {}
+_supported = {}
+
+
+def float_value(value, ctx):
+    if value and not PLAIN_FLOAT[0] <= abs(value) < PLAIN_FLOAT[1]:
+        ctx.exact_floats = False
+    return value
+
+
+class RowContext:
+    """
+    Per-request state for row converters: the absolute media URL prefix,
+    computed once, and whatever the serializer context carries.
+    """
+
+    def __init__(self, context):
+        self.context = context
+        request = context.get('request')
+        self.request = request
+        self.host = request.build_absolute_uri('/')[:-1] if request else None
+        self.exact_floats = True
+
+    def media_url(self, name):
+        url = default_storage.url(name)
+        if self.request is None:
+            return url
+        if url.startswith('/') and not url.startswith('//') and '/./' not in url and '/../' not in url:
+            return iri_to_uri(self.host + url)
+        return self.request.build_absolute_uri(url)
+
+
+class RowPlan:
+    """
+    Compiled form of a serializer: the columns to select and, per output
+    field, (name, column, convert). convert(value, ctx) is skipped for None;
+    method fields have no column and get convert(row, ctx).
+    """
+
+    def __init__(self, serializer_class, fields):
+        # fields: the names to render, as returned by plan_fields(); None for all
+        serializer = serializer_class()
+        model = serializer_class.Meta.model
+        self.model = model
+        self.columns = ['id']
+        self.converters = []
+        self.many = []
+        for name, field in serializer.fields.items():
+            if field.write_only or (fields is not None and name not in fields):
+                continue
+            if isinstance(field, serializers.SerializerMethodField):
+                self.add_columns(serializer_class.field_sources.get(name, []))
+                self.converters.append((name, None, getattr(serializer_class, f"row_{name}")))
+            elif isinstance(field, relations.ManyRelatedField):
+                self.many.append((name, field.source))
+                self.converters.append((name, name, None))
+            elif name in ANNOTATED and issubclass(model, RankedModel):
+                self.converters.append((name, ANNOTATED[name], None))
+            else:
+                column = '__'.join(field.source_attrs)
+                self.add_columns([column])
+                self.converters.append((name, column, self.converter(field)))
+        if issubclass(model, RankedModel):
+            self.add_columns(['rank', *model.rank_scope])
+
+    @staticmethod
+    def converter(field):
+        if isinstance(field, drf_fields.FileField):
+            return lambda value, ctx: ctx.media_url(value) if value else None
+        if isinstance(field, drf_fields.FloatField):
+            return float_value
+        if isinstance(field, PASSTHROUGH) and not isinstance(field, drf_fields.ChoiceField):
+            return None
+        to_representation = field.to_representation
+        return lambda value, ctx: to_representation(value)
+
+    def add_columns(self, columns):
+        for column in columns:
+            if column not in self.columns:
+                self.columns.append(column)
+
+    def load_many(self, rows):
+        # Same query shape as prefetch_related, so ids come back in the same order
+        ids = [row['id'] for row in rows]
+        for name, source in self.many:
+            related = self.model._meta.get_field(source)
+            remote = related.remote_field.name
+            groups = {}
+            for owner, pk in related.related_model.objects.filter(**{f"{remote}__in": ids}).values_list(f"{remote}__id", 'id'):
+                groups.setdefault(owner, []).append(pk)
+            for row in rows:
+                row[name] = groups.get(row['id'], [])
+
+    def render_rows(self, rows, ctx):
+        if self.many:
+            self.load_many(rows)
+        out = []
+        for row in rows:
+            item = {}
+            for name, column, convert in self.converters:
+                if column is None:
+                    item[name] = convert(row, ctx)
+                else:
+                    value = row[column]
+                    item[name] = value if value is None or convert is None else convert(value, ctx)
+            out.append(item)
+        return out
+
+
+def plan_fields(serializer_class, fields):
+    """
+    The serializer fields a ?fields= list selects, in declaration order, as
+    SparseFieldsMixin renders them: unknown names are dropped and an empty
+    list means all fields (None).
+    """
+    if not fields:
+        return None
+    declared = _declared.get(serializer_class)
+    if declared is None:
+        declared = _declared[serializer_class] = tuple(serializer_class().fields)
+    wanted = set(fields)
+    return tuple(name for name in declared if name in wanted)
+
+
+def get_plan(serializer_class, fields=None):
+    key = (serializer_class, plan_fields(serializer_class, fields))
+    with _plans_lock:
+        plan = _plans.get(key)
+        if plan is not None:
+            _plans.move_to_end(key)
+            return plan
+    plan = RowPlan(serializer_class, key[1])
+    with _plans_lock:
+        _plans[key] = plan
+        while len(_plans) > PLAN_CACHE_SIZE:
+            _plans.popitem(last=False)
+    return plan
+
+
+def applies(request, serializer_class):
+    """
+    True when the response would be rendered as JSON by a serializer that
+    provides row_ versions of all its method fields.
+    """
+    if not isinstance(getattr(request, 'accepted_renderer', None), JSONRenderer):
+        return False
+    supported = _supported.get(serializer_class)
+    if supported is None:
+        supported = _supported[serializer_class] = hasattr(serializer_class, 'field_sources') and all(
+            hasattr(serializer_class, f"row_{name}") for name, field in serializer_class().fields.items()
+            if isinstance(field, serializers.SerializerMethodField))
+    return supported
+
+
+def values_rows(plan, qs, ranked, keys=()):
+    columns = list(plan.columns)
+    for key in keys:
+        if key.lstrip('-') not in columns:
+            columns.append(key.lstrip('-'))
+    qs = qs.prefetch_related(None)
+    if ranked:
+        return qs.with_display_order().values(*columns, 'position')
+    return qs.values(*columns)
+
+
+def assign_row_positions(model, rows, sparse=False):
+    # Reuses RankedModel.assign_positions on id/rank/scope-only instances
+    shells = [model(id=row['id'], rank=row['rank'], **{f: row[f] for f in model.rank_scope}) for row in rows]
+    (model.assign_sparse_positions if sparse else model.assign_positions)(shells)
+    for row, shell in zip(rows, shells):
+        row['position'] = shell.position
+
+
+def render_json(data, exact_floats=True):
+    """
+    Encodes like DRF's JSONRenderer (compact, UTF-8, U+2028/U+2029 escaped).
+    """
+    if orjson is None or not exact_floats:
+        return JSONRenderer().render(data)
+    return orjson.dumps(data).replace(b'\xe2\x80\xa8', b'\\u2028').replace(b'\xe2\x80\xa9', b'\\u2029')
+
+
+def list_response(request, qs, serializer_class, fields, keys, ranked, context=None, filtered=False):
+    """
+    Fast equivalent of the list/keyset-page branches of views.list_response.
+    Raises ValueError for malformed pagination parameters.
+    """
+    plan = get_plan(serializer_class, fields)
+    ctx = RowContext(context or {})
+    if not wants_page(request):
+        rows = list(values_rows(plan, qs, ranked and not filtered))
+        if ranked and filtered:
+            assign_row_positions(plan.model, rows, sparse=True)
+        data = plan.render_rows(rows, ctx)
+    else:
+        rows, next_cursor = keyset_page(request, values_rows(plan, qs, False, keys), keys)
+        if ranked:
+            assign_row_positions(plan.model, rows, sparse=filtered)
+        data = {"results": plan.render_rows(rows, ctx), "next_cursor": next_cursor}
+    return HttpResponse(render_json(data, ctx.exact_floats), content_type='application/json')
+
+
+def ordered_response(qs, serializer_class, fields, ids, context=None):
+    """
+    Renders the rows of qs in the order given by ids, e.g. search ranking.
+    """
+    plan = get_plan(serializer_class, fields)
+    ctx = RowContext(context or {})
+    rows = {row['id']: row for row in values_rows(plan, qs, False)}
+    data = plan.render_rows([rows[i] for i in ids if i in rows], ctx)
+    return HttpResponse(render_json(data, ctx.exact_floats), content_type='application/json')
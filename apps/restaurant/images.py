@@ -0,0 +1,103 @@
+"""
+Resized WebP/JPEG derivatives of menu item images.
+
+Uploads are processed off the request thread by a small worker pool. Files
+are written under content-hashed names, so a derivative never changes once
+published and can be served with a far-future cache lifetime.
+"""
+import hashlib
+import io
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db import connection, transaction
+from PIL import Image, ImageOps
+from apps.restaurant.models import CatalogVersion, ProductItem
+
+logger = logging.getLogger(__name__)
+
+# name -> max width in pixels
+DERIVATIVE_SIZES = {'thumb': 160, 'card': 480, 'full': 1280}
+DERIVATIVE_DIR = 'menu_items/derived'
+QUALITY = 80
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def get_executor():
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(max_workers=settings.IMAGE_DERIVATIVE_WORKERS,
+                                           thread_name_prefix='image-derivatives')
+    return _executor
+
+
+def render(image, width, fmt):
+    copy = image.copy()
+    if copy.width > width:
+        copy = copy.resize((width, max(1, round(copy.height * width / copy.width))), Image.LANCZOS)
+    if fmt == 'jpeg' and copy.mode != 'RGB':
+        copy = copy.convert('RGB')
+    buf = io.BytesIO()
+    copy.save(buf, format=fmt.upper(), quality=QUALITY, optimize=True)
+    return buf.getvalue()
+
+
+def build_derivatives(source_name):
+    """
+    Writes every size/format of the image stored at source_name and returns
+    {'source': name, size: {'width': w, 'webp': path, 'jpeg': path}, ...}.
+    """
+    with default_storage.open(source_name, 'rb') as fh:
+        data = fh.read()
+    digest = hashlib.sha256(data).hexdigest()[:16]
+    image = ImageOps.exif_transpose(Image.open(io.BytesIO(data)))
+    if image.mode not in ('RGB', 'RGBA'):
+        image = image.convert('RGBA' if 'transparency' in image.info else 'RGB')
+    derivatives = {'source': source_name}
+    for size, width in DERIVATIVE_SIZES.items():
+        entry = {'width': min(width, image.width)}
+        for fmt, ext in (('webp', 'webp'), ('jpeg', 'jpg')):
+            path = f"{DERIVATIVE_DIR}/{digest}-{size}.{ext}"
+            if not default_storage.exists(path):
+                default_storage.save(path, ContentFile(render(image, width, fmt)))
+            entry[fmt] = path
+        derivatives[size] = entry
+    return derivatives
+
+
+def process_product_image(product_id, source_name, restaurant_id=None):
+    try:
+        derivatives = build_derivatives(source_name)
+        # Skip the write if the image was replaced while this job was running
+        if ProductItem.all_objects.filter(pk=product_id, image=source_name).update(image_derivatives=derivatives):
+            CatalogVersion.bump(restaurant_id)
+    except Exception:
+        logger.exception("Could not build image derivatives for product %s (%s)", product_id, source_name)
+    finally:
+        connection.close()
+
+
+def schedule_derivatives(product):
+    """
+    Queues derivative generation for product's current image once the
+    surrounding transaction commits.
+    """
+    product_id, source_name, restaurant_id = product.pk, product.image.name, product.restaurant_id
+    transaction.on_commit(lambda: get_executor().submit(process_product_image, product_id, source_name, restaurant_id))
+
+
+def derivative_urls(derivatives, build_url):
+    """
+    Maps stored derivative paths to URLs using build_url (for example
+    request.build_absolute_uri over storage.url).
+    """
+    return {
+        size: {'width': entry['width'], 'webp': build_url(entry['webp']), 'jpeg': build_url(entry['jpeg'])}
+        for size, entry in derivatives.items() if size in DERIVATIVE_SIZES
+    }
@@ -0,0 +1,242 @@
+"""
+Bulk catalog import for onboarding: streams product rows from CSV or JSON,
+resolves categories in memory and writes ProductItem rows with bulk_create.
+"""
+import csv
+import io
+import json
+import time
+from django.core.exceptions import ValidationError
+from django.db import IntegrityError, transaction
+from django.db.models import Max
+from django.db.models.functions import Length
+from django.utils.text import slugify
+from apps.restaurant import tenancy
+from apps.restaurant.models import SLUG_RETRIES, CatalogVersion, MainCategory, SubCategory, ProductItem
+from apps.restaurant.ranking import rank_sequence, REBALANCE_LENGTH
+from apps.restaurant.search import reindex_products
+
+IMPORT_FIELDS = (
+    'name', 'description', 'prepare_time', 'variant_type', 'quantity_value', 'quantity_unit', 'price',
+    'currency_symbol', 'tax_percentage', 'stock_available', 'is_available', 'is_active',
+    'max_order_quantity', 'customizations', 'image_alt',
+)
+BOOLEAN_FIELDS = ('is_available', 'is_active')
+# Checked in memory by the importer instead of by full_clean()
+SKIP_CLEAN = ['main_category', 'sub_category', 'created_by', 'slug', 'rank', 'image']
+
+
+def detect_format(filename):
+    name = (filename or '').lower()
+    if name.endswith('.csv'):
+        return 'csv'
+    if name.endswith(('.json', '.jsonl', '.ndjson')):
+        return 'json'
+    raise ValueError(f"Unsupported file type: {filename}. Use .csv, .json or .jsonl")
+
+
+def iter_csv_rows(stream):
+    yield from csv.DictReader(stream)
+
+
+def iter_json_rows(stream, chunk_size=65536):
+    """
+    Yields objects from a JSON array or from JSON Lines without loading the
+    whole document.
+    """
+    decoder, buf, started = json.JSONDecoder(), '', False
+    while True:
+        chunk = stream.read(chunk_size)
+        buf += chunk
+        while True:
+            buf = buf.lstrip()
+            if not started and buf.startswith('['):
+                buf, started = buf[1:], True
+                continue
+            if buf.startswith(','):
+                buf = buf[1:]
+                continue
+            if buf.startswith(']') or not buf:
+                break
+            try:
+                obj, end = decoder.raw_decode(buf)
+            except json.JSONDecodeError:
+                if not chunk:
+                    raise
+                break
+            buf = buf[end:]
+            yield obj
+        if not chunk:
+            return
+
+
+def to_text_stream(fileobj):
+    if isinstance(fileobj, io.TextIOBase):
+        return fileobj
+    return io.TextIOWrapper(fileobj, encoding='utf-8-sig', newline='')
+
+
+class CatalogImporter:
+    """
+    Usage: CatalogImporter(user=request.user).run(stream, 'csv')
+    Returns a report with created/failed counts, per-row errors and run time.
+    """
+
+    def __init__(self, user=None, chunk_size=500, create_categories=True):
+        self.user = user
+        self.chunk_size = chunk_size
+        self.create_categories = create_categories
+        self.main_categories = {c.name.lower(): c for c in MainCategory.objects.all()}
+        self.main_by_id = {c.id: c for c in self.main_categories.values()}
+        self.sub_categories = {(s.main_category_id, s.name.lower()): s for s in SubCategory.objects.all()}
+        self.sub_by_id = {s.id: s for s in self.sub_categories.values()}
+        self.slugs = set(ProductItem.objects.values_list('slug', flat=True))
+        self.next_suffix = {}
+        self.last_rank = {}
+        self.touched_scopes = set()
+
+    # ---------------- category resolution ----------------
+    def resolve_main(self, value):
+        value = str(value or '').strip()
+        if not value:
+            raise ValidationError({'main_category': ['This field is required.']})
+        if value.isdigit() and int(value) in self.main_by_id:
+            return self.main_by_id[int(value)]
+        category = self.main_categories.get(value.lower())
+        if category is None:
+            if not self.create_categories:
+                raise ValidationError({'main_category': [f'Unknown main category "{value}".']})
+            category = MainCategory.objects.create(name=value)
+            self.main_categories[value.lower()] = self.main_by_id[category.id] = category
+        return category
+
+    def resolve_sub(self, main, value):
+        value = str(value or '').strip()
+        if not value:
+            return None
+        if value.isdigit() and int(value) in self.sub_by_id:
+            sub = self.sub_by_id[int(value)]
+            if sub.main_category_id != main.id:
+                raise ValidationError({'sub_category': [f'Sub category {value} does not belong to "{main.name}".']})
+            return sub
+        sub = self.sub_categories.get((main.id, value.lower()))
+        if sub is None:
+            if not self.create_categories:
+                raise ValidationError({'sub_category': [f'Unknown sub category "{value}".']})
+            sub = SubCategory.objects.create(main_category=main, name=value)
+            self.sub_categories[(main.id, value.lower())] = self.sub_by_id[sub.id] = sub
+        return sub
+
+    # ---------------- row building ----------------
+    def allocate_slug(self, name):
+        # Remember the next suffix per base so repeated names do not rescan
+        base = slugify(name)
+        slug, n = base, self.next_suffix.get(base, 1)
+        while slug in self.slugs:
+            slug, n = f"{base}-{n}", n + 1
+        self.slugs.add(slug)
+        self.next_suffix[base] = n
+        return slug
+
+    def build(self, row):
+        values = {}
+        for field in IMPORT_FIELDS:
+            value = row.get(field)
+            if value is None or (isinstance(value, str) and value.strip() == ''):
+                continue
+            if field in BOOLEAN_FIELDS and isinstance(value, str):
+                value = value.strip().lower() in ('1', 'true', 'yes', 'y')
+            values[field] = value.strip() if isinstance(value, str) else value
+        obj = ProductItem(created_by=self.user, **values)
+        obj.full_clean(exclude=SKIP_CLEAN, validate_unique=False, validate_constraints=False)
+        # Resolved only for valid rows so rejected rows never create categories
+        main = self.resolve_main(row.get('main_category'))
+        sub = self.resolve_sub(main, row.get('sub_category'))
+        obj.main_category, obj.sub_category = main, sub
+        if not main.is_active or (sub and not sub.is_active):
+            obj.is_active = False
+        obj.image_alt = obj.image_alt or obj.name
+        obj.slug = self.allocate_slug(obj.name)
+        return obj
+
+    def assign_ranks(self, objs):
+        groups = {}
+        for obj in objs:
+            groups.setdefault((obj.main_category_id, obj.sub_category_id), []).append(obj)
+        for scope, items in groups.items():
+            if scope not in self.last_rank:
+                siblings = ProductItem.objects.filter(main_category_id=scope[0], sub_category_id=scope[1])
+                self.last_rank[scope] = siblings.aggregate(Max('rank'))['rank__max']
+            keys = rank_sequence(len(items), lo=self.last_rank[scope])
+            for obj, key in zip(items, keys):
+                obj.rank = key
+            self.last_rank[scope] = keys[-1]
+            self.touched_scopes.add(scope)
+
+    def flush(self, rows, errors):
+        """
+        Writes one chunk of (row number, product) pairs and returns how many
+        were created. Slugs taken since the importer read them (a concurrent
+        insert) are allocated again; a chunk that still fails is reported in
+        errors row by row.
+        """
+        objs = [obj for _, obj in rows]
+        self.assign_ranks(objs)
+        for attempt in range(SLUG_RETRIES):
+            try:
+                with transaction.atomic():
+                    ProductItem.objects.bulk_create(objs, batch_size=self.chunk_size)
+                    # bulk_create sends no post_save, so index the new rows here
+                    reindex_products([obj.pk for obj in objs])
+                return len(objs)
+            except IntegrityError as e:
+                failure = e
+                # Batches written before the failure were rolled back
+                for obj in objs:
+                    obj.pk, obj._state.adding = None, True
+                taken = set(ProductItem.objects.filter(slug__in=[obj.slug for obj in objs]).values_list('slug', flat=True))
+                if not taken or attempt == SLUG_RETRIES - 1:
+                    break
+                self.slugs |= taken
+                for obj in objs:
+                    if obj.slug in taken:
+                        obj.slug = self.allocate_slug(obj.name)
+        errors.extend({'row': number, 'errors': {'row': [f'Could not be saved: {failure}']}} for number, _ in rows)
+        return 0
+
+    # ---------------- entry point ----------------
+    def run(self, stream, fmt):
+        started = time.monotonic()
+        rows = iter_csv_rows(stream) if fmt == 'csv' else iter_json_rows(stream)
+        created, errors, pending = 0, [], []
+        try:
+            for number, row in enumerate(rows, 1):
+                try:
+                    if not isinstance(row, dict):
+                        raise ValidationError('Each row must be an object.')
+                    pending.append((number, self.build(row)))
+                except ValidationError as e:
+                    errors.append({'row': number, 'errors': e.message_dict if hasattr(e, 'error_dict') else {'row': e.messages}})
+                if len(pending) >= self.chunk_size:
+                    created, pending = created + self.flush(pending, errors), []
+        except (csv.Error, json.JSONDecodeError, UnicodeDecodeError) as e:
+            errors.append({'row': None, 'errors': {'file': [f'Could not parse file: {e}']}})
+        if pending:
+            created += self.flush(pending, errors)
+        self.rebalance_long_ranks()
+        if created:
+            # bulk_create sends no post_save, so invalidate cached menus here
+            CatalogVersion.bump(tenancy.current())
+        return {
+            'created': created,
+            'failed': len(errors),
+            'errors': errors,
+            'seconds': round(time.monotonic() - started, 3),
+        }
+
+    def rebalance_long_ranks(self):
+        # Consecutive chunks extend the keys; respace the groups that grew too long
+        for main_id, sub_id in self.touched_scopes:
+            siblings = ProductItem.objects.filter(main_category_id=main_id, sub_category_id=sub_id)
+            if (siblings.aggregate(longest=Max(Length('rank')))['longest'] or 0) > REBALANCE_LENGTH:
+                ProductItem.rebalance(main_category_id=main_id, sub_category_id=sub_id)
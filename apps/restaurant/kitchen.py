@@ -0,0 +1,211 @@
+"""
+Kitchen display: tickets for open orders and a push channel for them.
+
+Items are fired by prepare time: an order is due when its slowest dish is
+done (created_at + max prepare_time), and every other dish fires at
+due - prepare_time so the whole order comes up together. The queue lists
+items by fire time.
+
+Changes are published to a broker. InProcessBroker fans events out to the
+asyncio queues of screens connected to this process. With several server
+processes, set KITCHEN_BROKER to RedisBroker (needs the redis package) so
+every process sees every event. Screens connect to
+kitchen_stream (Server-Sent Events) and see only their restaurant's orders. Under ASGI each screen is an idle
+coroutine, not a thread.
+"""
+import asyncio
+import json
+import threading
+from datetime import timedelta
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db.models import Prefetch
+from django.utils.module_loading import import_string
+from apps.restaurant import tenancy
+from apps.restaurant.models import Order, OrderItem
+
+try:
+    import redis
+    import redis.asyncio as aioredis
+except ImportError:  # pragma: no cover - optional dependency
+    redis = aioredis = None
+
+OPEN_STATUSES = ('placed', 'preparing', 'ready')
+KITCHEN_ROLES = ('admin', 'client', 'manager', 'chef', 'waiter')
+
+
+def is_kitchen_user(user, restaurant_id):
+    # Staff, or someone in a kitchen role who works at the restaurant (see tenancy.can_access)
+    if user.is_staff or user.is_superuser:
+        return True
+    category = getattr(user, 'role_category', None)
+    if category is None and getattr(user, 'role', None) is not None:
+        category = user.role.role_category
+    return category in KITCHEN_ROLES and tenancy.can_access(user, restaurant_id)
+
+
+# ============================================================
+# TICKETS
+# ============================================================
+def ticket(order):
+    """
+    Kitchen view of an order whose items are loaded (or prefetched).
+    """
+    items = list(order.items.all())
+    longest = max((item.prepare_time for item in items), default=0)
+    due = order.created_at + timedelta(minutes=longest)
+    return {
+        'order': order.id,
+        'status': order.status,
+        'notes': order.notes,
+        'created_at': order.created_at,
+        'due_at': due,
+        'items': sorted(({
+            'id': item.id, 'product': item.product_id, 'name': item.name, 'quantity': item.quantity,
+            'prepare_time': item.prepare_time, 'fire_at': due - timedelta(minutes=item.prepare_time),
+        } for item in items), key=lambda item: (item['fire_at'], item['id'])),
+    }
+
+
+def kitchen_queue(restaurant_id=None):
+    """
+    Returns {'tickets': [...], 'queue': [...]}: open orders by due time and
+    their items by fire time. Lists the active restaurant's orders unless
+    restaurant_id is given.
+    """
+    if restaurant_id is None:
+        restaurant_id = tenancy.current()
+    orders = (Order.objects.filter(restaurant_id=restaurant_id, status__in=OPEN_STATUSES).order_by('created_at', 'id')
+              .prefetch_related(Prefetch('items', queryset=OrderItem.objects.order_by('id'))))
+    tickets = sorted((ticket(order) for order in orders), key=lambda t: (t['due_at'], t['order']))
+    queue = sorted(({'order': t['order'], **item} for t in tickets if t['status'] != 'ready' for item in t['items']),
+                   key=lambda item: (item['fire_at'], item['order'], item['id']))
+    return {'tickets': tickets, 'queue': queue}
+
+
+def encode(data):
+    return json.dumps(data, cls=DjangoJSONEncoder, separators=(',', ':'))
+
+
+def publish_ticket(order):
+    get_broker().publish({'type': 'ticket', 'restaurant': order.restaurant_id, 'ticket': ticket(order)})
+
+
+# ============================================================
+# BROKERS
+# ============================================================
+class InProcessBroker:
+    """
+    Delivers events to subscribers in this process. publish() may be called
+    from any thread; each subscriber's queue lives on its own event loop.
+    """
+
+    def __init__(self):
+        self.subscribers = set()
+        self.lock = threading.Lock()
+
+    def publish(self, event):
+        data = encode(event)
+        with self.lock:
+            subscribers = list(self.subscribers)
+        for subscription in subscribers:
+            try:
+                subscription.loop.call_soon_threadsafe(subscription.deliver, data)
+            except RuntimeError:
+                # Event loop already closed
+                self.discard(subscription)
+
+    def subscribe(self):
+        subscription = InProcessSubscription(self)
+        with self.lock:
+            self.subscribers.add(subscription)
+        return subscription
+
+    def discard(self, subscription):
+        with self.lock:
+            self.subscribers.discard(subscription)
+
+
+class InProcessSubscription:
+    def __init__(self, broker):
+        self.broker = broker
+        self.loop = asyncio.get_running_loop()
+        self.queue = asyncio.Queue(maxsize=settings.KITCHEN_QUEUE_SIZE)
+        self.overflowed = False
+
+    def deliver(self, data):
+        try:
+            self.queue.put_nowait(data)
+        except asyncio.QueueFull:
+            # A stalled screen gets a fresh snapshot instead of a backlog
+            self.overflowed = True
+
+    async def get(self, timeout):
+        """
+        Returns the next encoded event, RESYNC after an overflow, or None
+        when timeout passes first.
+        """
+        if self.overflowed:
+            self.overflowed = False
+            while not self.queue.empty():
+                self.queue.get_nowait()
+            return RESYNC
+        try:
+            return await asyncio.wait_for(self.queue.get(), timeout)
+        except asyncio.TimeoutError:
+            return None
+
+    async def close(self):
+        self.broker.discard(self)
+
+
+class RedisBroker:
+    """
+    Publishes events on a Redis channel (KITCHEN_REDIS_URL) that every
+    process subscribes to.
+    """
+    channel = 'kitchen'
+
+    def __init__(self):
+        if redis is None:
+            raise RuntimeError("RedisBroker needs the redis package")
+        self.client = redis.Redis.from_url(settings.KITCHEN_REDIS_URL)
+
+    def publish(self, event):
+        self.client.publish(self.channel, encode(event))
+
+    def subscribe(self):
+        return RedisSubscription(self.channel)
+
+
+class RedisSubscription:
+    def __init__(self, channel):
+        self.client = aioredis.Redis.from_url(settings.KITCHEN_REDIS_URL)
+        self.pubsub = self.client.pubsub(ignore_subscribe_messages=True)
+        self.channel = channel
+        self.subscribed = False
+
+    async def get(self, timeout):
+        if not self.subscribed:
+            await self.pubsub.subscribe(self.channel)
+            self.subscribed = True
+        message = await self.pubsub.get_message(timeout=timeout)
+        return message['data'].decode() if message else None
+
+    async def close(self):
+        await self.pubsub.aclose()
+        await self.client.aclose()
+
+
+RESYNC = encode({'type': 'resync'})
+_broker = None
+_broker_lock = threading.Lock()
+
+
+def get_broker():
+    global _broker
+    if _broker is None:
+        with _broker_lock:
+            if _broker is None:
+                _broker = import_string(settings.KITCHEN_BROKER)()
+    return _broker
@@ -0,0 +1,72 @@
+import json
+import os
+import tempfile
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, connections
+from django.test.utils import setup_test_environment, teardown_test_environment
+from apps.restaurant.benchmark import DEFAULT_SHAPE, compare, load_baseline, run_benchmark
+from core.routers import READ_ALIAS
+
+
+class Command(BaseCommand):
+    help = "Time every API route against a synthetic menu on a throwaway test database and compare with a baseline."
+
+    def add_arguments(self, parser):
+        for name, default in DEFAULT_SHAPE.items():
+            parser.add_argument(f"--{name}", type=int, default=default)
+        parser.add_argument("--iterations", type=int, default=20)
+        parser.add_argument("--seed", type=int, default=0)
+        parser.add_argument("--output", default="benchmarks/results.json")
+        parser.add_argument("--baseline", default="benchmarks/baseline.json")
+        parser.add_argument("--save-baseline", action="store_true", help="Write the results as the new baseline.")
+        parser.add_argument("--tolerance", type=float, default=0.5, help="Allowed relative p50 growth before failing.")
+
+    def handle(self, *args, **options):
+        shape = {name: options[name] for name in DEFAULT_SHAPE}
+        setup_test_environment()
+        default = connection.settings_dict
+        old_name, old_test_name = default["NAME"], default["TEST"].get("NAME")
+        reader = connections.settings.get(READ_ALIAS)
+        if reader is not None and connection.vendor == "sqlite":
+            # The read connection has to open the same database; the default SQLite test database is in memory
+            default["TEST"]["NAME"] = os.path.join(tempfile.mkdtemp(), "benchmark.sqlite3")
+        test_name = connection.creation.create_test_db(verbosity=0, autoclobber=True, serialize=False)
+        if reader is not None:
+            # Reads are routed to the read connection, which must see the test database too
+            connections[READ_ALIAS].close()
+            old_reader_name, reader["NAME"] = reader["NAME"], test_name
+        try:
+            results = run_benchmark(shape, iterations=options["iterations"], seed=options["seed"])
+        finally:
+            if reader is not None:
+                connections[READ_ALIAS].close()
+                reader["NAME"] = old_reader_name
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+            default["TEST"]["NAME"] = old_test_name
+            teardown_test_environment()
+
+        self.stdout.write(f"{'route':<30} {'method':<7} {'p50 ms':>9} {'p90 ms':>9} {'p99 ms':>9} {'queries':>8}  status")
+        for stats in results["routes"].values():
+            self.stdout.write(f"{stats['route']:<30} {stats['method']:<7} {stats['p50_ms']:>9} {stats['p90_ms']:>9} "
+                              f"{stats['p99_ms']:>9} {stats['queries']:>8}  {stats['status']}")
+        for name in results["missing"]:
+            self.stderr.write(f"no benchmark spec for route {name}")
+
+        path = options["baseline"] if options["save_baseline"] else options["output"]
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        with open(path, "w") as fh:
+            json.dump(results, fh, indent=2)
+        self.stdout.write(f"results written to {path}")
+        if options["save_baseline"]:
+            return
+
+        baseline = load_baseline(options["baseline"])
+        if baseline is None:
+            self.stdout.write(f"no baseline at {options['baseline']}; run with --save-baseline to create one")
+            return
+        if baseline.get("shape") != results["shape"]:
+            self.stderr.write("baseline was recorded with a different menu shape; timings may not be comparable")
+        regressions = compare(results, baseline, tolerance=options["tolerance"])
+        if regressions:
+            raise CommandError("regressions against baseline:\n  " + "\n  ".join(regressions))
+        self.stdout.write(self.style.SUCCESS("no regressions against baseline"))
@@ -0,0 +1,74 @@
+import os
+import tempfile
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, connections
+from django.test.utils import override_settings, setup_test_environment, teardown_test_environment
+from apps.restaurant.benchmark import run_order_contention
+from core.routers import READ_ALIAS
+
+KEYS = ("threads", "attempts", "placed", "rejected", "orders_per_s", "p50_ms", "p99_ms", "reads_per_s", "read_p99_ms")
+
+
+class Command(BaseCommand):
+    help = "Place orders from concurrent threads against limited stock on a throwaway database and check nothing is oversold."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--threads", type=int, default=8)
+        parser.add_argument("--orders", type=int, default=50, help="Orders each thread tries to place.")
+        parser.add_argument("--products", type=int, default=3)
+        parser.add_argument("--stock", type=int, default=100, help="Starting stock of every product.")
+        parser.add_argument("--readers", type=int, default=0, help="Threads listing the menu while orders are placed.")
+        parser.add_argument("--seed", type=int, default=0)
+        parser.add_argument("--compare", action="store_true",
+                            help="First run on a plain SQLite connection (rollback journal, "
+                                 "5s timeout, no read connection) and print both runs side by side.")
+
+    def handle(self, *args, **options):
+        if options["compare"] and connection.vendor != "sqlite":
+            raise CommandError("--compare measures the SQLite connection settings")
+        runs = {}
+        setup_test_environment()
+        try:
+            if options["compare"]:
+                runs["plain"] = self.contend(options, plain=True)
+            runs["configured"] = self.contend(options, plain=False)
+        finally:
+            teardown_test_environment()
+
+        self.stdout.write(f"{'':<14} " + " ".join(f"{label:>12}" for label in runs))
+        for key in KEYS:
+            self.stdout.write(f"{key:<14} " + " ".join(f"{str(results[key]):>12}" for results in runs.values()))
+        for label, results in runs.items():
+            for error in results["errors"][:10]:
+                self.stderr.write(f"{label} error: {error}")
+            if results["oversold"]:
+                raise CommandError(f"{label}: stock mismatch: {results['oversold']}")
+            # The plain run is there to show what the configured connection avoids
+            if results["errors"] and label != "plain":
+                raise CommandError(f"{label}: {len(results['errors'])} placements failed with errors")
+        self.stdout.write(self.style.SUCCESS("no overselling, no errors"))
+
+    def contend(self, options, plain):
+        default = connection.settings_dict
+        old_name, old_options = default["NAME"], default["OPTIONS"]
+        reader = connections.settings.get(READ_ALIAS)
+        if connection.vendor == "sqlite":
+            # Threads need a database file they can all open; the default SQLite test database is in memory
+            default["TEST"]["NAME"] = os.path.join(tempfile.mkdtemp(), "orders.sqlite3")
+        if plain:
+            default["OPTIONS"] = {}
+        connection.close()
+        test_name = connection.creation.create_test_db(verbosity=0, autoclobber=True, serialize=False)
+        if reader is not None:
+            old_reader_name, reader["NAME"] = reader["NAME"], test_name
+        try:
+            with override_settings(DATABASE_ROUTERS=[] if plain else settings.DATABASE_ROUTERS):
+                return run_order_contention(options["threads"], options["orders"], options["products"],
+                                            options["stock"], options["seed"], options["readers"])
+        finally:
+            connections.close_all()
+            if reader is not None:
+                reader["NAME"] = old_reader_name
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+            default["OPTIONS"] = old_options
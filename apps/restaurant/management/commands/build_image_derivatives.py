@@ -0,0 +1,28 @@
+from django.core.management.base import BaseCommand
+from apps.restaurant.images import build_derivatives
+from apps.restaurant.models import CatalogVersion, ProductItem
+
+
+class Command(BaseCommand):
+    help = "Build resized WebP/JPEG copies of menu item images that do not have them yet."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--all", action="store_true", help="Rebuild every product image, not only missing ones.")
+
+    def handle(self, *args, **options):
+        built = failed = 0
+        restaurants = set()
+        for product in (ProductItem.all_objects.exclude(image="").exclude(image=None)
+                        .only("id", "restaurant", "image", "image_derivatives").iterator()):
+            if not options["all"] and product.image_derivatives.get("source") == product.image.name:
+                continue
+            try:
+                ProductItem.all_objects.filter(pk=product.pk).update(image_derivatives=build_derivatives(product.image.name))
+                restaurants.add(product.restaurant_id)
+                built += 1
+            except Exception as e:
+                self.stderr.write(f"product {product.id} ({product.image.name}): {e}")
+                failed += 1
+        for restaurant_id in restaurants:
+            CatalogVersion.bump(restaurant_id)
+        self.stdout.write(self.style.SUCCESS(f"{built} images processed, {failed} failed"))
@@ -0,0 +1,43 @@
+import json
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from apps.restaurant import tenancy
+from apps.restaurant.importer import CatalogImporter, detect_format
+
+
+class Command(BaseCommand):
+    help = "Bulk import menu items from a CSV, JSON array or JSON Lines file."
+
+    def add_arguments(self, parser):
+        parser.add_argument("path")
+        parser.add_argument("--format", choices=["csv", "json"], help="Defaults to the file extension.")
+        parser.add_argument("--chunk-size", type=int, default=500)
+        parser.add_argument("--user", help="Email of the user recorded as created_by.")
+        parser.add_argument("--restaurant", type=int,
+                            help="Id of the restaurant whose catalog to import into. Defaults to the default catalog.")
+        parser.add_argument("--no-create-categories", action="store_true",
+                            help="Reject rows whose categories do not exist instead of creating them.")
+
+    def handle(self, *args, **options):
+        try:
+            fmt = options["format"] or detect_format(options["path"])
+        except ValueError as e:
+            raise CommandError(str(e))
+        user = None
+        if options["user"]:
+            user = get_user_model().objects.filter(email=options["user"]).first()
+            if user is None:
+                raise CommandError(f"No user with email {options['user']}")
+        restaurant_id = options["restaurant"]
+        if restaurant_id is not None and not tenancy.is_open(restaurant_id):
+            raise CommandError(f"No open restaurant with id {restaurant_id}")
+        # The importer reads categories and slugs when built, so it is built inside the restaurant too
+        with tenancy.activate(restaurant_id):
+            importer = CatalogImporter(user=user, chunk_size=options["chunk_size"],
+                                       create_categories=not options["no_create_categories"])
+            with open(options["path"], encoding="utf-8-sig", newline="") as stream:
+                report = importer.run(stream, fmt)
+        for error in report["errors"]:
+            self.stderr.write(f"row {error['row']}: {json.dumps(error['errors'])}")
+        self.stdout.write(self.style.SUCCESS(
+            f"{report['created']} items created, {report['failed']} rows failed in {report['seconds']}s"))
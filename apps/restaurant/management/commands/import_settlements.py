@@ -0,0 +1,42 @@
+import json
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from apps.restaurant.importer import detect_format
+from apps.restaurant.settlements import SettlementImporter
+
+
+class Command(BaseCommand):
+    help = "Upsert payment transactions from a gateway settlement file (CSV, JSON array or JSON Lines) and print the reconciliation."
+
+    def add_arguments(self, parser):
+        parser.add_argument("path")
+        parser.add_argument("--format", choices=["csv", "json"], help="Defaults to the file extension.")
+        parser.add_argument("--chunk-size", type=int, default=500)
+        parser.add_argument("--user", help="Email of the user recorded in the payment history.")
+        parser.add_argument("--json", action="store_true", help="Print the whole report as JSON.")
+
+    def handle(self, *args, **options):
+        try:
+            fmt = options["format"] or detect_format(options["path"])
+        except ValueError as e:
+            raise CommandError(str(e))
+        user = None
+        if options["user"]:
+            user = get_user_model().objects.filter(email=options["user"]).first()
+            if user is None:
+                raise CommandError(f"No user with email {options['user']}")
+        importer = SettlementImporter(user=user, chunk_size=options["chunk_size"])
+        with open(options["path"], encoding="utf-8-sig", newline="") as stream:
+            report = importer.run(stream, fmt)
+        if options["json"]:
+            self.stdout.write(json.dumps(report, indent=2))
+            return
+        for error in report["errors"]:
+            self.stderr.write(f"row {error['row']}: {json.dumps(error['errors'])}")
+        for conflict in report["conflicts"]:
+            self.stderr.write(f"row {conflict['row']}: {conflict['transaction_id']}: {conflict['reason']}")
+        subscriptions = report["subscriptions"]
+        self.stdout.write(self.style.SUCCESS(
+            f"{report['rows']} rows: {report['created']} created, {report['updated']} updated, {report['unchanged']} unchanged, "
+            f"{len(report['conflicts'])} conflicts, {report['failed']} failed; {subscriptions['activated']} subscriptions "
+            f"activated, {subscriptions['deactivated']} deactivated in {report['seconds']}s"))
@@ -0,0 +1,31 @@
+from django.core.management.base import BaseCommand
+from django.db.models import Max
+from django.db.models.functions import Length
+from core.transactions import write_atomic
+from apps.restaurant.models import MainCategory, SubCategory, ProductItem
+from apps.restaurant.ranking import REBALANCE_LENGTH
+
+
+class Command(BaseCommand):
+    help = "Respace catalog rank keys so later inserts and moves keep short keys."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--all", action="store_true",
+                            help="Rebalance every sibling group, not only the ones with long keys.")
+
+    def handle(self, *args, **options):
+        min_length = 0 if options["all"] else REBALANCE_LENGTH
+        for model in (MainCategory, SubCategory, ProductItem):
+            scope = list(model.rank_scope)
+            if scope:
+                groups = (model.all_objects.order_by().values(*scope)
+                          .annotate(longest=Max(Length("rank"))).filter(longest__gt=min_length))
+            else:
+                longest = model.all_objects.aggregate(longest=Max(Length("rank")))["longest"] or 0
+                groups = [{"longest": longest}] if longest > min_length else []
+            touched = 0
+            for group in groups:
+                group.pop("longest")
+                with write_atomic():
+                    touched += model.rebalance(**group)
+            self.stdout.write(f"{model.__name__}: {touched} rows respaced")
@@ -0,0 +1,41 @@
+import time
+from datetime import date
+from django.core.management.base import BaseCommand, CommandError
+from apps.restaurant.rollups import SOURCES, rebuild, refresh
+
+
+class Command(BaseCommand):
+    help = "Fold orders and payments changed since the last run into the reporting rollups, or rebuild them."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--source", choices=sorted(SOURCES), action="append",
+                            help="Rollup to refresh; repeat for several. Default: all.")
+        parser.add_argument("--full", action="store_true", help="Recompute every bucket from the raw tables.")
+        parser.add_argument("--since", help="With --full, recompute only buckets from this date (YYYY-MM-DD).")
+        parser.add_argument("--every", type=int, help="Keep refreshing every SECONDS until interrupted.")
+
+    def handle(self, *args, **options):
+        sources = options["source"] or sorted(SOURCES)
+        since = None
+        if options["since"]:
+            if not options["full"]:
+                raise CommandError("--since needs --full")
+            try:
+                since = date.fromisoformat(options["since"])
+            except ValueError:
+                raise CommandError("--since must be YYYY-MM-DD")
+        if options["full"]:
+            for source in sources:
+                result = rebuild(source, since)
+                self.stdout.write(self.style.SUCCESS(f"{source}: rebuilt {result['rows']} rows up to {result['watermark']:%Y-%m-%d %H:%M:%S}"))
+            return
+        while True:
+            for source in sources:
+                result = refresh(source)
+                self.stdout.write(f"{source}: {result['hours']} hours, {result['rows']} rows, up to {result['watermark']:%Y-%m-%d %H:%M:%S}")
+            if not options["every"]:
+                return
+            try:
+                time.sleep(options["every"])
+            except KeyboardInterrupt:
+                return
@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from apps.restaurant.search import enabled, rebuild_index, SEARCH_TABLE
+
+
+class Command(BaseCommand):
+    help = "Rebuild the product_search full-text index from the catalog."
+
+    def handle(self, *args, **options):
+        if not enabled():
+            raise CommandError("The full-text index is only used with SQLite; other databases search with icontains.")
+        with transaction.atomic():
+            rebuild_index()
+        self.stdout.write(self.style.SUCCESS(f"{SEARCH_TABLE} rebuilt"))
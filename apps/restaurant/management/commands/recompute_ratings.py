@@ -0,0 +1,43 @@
+from decimal import Decimal, ROUND_HALF_UP
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Count
+from apps.restaurant.models import ProductItem, ProductReview
+
+RATING_FIELDS = ['rating_avg', 'rating_sum', 'rating_count', 'rating_1', 'rating_2', 'rating_3', 'rating_4', 'rating_5']
+
+
+class Command(BaseCommand):
+    help = "Rebuild ProductItem rating counters from ProductReview rows to repair drift."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=500)
+
+    def handle(self, *args, **options):
+        batch_size, last_id, fixed, total = options["batch_size"], 0, 0, 0
+        while True:
+            products = list(ProductItem.all_objects.filter(id__gt=last_id).order_by("id").only("id", *RATING_FIELDS)[:batch_size])
+            if not products:
+                break
+            last_id = products[-1].id
+            histogram = {}
+            for row in (ProductReview.all_objects.filter(product_id__gte=products[0].id, product_id__lte=last_id)
+                        .values("product_id", "rating").annotate(n=Count("id")).order_by()):
+                histogram.setdefault(row["product_id"], {})[row["rating"]] = row["n"]
+            changed = []
+            for product in products:
+                stars = histogram.get(product.id, {})
+                count = sum(stars.values())
+                total_stars = sum(star * n for star, n in stars.items())
+                values = {f"rating_{star}": stars.get(star, 0) for star in range(1, 6)}
+                values.update(rating_sum=total_stars, rating_count=count,
+                              rating_avg=(Decimal(total_stars) / count).quantize(Decimal("0.1"), ROUND_HALF_UP) if count else Decimal("0.0"))
+                if any(getattr(product, k) != v for k, v in values.items()):
+                    for k, v in values.items():
+                        setattr(product, k, v)
+                    changed.append(product)
+            with transaction.atomic():
+                ProductItem.all_objects.bulk_update(changed, RATING_FIELDS)
+            fixed += len(changed)
+            total += len(products)
+        self.stdout.write(self.style.SUCCESS(f"{total} products checked, {fixed} rating counters rebuilt"))
@@ -0,0 +1,62 @@
+"""
+Denormalized menu snapshot (category -> subcategory -> product -> offers)
+served to POS terminals and QR menu pages, cached per restaurant and
+catalog version.
+"""
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Prefetch
+from django.utils import timezone
+from rest_framework.renderers import JSONRenderer
+from apps.restaurant.models import MainCategory, SubCategory, ProductItem, Offer
+from apps.restaurant.tenancy import partition
+from apps.restaurant.serializers import MainCategorySerializer, SubCategorySerializer, ProductItemSerializer, OfferSerializer
+
+
+def menu_etag(book):
+    return f'"menu-{partition(book.restaurant_id)}-{book.epoch}"'
+
+
+def build_menu(request, book):
+    categories = MainCategory.objects.with_display_order().filter(is_active=True)
+    subcategories = SubCategory.objects.with_display_order().filter(is_active=True).select_related('main_category')
+    products = (ProductItem.objects.with_display_order().filter(is_active=True)
+                .prefetch_related(Prefetch('offers', queryset=Offer.objects.filter(active=True))))
+
+    offers = {}
+    product_rows = []
+    for product, data in zip(products, ProductItemSerializer(products, many=True, context={'request': request, 'price_book': book}).data):
+        for offer in product.offers.all():
+            offers.setdefault(offer.id, offer)
+        product_rows.append((product, data))
+    offer_data = {o['id']: o for o in OfferSerializer(list(offers.values()), many=True).data}
+
+    tree = {c.id: {**d, 'subcategories': [], 'products': []}
+            for c, d in zip(categories, MainCategorySerializer(categories, many=True).data)}
+    subs = {}
+    for sub, data in zip(subcategories, SubCategorySerializer(subcategories, many=True).data):
+        if sub.main_category_id in tree:
+            subs[sub.id] = {**data, 'products': []}
+            tree[sub.main_category_id]['subcategories'].append(subs[sub.id])
+    for product, data in product_rows:
+        data['offers'] = [offer_data[o.id] for o in product.offers.all()]
+        if product.sub_category_id in subs:
+            subs[product.sub_category_id]['products'].append(data)
+        elif product.sub_category_id is None and product.main_category_id in tree:
+            tree[product.main_category_id]['products'].append(data)
+
+    return {'version': book.epoch, 'generated_at': timezone.now(), 'categories': list(tree.values())}
+
+
+def get_menu_snapshot(request, book):
+    """
+    Returns the rendered JSON bytes of the menu for this catalog version and
+    offer window, building them only on a cache miss. Image URLs are
+    absolute, so the snapshot is also keyed by host.
+    """
+    key = f"menu:{partition(book.restaurant_id)}:{book.epoch}:{request.get_host()}"
+    body = cache.get(key)
+    if body is None:
+        body = JSONRenderer().render(build_menu(request, book))
+        cache.set(key, body, settings.MENU_CACHE_TIMEOUT)
+    return body
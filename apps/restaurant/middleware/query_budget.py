@@ -0,0 +1,110 @@
+"""
+Counts SQL queries per request, reports repeated query shapes (N+1) with the
+serializer field that triggered them, and enforces per-endpoint budgets.
+
+Settings:
+    QUERY_BUDGETS           {(url name, method): max queries}; HEAD uses the GET budget.
+                            Requests naming a restaurant get one more query, for
+                            TenantMiddleware to look it up when it is not cached
+                            Requests carrying an access token get one more, for
+                            ClaimsJWTAuthentication to reload its revocation list
+                            when that is due
+    QUERY_BUDGET_DEFAULT    budget for views not listed (None = unlimited)
+    QUERY_BUDGET_STRICT     raise QueryBudgetExceeded instead of logging
+    QUERY_REPEAT_THRESHOLD  identical query shapes per request treated as N+1
+
+Reports also list the cascades (apps.restaurant.cascades) the request ran.
+"""
+import json
+import logging
+import re
+import sys
+from contextlib import ExitStack
+from django.conf import settings
+from django.db import connections
+from rest_framework.fields import Field
+from apps.restaurant import cascades
+
+logger = logging.getLogger(__name__)
+
+IN_LIST = re.compile(r"IN \((?:%s, )*%s\)")
+
+
+class QueryBudgetExceeded(Exception):
+    pass
+
+
+def query_shape(sql):
+    # Parameters are already placeholders; only IN lists vary with the data
+    return IN_LIST.sub("IN (...)", sql)
+
+
+def serializer_field():
+    """
+    Returns 'SerializerName.field' for the serializer field being rendered
+    in the current stack, or None.
+    """
+    frame = sys._getframe(2)
+    while frame is not None:
+        field = frame.f_locals.get('self')
+        if isinstance(field, Field) and field.parent is not None and frame.f_code.co_name in ('get_attribute', 'to_representation'):
+            return f"{type(field.parent).__name__}.{field.field_name}"
+        frame = frame.f_back
+    return None
+
+
+class QueryRecorder:
+    def __init__(self, threshold):
+        self.threshold = threshold
+        self.count = 0
+        self.shapes = {}
+        self.sources = {}
+
+    def __call__(self, execute, sql, params, many, context):
+        self.count += 1
+        shape = query_shape(sql)
+        seen = self.shapes[shape] = self.shapes.get(shape, 0) + 1
+        # Only pay for a stack walk once per repeated shape
+        if seen == self.threshold:
+            self.sources[shape] = serializer_field()
+        return execute(sql, params, many, context)
+
+    def repeated(self):
+        return [{'sql': shape, 'count': n, 'field': self.sources.get(shape)}
+                for shape, n in self.shapes.items() if n >= self.threshold]
+
+
+class QueryBudgetMiddleware:
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        recorder = QueryRecorder(settings.QUERY_REPEAT_THRESHOLD)
+        with ExitStack() as stack:
+            for connection in connections.all():
+                stack.enter_context(connection.execute_wrapper(recorder))
+            fanout = stack.enter_context(cascades.collect())
+            response = self.get_response(request)
+
+        match = request.resolver_match
+        view = match.view_name if match else None
+        method = 'GET' if request.method == 'HEAD' else request.method
+        budget = settings.QUERY_BUDGETS.get((match.url_name if match else None, method), settings.QUERY_BUDGET_DEFAULT)
+        if budget is not None and getattr(request, 'restaurant_id', None) is not None:
+            budget += 1
+        # The kitchen stream takes its token as ?token=
+        if budget is not None and ('HTTP_AUTHORIZATION' in request.META or 'token' in request.GET):
+            budget += 1
+        repeated = recorder.repeated()
+        over = budget is not None and recorder.count > budget
+        report = {
+            'view': view, 'method': request.method, 'path': request.path, 'status': response.status_code,
+            'queries': recorder.count, 'budget': budget, 'repeated': repeated, 'cascades': dict(fanout),
+        }
+        if over and settings.QUERY_BUDGET_STRICT:
+            raise QueryBudgetExceeded(json.dumps(report))
+        if over or repeated:
+            logger.warning("query report %s", json.dumps(report))
+        elif logger.isEnabledFor(logging.DEBUG):
+            logger.debug("query report %s", json.dumps(report))
+        return response
@@ -1,20 +1,16 @@
 # your_app/middleware/subscription_check.py
-from django.shortcuts import redirect
+from django.http import JsonResponse
 from django.utils.deprecation import MiddlewareMixin
-from django.contrib import messages
+from apps.authentication.subscriptions import EXPIRED, may_use_api
 
 class SubscriptionCheckMiddleware(MiddlewareMixin):
     def process_view(self, request, view_func, view_args, view_kwargs):
         # Skip if user not logged in or admin site
+        # Token users are not logged in yet here; ClaimsJWTAuthentication checks them
         if not request.user.is_authenticated or request.path.startswith('/admin/'):
             return None
 
-        # Superusers always allowed
-        if request.user.is_superuser:
-            return None
-
-        # Check user subscription
-        if not request.user.has_active_subscription:
-            messages.error(request, "Your restaurant subscription has expired. Please renew to continue.")
-            return redirect('subscription_expired_page')  
+        # Check user subscription (cached, see apps.authentication.subscriptions)
+        if not may_use_api(request.user):
+            return JsonResponse(EXPIRED, status=403)
         return None
@@ -0,0 +1,26 @@
+from django.http import JsonResponse
+from apps.restaurant.tenancy import activate, is_open
+
+
+class TenantMiddleware:
+    """
+    Activates the restaurant named by the X-Restaurant header (or
+    ?restaurant_id=) for the request; catalog queries are filtered to it.
+    The user is not known yet under token auth, so whether they may write to
+    it is checked by the views (permissions.py).
+    """
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        value = request.headers.get('X-Restaurant') or request.GET.get('restaurant_id')
+        restaurant_id = None
+        if value:
+            if not value.isdigit():
+                return JsonResponse({"errors": {"restaurant": ["A restaurant id is a number."]}}, status=400)
+            restaurant_id = int(value)
+            if not is_open(restaurant_id):
+                return JsonResponse({"errors": {"restaurant": ["Unknown or inactive restaurant."]}}, status=404)
+        request.restaurant_id = restaurant_id
+        with activate(restaurant_id):
+            return self.get_response(request)
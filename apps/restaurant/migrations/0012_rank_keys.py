@@ -0,0 +1,73 @@
+# Generated by Django 5.2.7 on 2026-10-18 09:02
+
+from django.db import migrations, models
+
+from apps.restaurant.ranking import rank_sequence
+
+
+def backfill_ranks(apps, schema_editor):
+    # Carry the current display_order over as evenly spaced rank keys per sibling group
+    scopes = {
+        'MainCategory': (),
+        'SubCategory': ('main_category_id',),
+        'ProductItem': ('main_category_id', 'sub_category_id'),
+    }
+    for model_name, scope in scopes.items():
+        model = apps.get_model('restaurant', model_name)
+        groups = {}
+        for row in model.objects.order_by('display_order', 'id'):
+            groups.setdefault(tuple(getattr(row, f) for f in scope), []).append(row)
+        for rows in groups.values():
+            for row, key in zip(rows, rank_sequence(len(rows))):
+                row.rank = key
+            model.objects.bulk_update(rows, ['rank'], batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('restaurant', '0011_alter_productitem_quantity_unit'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='maincategory',
+            name='rank',
+            field=models.CharField(blank=True, db_index=True, default='', editable=False, max_length=64),
+        ),
+        migrations.AddField(
+            model_name='productitem',
+            name='rank',
+            field=models.CharField(blank=True, db_index=True, default='', editable=False, max_length=64),
+        ),
+        migrations.AddField(
+            model_name='subcategory',
+            name='rank',
+            field=models.CharField(blank=True, db_index=True, default='', editable=False, max_length=64),
+        ),
+        migrations.RunPython(backfill_ranks, migrations.RunPython.noop),
+        migrations.AlterModelOptions(
+            name='maincategory',
+            options={'ordering': ['rank', 'id']},
+        ),
+        migrations.AlterModelOptions(
+            name='productitem',
+            options={'ordering': ['rank', 'id']},
+        ),
+        migrations.AlterModelOptions(
+            name='subcategory',
+            options={'ordering': ['rank', 'id']},
+        ),
+        migrations.RemoveField(
+            model_name='maincategory',
+            name='display_order',
+        ),
+        migrations.RemoveField(
+            model_name='productitem',
+            name='display_order',
+        ),
+        migrations.RemoveField(
+            model_name='subcategory',
+            name='display_order',
+        ),
+    ]
@@ -0,0 +1,70 @@
+# Generated by Django 5.2.7 on 2026-10-18 09:09
+
+from decimal import Decimal, ROUND_HALF_UP
+
+from django.db import migrations, models
+from django.db.models import Count
+
+
+def backfill_rating_counters(apps, schema_editor):
+    ProductItem = apps.get_model('restaurant', 'ProductItem')
+    ProductReview = apps.get_model('restaurant', 'ProductReview')
+    histogram = {}
+    for row in ProductReview.objects.values('product_id', 'rating').annotate(n=Count('id')).order_by():
+        histogram.setdefault(row['product_id'], {})[row['rating']] = row['n']
+    products = list(ProductItem.objects.filter(id__in=histogram))
+    for product in products:
+        stars = histogram[product.id]
+        product.rating_count = sum(stars.values())
+        product.rating_sum = sum(star * n for star, n in stars.items())
+        product.rating_avg = (Decimal(product.rating_sum) / product.rating_count).quantize(Decimal('0.1'), ROUND_HALF_UP)
+        for star in range(1, 6):
+            setattr(product, f'rating_{star}', stars.get(star, 0))
+    fields = ['rating_avg', 'rating_sum', 'rating_count', 'rating_1', 'rating_2', 'rating_3', 'rating_4', 'rating_5']
+    ProductItem.objects.bulk_update(products, fields, batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('restaurant', '0013_catalog_version'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='productitem',
+            name='rating_1',
+            field=models.PositiveIntegerField(default=0, help_text='Number of 1★ reviews'),
+        ),
+        migrations.AddField(
+            model_name='productitem',
+            name='rating_2',
+            field=models.PositiveIntegerField(default=0, help_text='Number of 2★ reviews'),
+        ),
+        migrations.AddField(
+            model_name='productitem',
+            name='rating_3',
+            field=models.PositiveIntegerField(default=0, help_text='Number of 3★ reviews'),
+        ),
+        migrations.AddField(
+            model_name='productitem',
+            name='rating_4',
+            field=models.PositiveIntegerField(default=0, help_text='Number of 4★ reviews'),
+        ),
+        migrations.AddField(
+            model_name='productitem',
+            name='rating_5',
+            field=models.PositiveIntegerField(default=0, help_text='Number of 5★ reviews'),
+        ),
+        migrations.AddField(
+            model_name='productitem',
+            name='rating_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='productitem',
+            name='rating_sum',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.RunPython(backfill_rating_counters, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.7 on 2026-10-18 09:12
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('restaurant', '0014_rating_counters'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='productitem',
+            name='image_derivatives',
+            field=models.JSONField(blank=True, default=dict, editable=False, help_text='Resized copies built by apps.restaurant.images'),
+        ),
+    ]
@@ -0,0 +1,31 @@
+# Generated by Django 5.2.7 on 2026-10-18 09:32
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('restaurant', '0016_product_search'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='productitem',
+            index=models.Index(fields=['main_category', 'sub_category', 'rank', 'id'], name='product_scope_rank'),
+        ),
+        migrations.AddIndex(
+            model_name='productitem',
+            index=models.Index(condition=models.Q(('is_active', True)), fields=['main_category', 'sub_category', 'rank'], name='product_active_scope_rank'),
+        ),
+        migrations.AddIndex(
+            model_name='productitem',
+            index=models.Index(fields=['variant_type', 'price'], name='product_variant_price'),
+        ),
+        migrations.AddIndex(
+            model_name='productitem',
+            index=models.Index(condition=models.Q(('is_active', True), ('is_available', True)), fields=['price'], name='product_orderable_price'),
+        ),
+    ]
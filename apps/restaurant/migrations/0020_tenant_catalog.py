@@ -0,0 +1,135 @@
+# Generated by Django 5.2.7 on 2026-10-18 10:14
+
+import django.db.models.deletion
+import django.db.models.functions.comparison
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('authentication', '0005_payment_updated_at'),
+        ('restaurant', '0019_rollups'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='productitem',
+            name='product_active_scope_rank',
+        ),
+        migrations.RemoveIndex(
+            model_name='productitem',
+            name='product_variant_price',
+        ),
+        migrations.RemoveIndex(
+            model_name='productitem',
+            name='product_orderable_price',
+        ),
+        migrations.AddField(
+            model_name='catalogversion',
+            name='restaurant',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='+', to='authentication.restaurant'),
+        ),
+        migrations.AddField(
+            model_name='maincategory',
+            name='restaurant',
+            field=models.ForeignKey(blank=True, db_index=False, editable=False, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='+', to='authentication.restaurant'),
+        ),
+        migrations.AddField(
+            model_name='offer',
+            name='restaurant',
+            field=models.ForeignKey(blank=True, db_index=False, editable=False, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='+', to='authentication.restaurant'),
+        ),
+        migrations.AddField(
+            model_name='productitem',
+            name='restaurant',
+            field=models.ForeignKey(blank=True, db_index=False, editable=False, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='+', to='authentication.restaurant'),
+        ),
+        migrations.AddField(
+            model_name='productreview',
+            name='restaurant',
+            field=models.ForeignKey(blank=True, db_index=False, editable=False, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='+', to='authentication.restaurant'),
+        ),
+        migrations.AddField(
+            model_name='subcategory',
+            name='restaurant',
+            field=models.ForeignKey(blank=True, db_index=False, editable=False, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='+', to='authentication.restaurant'),
+        ),
+        migrations.AlterField(
+            model_name='maincategory',
+            name='name',
+            field=models.CharField(max_length=120),
+        ),
+        migrations.AlterField(
+            model_name='offer',
+            name='name',
+            field=models.CharField(max_length=100),
+        ),
+        migrations.AlterField(
+            model_name='productitem',
+            name='slug',
+            field=models.SlugField(blank=True, db_index=False, max_length=180),
+        ),
+        migrations.AddIndex(
+            model_name='maincategory',
+            index=models.Index(fields=['restaurant', 'rank', 'id'], name='main_category_tenant_rank'),
+        ),
+        migrations.AddIndex(
+            model_name='offer',
+            index=models.Index(fields=['restaurant', 'active', 'start_date'], name='offer_tenant_active'),
+        ),
+        migrations.AddIndex(
+            model_name='productitem',
+            index=models.Index(fields=['restaurant', 'rank', 'id'], name='product_tenant_rank'),
+        ),
+        migrations.AddIndex(
+            model_name='productitem',
+            index=models.Index(condition=models.Q(('is_active', True)), fields=['restaurant', 'main_category', 'sub_category', 'rank'], name='product_tenant_active_rank'),
+        ),
+        migrations.AddIndex(
+            model_name='productitem',
+            index=models.Index(fields=['restaurant', 'variant_type', 'price'], name='product_tenant_variant_price'),
+        ),
+        migrations.AddIndex(
+            model_name='productitem',
+            index=models.Index(condition=models.Q(('is_active', True), ('is_available', True)), fields=['restaurant', 'price'], name='product_tenant_orderable_price'),
+        ),
+        migrations.AddIndex(
+            model_name='productreview',
+            index=models.Index(fields=['restaurant', 'product'], name='review_tenant_product'),
+        ),
+        migrations.AddIndex(
+            model_name='subcategory',
+            index=models.Index(fields=['restaurant', 'main_category', 'rank', 'id'], name='sub_category_tenant_rank'),
+        ),
+        migrations.AddConstraint(
+            model_name='catalogversion',
+            constraint=models.UniqueConstraint(django.db.models.functions.comparison.Coalesce('restaurant', models.Value(0)), name='catalog_version_restaurant'),
+        ),
+        migrations.AddConstraint(
+            model_name='maincategory',
+            constraint=models.UniqueConstraint(fields=('restaurant', 'name'), name='main_category_name'),
+        ),
+        migrations.AddConstraint(
+            model_name='maincategory',
+            constraint=models.UniqueConstraint(condition=models.Q(('restaurant__isnull', True)), fields=('name',), name='main_category_default_name'),
+        ),
+        migrations.AddConstraint(
+            model_name='offer',
+            constraint=models.UniqueConstraint(fields=('restaurant', 'name'), name='offer_name'),
+        ),
+        migrations.AddConstraint(
+            model_name='offer',
+            constraint=models.UniqueConstraint(condition=models.Q(('restaurant__isnull', True)), fields=('name',), name='offer_default_name'),
+        ),
+        migrations.AddConstraint(
+            model_name='productitem',
+            constraint=models.UniqueConstraint(fields=('restaurant', 'slug'), name='product_slug'),
+        ),
+        migrations.AddConstraint(
+            model_name='productitem',
+            constraint=models.UniqueConstraint(condition=models.Q(('restaurant__isnull', True)), fields=('slug',), name='product_default_slug'),
+        ),
+    ]
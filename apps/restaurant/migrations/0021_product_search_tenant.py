@@ -0,0 +1,37 @@
+from django.db import migrations
+
+
+def create_search_index(apps, schema_editor, tenant=True):
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    ProductItem = apps.get_model('restaurant', 'ProductItem')
+    MainCategory = apps.get_model('restaurant', 'MainCategory')
+    SubCategory = apps.get_model('restaurant', 'SubCategory')
+    schema_editor.execute("DROP TABLE IF EXISTS product_search")
+    schema_editor.execute(
+        "CREATE VIRTUAL TABLE product_search USING fts5("
+        f"name, description, customizations, categories{', tenant' if tenant else ''}, "
+        "tokenize = 'unicode61 remove_diacritics 2', prefix = '2 3')"
+    )
+    schema_editor.execute(f"""
+        INSERT INTO product_search (rowid, name, description, customizations, categories{', tenant' if tenant else ''})
+        SELECT p.id, p.name, COALESCE(p.description, ''), COALESCE(p.customizations, ''),
+               m.name || ' ' || COALESCE(s.name, ''){", 'r' || COALESCE(p.restaurant_id, 0)" if tenant else ''}
+        FROM {ProductItem._meta.db_table} p
+        JOIN {MainCategory._meta.db_table} m ON m.id = p.main_category_id
+        LEFT JOIN {SubCategory._meta.db_table} s ON s.id = p.sub_category_id""")
+
+
+def drop_tenant_column(apps, schema_editor):
+    create_search_index(apps, schema_editor, tenant=False)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('restaurant', '0020_tenant_catalog'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_search_index, drop_tenant_column),
+    ]
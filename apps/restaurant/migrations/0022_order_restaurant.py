@@ -0,0 +1,48 @@
+# Generated by Django 5.2.7 on 2026-10-18 10:26
+
+import django.db.models.deletion
+import django.db.models.functions.comparison
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('authentication', '0005_payment_updated_at'),
+        ('restaurant', '0021_product_search_tenant'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.RemoveConstraint(
+            model_name='salesrollup',
+            name='sales_rollup_key',
+        ),
+        migrations.RemoveIndex(
+            model_name='salesrollup',
+            name='sales_rollup_day',
+        ),
+        migrations.AddField(
+            model_name='order',
+            name='restaurant',
+            field=models.ForeignKey(blank=True, db_index=False, editable=False, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='orders', to='authentication.restaurant'),
+        ),
+        migrations.AddField(
+            model_name='salesrollup',
+            name='restaurant',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='sales_rollups', to='authentication.restaurant'),
+        ),
+        migrations.AddIndex(
+            model_name='order',
+            index=models.Index(fields=['restaurant', 'created_at'], name='order_restaurant_created'),
+        ),
+        migrations.AddIndex(
+            model_name='salesrollup',
+            index=models.Index(fields=['day', 'restaurant'], name='sales_rollup_day'),
+        ),
+        migrations.AddConstraint(
+            model_name='salesrollup',
+            constraint=models.UniqueConstraint(django.db.models.functions.comparison.Coalesce('restaurant', models.Value(0)), models.F('bucket'), models.F('status'), name='sales_rollup_key'),
+        ),
+    ]
@@ -0,0 +1,24 @@
+# Generated by Django 5.2.7 on 2026-10-18 11:54
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('restaurant', '0022_order_restaurant'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RollupDirtyHour',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('source', models.CharField(max_length=50)),
+                ('bucket', models.DateTimeField(help_text='Start of the hour')),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('source', 'bucket'), name='rollup_dirty_hour_key')],
+            },
+        ),
+    ]
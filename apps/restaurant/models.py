@@ -1,73 +1,363 @@
-from django.db import models
+import re
+from functools import partial, reduce
+from operator import or_
+from django.db import IntegrityError, models, transaction
+from django.db.models import Case, F, Q, Value, When, Window
+from django.db.models.fields.files import FieldFile
+from django.db.models.functions import Cast, Coalesce, Greatest, Round, RowNumber
 from django.utils import timezone
 from django.utils.text import slugify
 from django.core.validators import MinValueValidator, MaxValueValidator
+from core.transactions import write_atomic
 from apps.authentication.models import *
+from apps.restaurant.ranking import rank_between, rank_sequence, REBALANCE_LENGTH
+from apps.restaurant import cascades, tenancy
+from apps.restaurant.tenancy import TenantManager, TenantQuerySet
+
+# ============================================================
+# CHANGE TRACKING
+# ============================================================
+class TrackedModel(models.Model):
+    """
+    Remembers the column values a row was loaded with, so save() and
+    post_save receivers can skip work whose inputs did not change.
+    saved_fields holds the attnames written by the save underway (every
+    field for a new row), and stays set for post_save receivers.
+    """
+    saved_fields = frozenset()
+
+    class Meta:
+        abstract = True
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance._loaded_values = dict(zip(field_names, values))
+        return instance
+
+    def refresh_from_db(self, using=None, fields=None, from_queryset=None):
+        super().refresh_from_db(using, fields, from_queryset)
+        self.remember_values(fields)
+
+    def remember_values(self, fields=None):
+        loaded = self.__dict__.setdefault("_loaded_values", {})
+        for field in self._meta.concrete_fields:
+            if field.attname in self.__dict__ and (fields is None or field.name in fields or field.attname in fields):
+                loaded[field.attname] = comparable(self.__dict__[field.attname])
+
+    def dirty_fields(self):
+        """
+        Attnames whose value differs from the loaded one; every concrete
+        field for a row that is not in the database yet. Columns never
+        loaded (deferred) and never assigned do not count.
+        """
+        if self._state.adding:
+            return {field.attname for field in self._meta.concrete_fields}
+        loaded = self.__dict__.get("_loaded_values", {})
+        dirty = set()
+        for field in self._meta.concrete_fields:
+            if field.attname not in self.__dict__:
+                continue
+            value = self.__dict__[field.attname]
+            if field.attname not in loaded or comparable(value) != loaded[field.attname] or getattr(value, "_committed", True) is False:
+                dirty.add(field.attname)
+        return dirty
+
+    def save(self, *args, **kwargs):
+        dirty = self.dirty_fields()
+        update_fields = kwargs.get("update_fields")
+        if update_fields is not None:
+            dirty &= {self._meta.get_field(name).attname for name in update_fields}
+        self.saved_fields = frozenset(dirty)
+        super().save(*args, **kwargs)
+        self.remember_values(update_fields)
+
+
+def comparable(value):
+    # FieldFile compares by name; keep the name rather than the file object
+    return value.name if isinstance(value, FieldFile) else value
+
+# ============================================================
+# TENANCY — catalog rows belong to a restaurant (see tenancy.py)
+# ============================================================
+class TenantModel(TrackedModel):
+    """
+    A catalog row owned by one restaurant; no restaurant is the default
+    catalog. objects only sees the active restaurant's rows, all_objects
+    sees every restaurant's. A row under a parent (tenant_parent) takes the
+    parent's restaurant; any other row takes the active one when created.
+    Subclasses index restaurant as the leading column themselves.
+    """
+    tenant_parent = None
+    restaurant = models.ForeignKey(Restaurant, on_delete=models.CASCADE, null=True, blank=True, editable=False,
+                                   db_index=False, related_name="+")
+
+    objects = TenantManager()
+    all_objects = models.Manager.from_queryset(TenantQuerySet)()
+
+    class Meta:
+        abstract = True
+
+    def assign_restaurant(self):
+        if self.tenant_parent:
+            if self._state.adding or f"{self.tenant_parent}_id" in self.dirty_fields():
+                parent = getattr(self, self.tenant_parent)
+                self.restaurant_id = parent.restaurant_id if parent else None
+        elif self._state.adding and self.restaurant_id is None:
+            self.restaurant_id = tenancy.current()
+
+    def save(self, *args, **kwargs):
+        self.assign_restaurant()
+        super().save(*args, **kwargs)
+
+# ============================================================
+# RANKED ORDERING
+# ============================================================
+class RankedQuerySet(TenantQuerySet):
+    def with_display_order(self):
+        # 1-based position inside each sibling group, computed by the database
+        scope = [F(f) for f in self.model.rank_scope]
+        return self.annotate(position=Window(RowNumber(), partition_by=scope or None, order_by=[F("rank"), F("id")]))
+
+# Above this many sibling groups, positions are read for the whole table
+SPARSE_SCOPE_LIMIT = 50
+
+class RankedModel(TenantModel):
+    """
+    Orders rows by a fractional rank key instead of a dense integer column,
+    so placing a row never rewrites its siblings. display_order is exposed as
+    the 1-based position inside the sibling group defined by rank_scope.
+    """
+    rank_scope = ()
+    rank = models.CharField(max_length=64, blank=True, default="", db_index=True, editable=False)
+
+    objects = TenantManager.from_queryset(RankedQuerySet)()
+    # Sibling groups are already inside one restaurant
+    all_objects = RankedQuerySet.as_manager()
+
+    class Meta:
+        abstract = True
+
+    def rank_siblings(self):
+        return type(self).all_objects.filter(**self.rank_scope_values())
+
+    @property
+    def display_order(self):
+        if "position" not in self.__dict__:
+            if not self.pk:
+                return None
+            before = Q(rank__lt=self.rank) | Q(rank=self.rank, id__lt=self.pk)
+            self.position = self.rank_siblings().filter(before).count() + 1
+        return self.position
+
+    @display_order.setter
+    def display_order(self, value):
+        # Requested position; applied to the rank key on the next save()
+        self._requested_order = int(value) if value else None
+
+    @classmethod
+    def assign_positions(cls, rows):
+        """
+        Sets display_order on a contiguous (rank, id) ordered slice of rows,
+        e.g. one keyset page, with a single conditional-count query.
+        """
+        first = {}
+        for row in rows:
+            first.setdefault(tuple(row.rank_scope_values().values()), row)
+        counts = cls.all_objects.aggregate(**{
+            f"g{i}": models.Count("id", filter=Q(**row.rank_scope_values()) & (Q(rank__lt=row.rank) | Q(rank=row.rank, id__lt=row.pk)))
+            for i, row in enumerate(first.values())
+        }) if first else {}
+        offsets = {key: counts[f"g{i}"] for i, key in enumerate(first)}
+        for row in rows:
+            key = tuple(row.rank_scope_values().values())
+            offsets[key] += 1
+            row.position = offsets[key]
+        return rows
+
+    @classmethod
+    def assign_sparse_positions(cls, rows):
+        """
+        Sets display_order on rows that are not a contiguous slice, e.g. a
+        filtered list, by reading the positions of their whole sibling groups.
+        """
+        groups = {tuple(row.rank_scope_values().items()) for row in rows}
+        # rows come from one request's catalog, so its tenant index bounds the read
+        qs = cls.objects.all()
+        if groups and len(groups) <= SPARSE_SCOPE_LIMIT:
+            qs = qs.filter(reduce(or_, (Q(**dict(group)) for group in groups)))
+        positions = dict(qs.with_display_order().values_list("id", "position")) if groups else {}
+        for row in rows:
+            row.position = positions[row.pk]
+        return rows
+
+    def place(self, position=None):
+        """
+        Picks a rank for this row from its neighbours at the requested
+        position, or after the last sibling when no position is given.
+        """
+        siblings = self.rank_siblings().exclude(pk=self.pk) if self.pk else self.rank_siblings()
+        neighbours = []
+        if position:
+            neighbours = list(siblings.order_by("rank", "id").values_list("rank", flat=True)[max(position - 2, 0):position])
+        if position == 1:
+            lo, hi = None, (neighbours or [None])[0]
+        elif neighbours:
+            lo, hi = (neighbours + [None])[:2]
+        else:
+            lo, hi = siblings.aggregate(models.Max("rank"))["rank__max"], None
+        if lo and hi and lo >= hi:
+            # Duplicate keys left behind by concurrent writers: respace, then retry
+            type(self).rebalance(**self.rank_scope_values())
+            return self.place(position)
+        self.rank = rank_between(lo, hi)
+        self.__dict__.pop("position", None)
+
+    def rank_scope_values(self):
+        return {f: getattr(self, f) for f in self.rank_scope}
+
+    def save(self, *args, **kwargs):
+        # The restaurant is part of a main category's sibling group
+        self.assign_restaurant()
+        position = self.__dict__.pop("_requested_order", None)
+        moved = not self._state.adding and not self.dirty_fields().isdisjoint(self.rank_scope)
+        if position and not self._state.adding and not moved and position == self.display_order:
+            # Forms send display_order back unchanged on every edit
+            position = None
+        if position or not self.rank or moved:
+            self.place(position)
+        super().save(*args, **kwargs)
+        if len(self.rank) > REBALANCE_LENGTH:
+            transaction.on_commit(partial(type(self).rebalance, **self.rank_scope_values()))
+
+    @classmethod
+    def rebalance(cls, **scope):
+        """
+        Respaces the ranks of one sibling group evenly. Touches every row of
+        the group, so it only runs when keys grow long or from the
+        rebalance_ranks command.
+        """
+        rows = list(cls.all_objects.filter(**scope).order_by("rank", "id").only("id", "rank"))
+        cls.respace(rows)
+        return len(rows)
+
+    @classmethod
+    def reorder(cls, ids, **scope):
+        """
+        Applies a full ordering of one sibling group, given as a list of ids,
+        in a single bulk UPDATE.
+        """
+        with write_atomic():
+            rows = {row.id: row for row in cls.objects.select_for_update().filter(**scope).only("id", "rank")}
+            if len(ids) != len(set(ids)) or set(ids) != set(rows):
+                raise ValueError("ids must list every row of the group exactly once")
+            cls.respace([rows[i] for i in ids])
+            CatalogVersion.bump(tenancy.current())
+        return ids
+
+    @classmethod
+    def respace(cls, rows):
+        for row, key in zip(rows, rank_sequence(len(rows))):
+            row.rank = key
+        cls.all_objects.bulk_update(rows, ["rank"])
+
+# ============================================================
+# CATALOG VERSION
+# ============================================================
+class CatalogVersion(models.Model):
+    """
+    Counter bumped on every catalog write, one row per restaurant (and one
+    for the default catalog). Cached menu snapshots and offer indexes are
+    keyed by it, so a bump invalidates that restaurant's copies in every
+    process at once and leaves other restaurants' alone.
+    """
+    restaurant = models.ForeignKey(Restaurant, on_delete=models.CASCADE, null=True, blank=True, related_name="+")
+    version = models.PositiveBigIntegerField(default=1)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        constraints = [models.UniqueConstraint(Coalesce("restaurant", Value(0)), name="catalog_version_restaurant")]
+
+    @classmethod
+    def current(cls, restaurant_id=None):
+        version = cls.objects.filter(restaurant_id=restaurant_id).values_list("version", flat=True).first()
+        return version if version is not None else cls.objects.get_or_create(restaurant_id=restaurant_id)[0].version
+
+    @classmethod
+    def bump(cls, restaurant_id=None):
+        if not cls.objects.filter(restaurant_id=restaurant_id).update(version=F("version") + 1, updated_at=timezone.now()):
+            cls.objects.get_or_create(restaurant_id=restaurant_id)
 
 # ============================================================
 # CATEGORY MODELS
 # ============================================================
-class MainCategory(models.Model):
-    name = models.CharField(max_length=120, unique=True)
+class MainCategory(RankedModel):
+    rank_scope = ("restaurant_id",)
+    name = models.CharField(max_length=120)
     description = models.TextField(blank=True, null=True)
     is_active = models.BooleanField(default=True)
-    display_order = models.PositiveIntegerField(blank=True, null=True)
     created_at = models.DateTimeField(default=timezone.now)
 
     def save(self, *args, **kwargs):
-        # Auto assign display order
-        if not self.display_order:
-            max_order = MainCategory.objects.aggregate(models.Max("display_order"))["display_order__max"] or 0
-            self.display_order = max_order + 1
+        adding = self._state.adding
         super().save(*args, **kwargs)
-        # Ensure continuous order
-        for i, o in enumerate(MainCategory.objects.order_by("display_order", "id"), 1):
-            if o.display_order != i:
-                MainCategory.objects.filter(id=o.id).update(display_order=i)
-        # Cascade status
-        self.subcategories.update(is_active=self.is_active)
-        ProductItem.objects.filter(main_category=self).update(is_active=self.is_active)
+        # Cascade status, only when it changed and only to rows that differ
+        if not adding and "is_active" in self.saved_fields:
+            rows = SubCategory.all_objects.filter(main_category=self).exclude(is_active=self.is_active).update(is_active=self.is_active)
+            rows += ProductItem.all_objects.filter(main_category=self).exclude(is_active=self.is_active).update(is_active=self.is_active)
+            cascades.record("main_category.is_active", rows)
 
     class Meta:
-        ordering = ["display_order", "id"]
+        ordering = ["rank", "id"]
+        constraints = [
+            models.UniqueConstraint(fields=["restaurant", "name"], name="main_category_name"),
+            models.UniqueConstraint(fields=["name"], condition=Q(restaurant__isnull=True), name="main_category_default_name"),
+        ]
+        indexes = [models.Index(fields=["restaurant", "rank", "id"], name="main_category_tenant_rank")]
 
     def __str__(self): return self.name
 
-class SubCategory(models.Model):
+class SubCategory(RankedModel):
+    tenant_parent = "main_category"
+    rank_scope = ("main_category_id",)
     main_category = models.ForeignKey(MainCategory, on_delete=models.CASCADE, related_name="subcategories")
     name = models.CharField(max_length=120)
     description = models.TextField(blank=True, null=True)
     is_active = models.BooleanField(default=True)
-    display_order = models.PositiveIntegerField(blank=True, null=True)
 
     def save(self, *args, **kwargs):
-        if not self.display_order:
-            qs = SubCategory.objects.filter(main_category=self.main_category)
-            max_order = qs.aggregate(models.Max("display_order"))["display_order__max"] or 0
-            self.display_order = max_order + 1
+        adding = self._state.adding
         super().save(*args, **kwargs)
-        for i, o in enumerate(SubCategory.objects.filter(main_category=self.main_category).order_by("display_order", "id"), 1):
-            if o.display_order != i: SubCategory.objects.filter(id=o.id).update(display_order=i)
-        self.products.update(is_active=self.is_active)
+        if not adding and "is_active" in self.saved_fields:
+            cascades.record("sub_category.is_active", ProductItem.all_objects.filter(sub_category=self).exclude(is_active=self.is_active).update(is_active=self.is_active))
 
     class Meta:
         unique_together = ("main_category", "name")
-        ordering = ["display_order", "id"]
+        ordering = ["rank", "id"]
+        indexes = [models.Index(fields=["restaurant", "main_category", "rank", "id"], name="sub_category_tenant_rank")]
 
     def __str__(self): return f"{self.main_category.name} → {self.name}"
 
 # ============================================================
 # OFFERS MODEL
 # ============================================================
-class Offer(models.Model):
+class Offer(TenantModel):
     OFFER_TYPE_CHOICES = [('flat', 'Flat Discount'), ('percent', 'Percentage Discount')]
-    name = models.CharField(max_length=100, unique=True)
+    name = models.CharField(max_length=100)
     description = models.TextField(blank=True, null=True)
     offer_type = models.CharField(max_length=20, choices=OFFER_TYPE_CHOICES, default='flat')
     discount_value = models.DecimalField(max_digits=8, decimal_places=2)
     active = models.BooleanField(default=True)
     start_date = models.DateTimeField(default=timezone.now)
     end_date = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['restaurant', 'name'], name='offer_name'),
+            models.UniqueConstraint(fields=['name'], condition=Q(restaurant__isnull=True), name='offer_default_name'),
+        ]
+        indexes = [models.Index(fields=['restaurant', 'active', 'start_date'], name='offer_tenant_active')]
+
     def __str__(self): return f"{self.name} ({self.discount_value}{'%' if self.offer_type == 'percent' else ''})"
 
 # ============================================================
@@ -77,12 +367,17 @@ VARIANT_CHOICES = [('Veg','VEG'),('Non-Veg','NON-VEG'),('Eggetarian','EGGETARIAN
 UNIT_CHOICES = [('item','Item'),('pcs','Pieces'),('plate','Plate'),('bowl','Bowl'),('cup','Cup'),
                 ('glass','Glass'),('ml','ml'),('l','Litre'),('g','Gram'),('kg','Kg'),('None','None')]
 CURRENCY_CHOICES = [('$','US Dollar ($)'),('₹','Indian Rupee (₹)'),('€','Euro (€)'),('£','British Pound (£)')]
+SLUG_RETRIES = 3
 
-class ProductItem(models.Model):
+class ProductItem(RankedModel):
+    tenant_parent = "main_category"
+    # Products without a sub category are ordered among the main category's other
+    # products without one, not among all of its products as display_order used to be
+    rank_scope = ("main_category_id", "sub_category_id")
     main_category = models.ForeignKey(MainCategory, on_delete=models.CASCADE, related_name="products")
     sub_category = models.ForeignKey(SubCategory, on_delete=models.SET_NULL, null=True, blank=True, related_name="products")
     name = models.CharField(max_length=150)
-    slug = models.SlugField(max_length=180, unique=True, blank=True)
+    slug = models.SlugField(max_length=180, blank=True, db_index=False)
     description = models.TextField(blank=True, null=True)
     prepare_time = models.PositiveIntegerField(default=10, help_text="Time in minutes")
     variant_type = models.CharField(max_length=20, choices=VARIANT_CHOICES, default='None')
@@ -98,24 +393,87 @@ class ProductItem(models.Model):
     offers = models.ManyToManyField(Offer, blank=True, related_name="products")
     customizations = models.TextField(blank=True, null=True, help_text="Custom options or instructions")
     rating_avg = models.DecimalField(max_digits=3, decimal_places=1, default=0.0)
-    display_order = models.PositiveIntegerField(blank=True, null=True)
+    rating_sum = models.PositiveIntegerField(default=0)
+    rating_count = models.PositiveIntegerField(default=0)
+    rating_1 = models.PositiveIntegerField(default=0, help_text="Number of 1★ reviews")
+    rating_2 = models.PositiveIntegerField(default=0, help_text="Number of 2★ reviews")
+    rating_3 = models.PositiveIntegerField(default=0, help_text="Number of 3★ reviews")
+    rating_4 = models.PositiveIntegerField(default=0, help_text="Number of 4★ reviews")
+    rating_5 = models.PositiveIntegerField(default=0, help_text="Number of 5★ reviews")
     created_by = models.ForeignKey(Users, on_delete=models.SET_NULL, null=True, blank=True, related_name="created_products")
     created_at = models.DateTimeField(default=timezone.now)
     updated_at = models.DateTimeField(auto_now=True)
     image = models.ImageField(upload_to='menu_items/', blank=True, null=True)
     image_alt = models.CharField(max_length=150, blank=True, null=True, help_text="Alternative text for accessibility/SEO")
-
-    class Meta:
-        ordering = ['display_order', 'id']
+    image_derivatives = models.JSONField(default=dict, blank=True, editable=False, help_text="Resized copies built by apps.restaurant.images")
 
     def save(self, *args, **kwargs):
-        if not self.main_category.is_active or (self.sub_category and not self.sub_category.is_active):
-            self.is_active = False
-        base, slug, n = slugify(self.name), slugify(self.name), 1
-        while ProductItem.objects.filter(slug=slug).exclude(id=self.id).exists():
-            slug, n = f"{base}-{n}", n + 1
-        self.slug = slug
+        # Slugs are unique per restaurant, so settle the restaurant first
+        self.assign_restaurant()
+        dirty = self.dirty_fields()
+        # Category status only needs re-reading when the product's status or categories change
+        if self.is_active and not dirty.isdisjoint({"is_active", "main_category_id", "sub_category_id"}):
+            if not self.main_category.is_active or (self.sub_category and not self.sub_category.is_active):
+                self.is_active = False
+        base = slugify(self.name)
+        # Keep an existing slug that still fits the name; the unique index guards it
+        if not self.slug or not re.fullmatch(rf"{re.escape(base)}(-\d+)?", self.slug):
+            self.slug = self.allocate_slug(base)
+            dirty.add("slug")
         if not self.image_alt: self.image_alt = self.name
+        if not dirty.isdisjoint({"image", "slug"}):
+            self.normalize_image_name()
+        for attempt in range(SLUG_RETRIES):
+            try:
+                with transaction.atomic():
+                    super().save(*args, **kwargs)
+                return
+            except IntegrityError:
+                # Lost a race for the slug to a concurrent insert: pick again
+                if attempt == SLUG_RETRIES - 1 or not self.same_restaurant().filter(slug=self.slug).exclude(id=self.id).exists():
+                    raise
+                self.slug = self.allocate_slug(base)
+
+    @classmethod
+    def apply_rating(cls, product_id, added=None, removed=None):
+        """
+        Adds and/or removes one star rating from the running counters with a
+        single UPDATE, so concurrent reviews never overwrite each other.
+        """
+        stars = {}
+        for star, delta in ((added, 1), (removed, -1)):
+            if star:
+                stars[star] = stars.get(star, 0) + delta
+        d_sum, d_count = sum(star * delta for star, delta in stars.items()), sum(stars.values())
+        changes = {f"rating_{star}": Greatest(F(f"rating_{star}") + delta, 0) for star, delta in stars.items()}
+        count = F("rating_count") + d_count
+        changes.update(
+            rating_sum=Greatest(F("rating_sum") + d_sum, 0),
+            rating_count=Greatest(count, 0),
+            rating_avg=Case(When(Q(rating_count__lte=-d_count), then=Value(0.0)),
+                            default=Round(Cast(F("rating_sum") + d_sum, models.FloatField()) / count, 1),
+                            output_field=models.FloatField()),
+        )
+        cls.all_objects.filter(pk=product_id).update(**changes)
+
+    def same_restaurant(self):
+        return ProductItem.all_objects.filter(restaurant_id=self.restaurant_id)
+
+    def allocate_slug(self, base):
+        """
+        Fetches the slugs taken for base with one index range query and
+        returns the lowest free one (base, base-1, base-2, ...). The range
+        also covers longer names (base-masala, ...); the regex keeps those
+        rows out of the result.
+        """
+        numbered = Q(slug__gt=f"{base}-", slug__lt=f"{base}.", slug__regex=rf"^{re.escape(base)}-[0-9]+$")
+        taken = set(self.same_restaurant().filter(Q(slug=base) | numbered).exclude(id=self.id).values_list("slug", flat=True))
+        slug, n = base, 1
+        while slug in taken:
+            slug, n = f"{base}-{n}", n + 1
+        return slug
+
+    def normalize_image_name(self):
         if self.image:
             ext = self.image.name.split('.')[-1].lower()
             clean_name = f"{self.slug}.{ext}"
@@ -127,19 +485,25 @@ class ProductItem(models.Model):
                     self.image.name = f"menu_items/{clean_name}"
                 elif parts[0] == "menu_items" and len(parts) == 2:
                     self.image.name = f"menu_items/{clean_name}"
-        if not self.display_order:
-            qs = ProductItem.objects.filter(main_category=self.main_category)
-            if self.sub_category: qs = qs.filter(sub_category=self.sub_category)
-            max_order = qs.aggregate(models.Max("display_order"))["display_order__max"] or 0
-            self.display_order = max_order + 1
-        super().save(*args, **kwargs)
-        q = ProductItem.objects.filter(main_category=self.main_category)
-        if self.sub_category: q = q.filter(sub_category=self.sub_category)
-        for i, o in enumerate(q.order_by("display_order", "id"), 1):
-            if o.display_order != i: ProductItem.objects.filter(id=o.id).update(display_order=i)
 
     class Meta:
-        ordering = ['display_order', 'id']
+        ordering = ['rank', 'id']
+        constraints = [
+            models.UniqueConstraint(fields=['restaurant', 'slug'], name='product_slug'),
+            models.UniqueConstraint(fields=['slug'], condition=Q(restaurant__isnull=True), name='product_default_slug'),
+        ]
+        indexes = [
+            # Sibling order: rank_siblings(), place() and the display_order window
+            models.Index(fields=['main_category', 'sub_category', 'rank', 'id'], name='product_scope_rank'),
+            # Lists are read one restaurant at a time, in (rank, id) keyset order
+            models.Index(fields=['restaurant', 'rank', 'id'], name='product_tenant_rank'),
+            # Customer-facing reads only ever see active products
+            models.Index(fields=['restaurant', 'main_category', 'sub_category', 'rank'], name='product_tenant_active_rank',
+                         condition=Q(is_active=True)),
+            # Sidebar filters: variant plus price range, and price range over what can be ordered
+            models.Index(fields=['restaurant', 'variant_type', 'price'], name='product_tenant_variant_price'),
+            models.Index(fields=['restaurant', 'price'], name='product_tenant_orderable_price', condition=Q(is_active=True, is_available=True)),
+        ]
     def __str__(self): return f"{self.name} ({self.currency_symbol}{self.price})"
     @property
     def image_url(self): return self.image.url if self.image else None
@@ -147,8 +511,134 @@ class ProductItem(models.Model):
 # ============================================================
 # PRODUCT REVIEW MODEL
 # ============================================================
-class ProductReview(models.Model):
+class ProductReview(TenantModel):
+    tenant_parent = "product"
     product = models.ForeignKey(ProductItem, on_delete=models.CASCADE, related_name='reviews')
     rating = models.PositiveSmallIntegerField(validators=[MinValueValidator(1), MaxValueValidator(5)])
     created_at = models.DateTimeField(default=timezone.now)
+
+    def save(self, *args, **kwargs):
+        # Keep the product's rating counters in step; deletes go through the post_delete signal
+        with write_atomic():
+            old = None if self._state.adding else ProductReview.all_objects.filter(pk=self.pk).values_list("product_id", "rating").first()
+            super().save(*args, **kwargs)
+            if old is None:
+                ProductItem.apply_rating(self.product_id, added=self.rating)
+            elif old[0] == self.product_id and old[1] != self.rating:
+                ProductItem.apply_rating(self.product_id, added=self.rating, removed=old[1])
+            elif old[0] != self.product_id:
+                ProductItem.apply_rating(old[0], removed=old[1])
+                ProductItem.apply_rating(self.product_id, added=self.rating)
+
+    class Meta:
+        indexes = [models.Index(fields=['restaurant', 'product'], name='review_tenant_product')]
+
     def __str__(self): return f"{self.product.name} - {self.rating}★"
+
+# ============================================================
+# ORDER MODELS
+# ============================================================
+class Order(models.Model):
+    STATUS_CHOICES = [('placed', 'Placed'), ('preparing', 'Preparing'), ('ready', 'Ready'),
+                      ('served', 'Served'), ('cancelled', 'Cancelled')]
+    placed_by = models.ForeignKey(Users, on_delete=models.SET_NULL, null=True, blank=True, related_name="orders")
+    # The catalog the order was placed from; None is the default catalog
+    restaurant = models.ForeignKey(Restaurant, on_delete=models.CASCADE, null=True, blank=True, editable=False,
+                                   db_index=False, related_name="orders")
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='placed')
+    notes = models.TextField(blank=True, null=True)
+    subtotal = models.DecimalField(max_digits=12, decimal_places=2, default=0)
+    discount = models.DecimalField(max_digits=12, decimal_places=2, default=0)
+    tax = models.DecimalField(max_digits=12, decimal_places=2, default=0)
+    total = models.DecimalField(max_digits=12, decimal_places=2, default=0)
+    created_at = models.DateTimeField(default=timezone.now)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        ordering = ['-created_at', '-id']
+        indexes = [models.Index(fields=['placed_by', 'created_at'], name='order_placed_by_created'),
+                   # Sales rollups find orders changed since their watermark, then re-read whole hours
+                   models.Index(fields=['updated_at'], name='order_updated'),
+                   models.Index(fields=['created_at'], name='order_created'),
+                   models.Index(fields=['restaurant', 'created_at'], name='order_restaurant_created')]
+
+    def __str__(self): return f"Order #{self.id} ({self.status})"
+
+class OrderItem(models.Model):
+    """
+    One cart line. Name, prices, tax and prepare time are copied from the
+    product when the order is placed, so later catalog edits never change it.
+    """
+    order = models.ForeignKey(Order, on_delete=models.CASCADE, related_name="items")
+    product = models.ForeignKey(ProductItem, on_delete=models.SET_NULL, null=True, blank=True, related_name="order_items")
+    name = models.CharField(max_length=150)
+    quantity = models.PositiveIntegerField(validators=[MinValueValidator(1)])
+    unit_price = models.DecimalField(max_digits=10, decimal_places=2)
+    unit_discount = models.DecimalField(max_digits=10, decimal_places=2, default=0)
+    applied_offer = models.ForeignKey(Offer, on_delete=models.SET_NULL, null=True, blank=True, related_name="order_items")
+    tax_percentage = models.DecimalField(max_digits=5, decimal_places=2, default=0)
+    unit_tax = models.DecimalField(max_digits=10, decimal_places=2, default=0)
+    line_total = models.DecimalField(max_digits=12, decimal_places=2)
+    prepare_time = models.PositiveIntegerField(default=10, help_text="Time in minutes")
+
+    def __str__(self): return f"{self.quantity} x {self.name}"
+
+# ============================================================
+# REPORTING ROLLUPS — see apps/restaurant/rollups.py
+# ============================================================
+class RollupWatermark(models.Model):
+    """
+    How far each rollup source has been aggregated: rows updated after
+    value are still to be folded in.
+    """
+    source = models.CharField(max_length=50, unique=True)
+    value = models.DateTimeField()
+    refreshed_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self): return f"{self.source} @ {self.value:%Y-%m-%d %H:%M:%S}"
+
+class RollupDirtyHour(models.Model):
+    """
+    An hour a refresh must recompute although no row in it was updated:
+    one created in it was deleted, and a deleted row leaves no updated_at
+    behind. The refresh that recomputes it deletes the mark.
+    """
+    source = models.CharField(max_length=50)
+    bucket = models.DateTimeField(help_text="Start of the hour")
+
+    class Meta:
+        constraints = [models.UniqueConstraint(fields=['source', 'bucket'], name='rollup_dirty_hour_key')]
+
+    def __str__(self): return f"{self.source} @ {self.bucket:%Y-%m-%d %H:00}"
+
+class SalesRollup(models.Model):
+    # Orders of one restaurant (None: the default catalog) created in one hour with one status
+    restaurant = models.ForeignKey(Restaurant, on_delete=models.CASCADE, null=True, blank=True, related_name='sales_rollups')
+    bucket = models.DateTimeField(help_text="Start of the hour")
+    day = models.DateField()
+    status = models.CharField(max_length=20)
+    orders = models.PositiveIntegerField(default=0)
+    items = models.PositiveIntegerField(default=0)
+    subtotal = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    discount = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    tax = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    total = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+
+    class Meta:
+        constraints = [models.UniqueConstraint(Coalesce('restaurant', Value(0)), 'bucket', 'status', name='sales_rollup_key')]
+        indexes = [models.Index(fields=['day', 'restaurant'], name='sales_rollup_day')]
+
+class PaymentRollup(models.Model):
+    # Payments of one restaurant created in one hour, per plan and status
+    restaurant = models.ForeignKey(Restaurant, on_delete=models.CASCADE, related_name='payment_rollups')
+    plan = models.ForeignKey(SubscriptionPlan, on_delete=models.SET_NULL, null=True, blank=True, related_name='payment_rollups')
+    bucket = models.DateTimeField(help_text="Start of the hour")
+    day = models.DateField()
+    status = models.CharField(max_length=50)
+    payments = models.PositiveIntegerField(default=0)
+    amount = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    renewals = models.PositiveIntegerField(default=0, help_text="Successful payments by a restaurant that had paid before")
+
+    class Meta:
+        constraints = [models.UniqueConstraint(fields=['restaurant', 'bucket', 'plan', 'status'], name='payment_rollup_key')]
+        indexes = [models.Index(fields=['day', 'restaurant'], name='payment_rollup_day')]
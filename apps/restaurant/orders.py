@@ -0,0 +1,166 @@
+"""
+Order placement.
+
+A cart is validated against one batched product fetch and priced with the
+current PriceBook. Stock is then taken with a single conditional UPDATE
+(stock_available >= quantity for every line) inside the transaction that
+creates the order, so concurrent orders can never oversell: whichever
+commits second sees the decremented stock and matches fewer rows.
+
+All reads happen before the transaction and its first statement is the
+UPDATE. On SQLite that takes the write lock at once, so concurrent
+placements queue on busy_timeout instead of failing a read-to-write lock
+upgrade. Elsewhere one statement takes every row lock the order needs, so
+two placements never hold some lines each while waiting for the rest.
+"""
+from decimal import Decimal
+from django.db import transaction
+from django.utils import timezone
+from django.db.models import Case, F, IntegerField, Value, When
+from apps.restaurant import tenancy
+from apps.restaurant.models import CatalogVersion, Order, OrderItem, ProductItem
+from apps.restaurant.pricing import PriceBook
+from apps.restaurant.kitchen import publish_ticket
+
+MAX_LINES = 50
+# Status changes the kitchen and floor staff may make
+TRANSITIONS = {
+    'placed': ('preparing', 'cancelled'),
+    'preparing': ('ready', 'cancelled'),
+    'ready': ('served',),
+}
+PRODUCT_COLUMNS = ('id', 'name', 'price', 'tax_percentage', 'prepare_time', 'stock_available',
+                   'max_order_quantity', 'is_active', 'is_available')
+
+
+class OrderRejected(Exception):
+    """
+    Raised with {field: [messages]} (cart lines keyed by product id) when
+    an order cannot be placed; nothing has been written.
+    """
+
+    def __init__(self, errors):
+        super().__init__(errors)
+        self.errors = errors
+
+
+def merge_lines(lines):
+    # Same product on two lines counts once against stock and max_order_quantity
+    quantities = {}
+    for line in lines:
+        quantities[line['product']] = quantities.get(line['product'], 0) + line['quantity']
+    return dict(sorted(quantities.items()))
+
+
+def check_lines(quantities, products):
+    errors = {}
+    for product_id, quantity in quantities.items():
+        product = products.get(product_id)
+        if product is None:
+            problem = "Product does not exist."
+        elif not product['is_active'] or not product['is_available']:
+            problem = f"{product['name']} is not available."
+        elif quantity > product['max_order_quantity']:
+            problem = f"At most {product['max_order_quantity']} of {product['name']} per order."
+        elif quantity > product['stock_available']:
+            problem = f"Only {product['stock_available']} of {product['name']} left."
+        else:
+            continue
+        errors[str(product_id)] = [problem]
+    return errors
+
+
+def price_lines(quantities, products, book):
+    items, totals = [], dict.fromkeys(('subtotal', 'discount', 'tax'), Decimal('0.00'))
+    for product_id, quantity in quantities.items():
+        product = products[product_id]
+        quote = book.quote_price(product_id, product['price'], product['tax_percentage'])
+        unit_price, unit_discount, unit_tax = Decimal(quote['base_price']), Decimal(quote['discount']), Decimal(quote['tax'])
+        items.append(OrderItem(
+            product_id=product_id, name=product['name'], quantity=quantity, unit_price=unit_price,
+            unit_discount=unit_discount, applied_offer_id=quote['applied_offer'],
+            tax_percentage=product['tax_percentage'], unit_tax=unit_tax,
+            line_total=(unit_price - unit_discount + unit_tax) * quantity, prepare_time=product['prepare_time'],
+        ))
+        totals['subtotal'] += unit_price * quantity
+        totals['discount'] += unit_discount * quantity
+        totals['tax'] += unit_tax * quantity
+    totals['total'] = totals['subtotal'] - totals['discount'] + totals['tax']
+    return items, totals
+
+
+def take_stock(quantities):
+    """
+    Decrements stock for every line with one UPDATE and returns the number
+    of products it matched; fewer than len(quantities) means a shortfall.
+    """
+    wanted = Case(*[When(id=pid, then=Value(qty)) for pid, qty in quantities.items()], output_field=IntegerField())
+    return ProductItem.objects.filter(id__in=list(quantities), stock_available__gte=wanted,
+                                      is_active=True, is_available=True).update(stock_available=F('stock_available') - wanted)
+
+
+def place_order(user, lines, notes=None):
+    """
+    Places an order for lines ([{'product': id, 'quantity': n}, ...]) and
+    returns it with its items. Raises OrderRejected.
+    """
+    quantities = merge_lines(lines)
+    if not quantities:
+        raise OrderRejected({'items': ["An order needs at least one item."]})
+    if len(quantities) > MAX_LINES:
+        raise OrderRejected({'items': [f"An order can have at most {MAX_LINES} different products."]})
+    products = {p['id']: p for p in ProductItem.objects.filter(id__in=list(quantities)).values(*PRODUCT_COLUMNS)}
+    errors = check_lines(quantities, products)
+    if errors:
+        raise OrderRejected({'items': errors})
+    items, totals = price_lines(quantities, products, PriceBook.current())
+
+    with transaction.atomic():
+        if take_stock(quantities) != len(quantities):
+            # Someone else got there first; re-read to say which lines fell short
+            fresh = {p['id']: p for p in ProductItem.objects.filter(id__in=list(quantities)).values(*PRODUCT_COLUMNS)}
+            raise OrderRejected({'items': check_lines(quantities, fresh) or ["Stock changed, please try again."]})
+        order = Order.objects.create(placed_by_id=user.id if user else None, restaurant_id=tenancy.current(),
+                                     notes=notes, **totals)
+        for item in items:
+            item.order = order
+        OrderItem.objects.bulk_create(items)
+        # Serve order.items.all() from the rows just written, as prefetch_related would
+        cached = order.items.all()
+        cached._result_cache, cached._prefetch_done = items, True
+        order._prefetched_objects_cache = {'items': cached}
+        # Cached menus show stock; refresh them only when something sells out
+        if ProductItem.objects.filter(id__in=list(quantities), stock_available=0).exists():
+            CatalogVersion.bump(tenancy.current())
+        transaction.on_commit(lambda: publish_ticket(order), robust=True)
+    return order
+
+
+def set_status(order_id, status):
+    """
+    Moves an order to status if TRANSITIONS allows it from the status it has
+    now; cancelling puts its stock back. Only the active restaurant's orders
+    are found. Raises OrderRejected.
+    """
+    order = Order.objects.filter(id=order_id, restaurant_id=tenancy.current()).prefetch_related('items').first()
+    if order is None:
+        raise Order.DoesNotExist
+    if status not in TRANSITIONS.get(order.status, ()):
+        raise OrderRejected({'status': [f"Cannot move an order from {order.status} to {status}."]})
+    with transaction.atomic():
+        # Conditional on the status we checked, so two screens cannot both apply a change
+        if not Order.objects.filter(id=order.id, status=order.status).update(status=status, updated_at=timezone.now()):
+            raise OrderRejected({'status': ["The order changed meanwhile, reload it."]})
+        if status == 'cancelled':
+            restock = {item.product_id: item.quantity for item in order.items.all() if item.product_id}
+            if restock:
+                # Staff screens may not name the restaurant, so look products up in every catalog
+                sold_out = set(ProductItem.all_objects.filter(id__in=list(restock), stock_available=0)
+                               .values_list('restaurant_id', flat=True).distinct())
+                back = Case(*[When(id=pid, then=Value(qty)) for pid, qty in restock.items()], output_field=IntegerField())
+                ProductItem.all_objects.filter(id__in=list(restock)).update(stock_available=F('stock_available') + back)
+                for restaurant_id in sold_out:
+                    CatalogVersion.bump(restaurant_id)
+        order.status = status
+        transaction.on_commit(lambda: publish_ticket(order), robust=True)
+    return order
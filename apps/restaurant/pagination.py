@@ -0,0 +1,76 @@
+"""
+Keyset (cursor) pagination for list endpoints. A cursor encodes the sort
+key of the last row of a page, so fetching the next page is an index range
+scan instead of an OFFSET over every earlier row.
+"""
+import base64
+import json
+from django.core.exceptions import ValidationError
+from django.db.models import Q
+
+DEFAULT_LIMIT = 100
+MAX_LIMIT = 500
+
+
+def encode_cursor(values):
+    # str() keeps full microsecond precision for datetimes, unlike DjangoJSONEncoder
+    raw = json.dumps(values, default=str, separators=(',', ':')).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip('=')
+
+
+def decode_cursor(cursor):
+    raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4))
+    values = json.loads(raw)
+    if not isinstance(values, list):
+        raise ValueError("Invalid cursor")
+    return values
+
+
+def wants_page(request):
+    return 'limit' in request.query_params or 'cursor' in request.query_params
+
+
+def after(keys, values):
+    """
+    Builds the WHERE clause selecting rows strictly after values in keys
+    order. keys are field names, prefixed with '-' for descending.
+    """
+    condition, equal = Q(), {}
+    for key, value in zip(keys, values):
+        field = key.lstrip('-')
+        lookup = 'lt' if key.startswith('-') else 'gt'
+        condition |= Q(**equal, **{f"{field}__{lookup}": value})
+        equal[field] = value
+    return condition
+
+
+def keyset_page(request, qs, keys):
+    """
+    Returns (rows, next_cursor) for the page requested by ?limit= and
+    ?cursor=. Raises ValueError for malformed parameters.
+    """
+    limit = request.query_params.get('limit') or DEFAULT_LIMIT
+    if not str(limit).isdigit() or int(limit) < 1:
+        raise ValueError("limit must be a positive integer")
+    limit = min(int(limit), MAX_LIMIT)
+    qs = qs.order_by(*keys)
+    cursor = request.query_params.get('cursor')
+    if cursor:
+        fields = [qs.model._meta.get_field(k.lstrip('-')) for k in keys]
+        try:
+            values = decode_cursor(cursor)
+            if len(values) != len(keys):
+                raise ValueError
+            values = [f.to_python(v) for f, v in zip(fields, values)]
+        except (ValueError, TypeError, ValidationError):
+            # TypeError: a value of the wrong JSON type, e.g. a number for a datetime key
+            raise ValueError("Invalid cursor")
+        qs = qs.filter(after(keys, values))
+    rows = list(qs[:limit + 1])
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        last = rows[-1]
+        # rows may be model instances or .values() dicts
+        next_cursor = encode_cursor([last[k.lstrip('-')] if isinstance(last, dict) else getattr(last, k.lstrip('-')) for k in keys])
+    return rows, next_cursor
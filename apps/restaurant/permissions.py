@@ -0,0 +1,24 @@
+"""
+Restaurant membership checks for DRF views.
+
+TenantMiddleware activates the restaurant a request names before DRF has
+authenticated it, so it cannot tell who is asking. These permissions run
+after authentication and refuse a request on another restaurant's catalog
+unless the user is staff, its owner or one of its members.
+"""
+from rest_framework.permissions import SAFE_METHODS, BasePermission
+from apps.restaurant import tenancy
+
+
+class IsRestaurantMember(BasePermission):
+    # A dict, so the 403 body has the same shape as the views' own errors
+    message = {"errors": {"restaurant": ["You do not work at this restaurant."]}}
+
+    def has_permission(self, request, view):
+        return tenancy.can_access(request.user, tenancy.current())
+
+
+class IsRestaurantMemberOrReadOnly(IsRestaurantMember):
+    # Lists that anyone signed in may read but only the restaurant's people may add to
+    def has_permission(self, request, view):
+        return request.method in SAFE_METHODS or super().has_permission(request, view)
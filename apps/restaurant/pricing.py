@@ -0,0 +1,135 @@
+"""
+Server-side pricing: effective price, discount and tax for products, using
+an in-memory interval index of offers.
+
+The index is loaded once per restaurant and catalog version. Offer
+start/end dates split time into segments; the set of running offers only
+changes at a segment boundary, so it is computed once per segment rather
+than per request.
+"""
+import threading
+from bisect import bisect_right
+from collections import OrderedDict
+from decimal import Decimal, ROUND_HALF_UP
+from django.conf import settings
+from django.utils import timezone
+from apps.restaurant import tenancy
+from apps.restaurant.models import CatalogVersion, ProductItem
+
+CENT = Decimal('0.01')
+
+
+class OfferIndex:
+    def __init__(self, restaurant_id, version):
+        self.restaurant_id = restaurant_id
+        self.version = version
+        # One query: the product links of the restaurant's active offers, with the offers
+        # (an offer on no product prices nothing)
+        links = (ProductItem.offers.through.objects.filter(offer__restaurant_id=restaurant_id, offer__active=True)
+                 .select_related('offer').order_by('offer_id'))
+        offers, self.by_product = {}, {}
+        for link in links:
+            offer = offers.setdefault(link.offer_id, link.offer)
+            self.by_product.setdefault(link.productitem_id, []).append(offer)
+        self.boundaries = sorted({o.start_date for o in offers.values()} | {o.end_date for o in offers.values() if o.end_date})
+        self.segments = {}
+        self.lock = threading.Lock()
+
+    def segment(self, when):
+        return bisect_right(self.boundaries, when)
+
+    def running(self, when):
+        """
+        Returns {product_id: [offers running at when]}, computed once per segment.
+        """
+        seg = self.segment(when)
+        running = self.segments.get(seg)
+        if running is None:
+            running = {}
+            for product_id, offers in self.by_product.items():
+                live = [o for o in offers if o.start_date <= when and (o.end_date is None or when < o.end_date)]
+                if live:
+                    running[product_id] = live
+            with self.lock:
+                self.segments[seg] = running
+        return running
+
+
+# Restaurant id -> its latest OfferIndex, least recently priced first
+_indexes = OrderedDict()
+_index_lock = threading.Lock()
+
+
+def get_offer_index(restaurant_id, version):
+    index = _indexes.get(restaurant_id)
+    if index is None or index.version != version:
+        with _index_lock:
+            index = _indexes.get(restaurant_id)
+            if index is None or index.version != version:
+                index = _indexes[restaurant_id] = OfferIndex(restaurant_id, version)
+            _indexes.move_to_end(restaurant_id)
+            # Restaurants not priced lately are reloaded on their next request
+            while len(_indexes) > settings.OFFER_INDEX_RESTAURANTS:
+                _indexes.popitem(last=False)
+    return index
+
+
+def offer_discount(offer, price):
+    if offer.offer_type == 'percent':
+        amount = price * offer.discount_value / 100
+    else:
+        amount = offer.discount_value
+    return min(amount, price).quantize(CENT, ROUND_HALF_UP)
+
+
+class PriceBook:
+    """
+    Prices products at one instant, with the active restaurant's offers. Usage:
+        book = PriceBook.current()
+        book.quote(product) / book.quote_many(products) / book.quote_price(id, price, tax)
+    The best single running offer applies; tax is charged on the discounted price.
+    """
+
+    def __init__(self, index, when):
+        self.index = index
+        self.when = when
+        self.running = index.running(when)
+
+    @classmethod
+    def current(cls, version=None):
+        restaurant_id = tenancy.current()
+        version = CatalogVersion.current(restaurant_id) if version is None else version
+        return cls(get_offer_index(restaurant_id, version), timezone.now())
+
+    @property
+    def restaurant_id(self):
+        return self.index.restaurant_id
+
+    @property
+    def epoch(self):
+        # Changes whenever the catalog changes or an offer window opens or closes
+        return f"{self.index.version}.{self.index.segment(self.when)}"
+
+    def quote(self, product):
+        return self.quote_price(product.id, product.price, product.tax_percentage)
+
+    def quote_price(self, product_id, price, tax_percentage):
+        price = Decimal(price)
+        discount, applied = Decimal('0.00'), None
+        for offer in self.running.get(product_id, ()):
+            amount = offer_discount(offer, price)
+            if amount > discount:
+                discount, applied = amount, offer
+        net = price - discount
+        tax = (net * Decimal(tax_percentage) / 100).quantize(CENT, ROUND_HALF_UP)
+        return {
+            'base_price': f"{price:.2f}",
+            'discount': f"{discount:.2f}",
+            'applied_offer': applied.id if applied else None,
+            'net_price': f"{net:.2f}",
+            'tax': f"{tax:.2f}",
+            'total_price': f"{net + tax:.2f}",
+        }
+
+    def quote_many(self, products):
+        return {p.id: self.quote(p) for p in products}
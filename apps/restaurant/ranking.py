@@ -0,0 +1,56 @@
+"""
+Fractional rank keys used to order catalog rows.
+
+A rank is a base-36 fraction written without the leading "0." and without
+trailing zeros, so plain string comparison matches numeric order. A new key
+can always be generated between two neighbours, which lets an insert or a
+move touch only the row being placed.
+"""
+DIGITS = "0123456789abcdefghijklmnopqrstuvwxyz"
+BASE = len(DIGITS)
+
+# Keys longer than this get their sibling group respaced by rebalance().
+REBALANCE_LENGTH = 12
+
+
+def rank_between(lo=None, hi=None):
+    """
+    Returns a rank strictly between lo and hi. None (or '') means open ended.
+    """
+    lo, hi = lo or "", hi or None
+    if hi is not None and lo >= hi:
+        raise ValueError(f"rank_between: {lo!r} is not lower than {hi!r}")
+    key, i = [], 0
+    while True:
+        a = DIGITS.index(lo[i]) if i < len(lo) else 0
+        b = DIGITS.index(hi[i]) if hi is not None and i < len(hi) else BASE
+        if a == b:
+            key.append(DIGITS[a])
+        elif b - a > 1:
+            key.append(DIGITS[(a + b) // 2])
+            return "".join(key)
+        else:
+            # Adjacent digits: keep lo's digit, anything after it is below hi.
+            key.append(DIGITS[a])
+            hi = None
+        i += 1
+
+
+def rank_sequence(count, lo=None, hi=None):
+    """
+    Returns count evenly spaced, strictly increasing ranks, placed between
+    lo and hi when either is given.
+    """
+    prefix = rank_between(lo, hi) if lo or hi else ""
+    width = 1
+    while BASE ** width <= count * 4:
+        width += 1
+    span = BASE ** width
+    keys = []
+    for n in range(1, count + 1):
+        value, digits = span * n // (count + 1), []
+        for _ in range(width):
+            value, d = divmod(value, BASE)
+            digits.append(DIGITS[d])
+        keys.append(prefix + "".join(reversed(digits)).rstrip("0"))
+    return keys
@@ -0,0 +1,217 @@
+"""
+Reporting rollups for the owner dashboards.
+
+SalesRollup holds orders per restaurant, hour and status. PaymentRollup
+holds payments per restaurant, hour, plan and status. Both are keyed by the
+hour a row was created in, and the report endpoints read nothing else.
+
+refresh() is incremental. Each source keeps a RollupWatermark. A refresh
+looks up the rows updated since the watermark: new rows, and also orders
+or payments whose status changed after creation. It recomputes only the
+hours those rows were created in from the raw table, replaces those
+buckets, and moves the watermark. Rows touched in the last
+ROLLUP_LAG_SECONDS wait for the next run, so a transaction still
+committing is not skipped. Deleted rows leave nothing to find, so
+signals.py marks their hours in RollupDirtyHour and the next refresh
+recomputes those too. rebuild() recomputes everything, or everything
+from a date, for backfills (`python manage.py rebuild_rollups`).
+"""
+from datetime import datetime, time, timedelta, timezone as dt_timezone
+from django.conf import settings
+from django.db.models import Count, Exists, F, OuterRef, Q, Sum
+from django.db.models.functions import TruncHour
+from django.utils import timezone
+from core.transactions import write_atomic
+from apps.restaurant.models import (Order, OrderItem, PaymentRollup, PaymentTransaction, Restaurant, RollupDirtyHour,
+                                    RollupWatermark, SalesRollup)
+
+HOUR = timedelta(hours=1)
+REPORT_ROLES = ('admin', 'client', 'manager')
+REBUILD_SPAN = timedelta(days=31)
+
+
+def is_report_user(user):
+    if user.is_staff or user.is_superuser:
+        return True
+    return user.role is not None and user.role.role_category in REPORT_ROLES
+
+
+def local_day(bucket):
+    return timezone.localtime(bucket).date()
+
+
+# ============================================================
+# AGGREGATION — raw rows to rollup rows
+# ============================================================
+def sales_rows(where):
+    orders = Order.objects.filter(where)
+    items = {(row['restaurant_id'], row['bucket'], row['status']): row['items'] for row in
+             OrderItem.objects.filter(order__in=orders.values('id')).annotate(bucket=TruncHour('order__created_at'))
+             .values('bucket', restaurant_id=F('order__restaurant_id'), status=F('order__status'))
+             .annotate(items=Sum('quantity')).order_by()}
+    return [SalesRollup(day=local_day(row['bucket']), items=items.get((row['restaurant_id'], row['bucket'], row['status']), 0), **row)
+            for row in orders.annotate(bucket=TruncHour('created_at')).values('restaurant_id', 'bucket', 'status').order_by()
+            .annotate(orders=Count('id'), subtotal=Sum('subtotal'), discount=Sum('discount'), tax=Sum('tax'), total=Sum('total'))]
+
+
+def payment_rows(where):
+    paid_before = PaymentTransaction.objects.filter(restaurant=OuterRef('restaurant'), payment_status='success',
+                                                    created_at__lt=OuterRef('created_at'))
+    rows = (PaymentTransaction.objects.filter(where).annotate(bucket=TruncHour('created_at'), renewal=Exists(paid_before))
+            .values('restaurant_id', 'plan_id', 'bucket', status=F('payment_status')).order_by()
+            .annotate(payments=Count('id'), amount=Sum('amount'),
+                      renewals=Count('id', filter=Q(payment_status='success', renewal=True))))
+    return [PaymentRollup(day=local_day(row['bucket']), **row) for row in rows]
+
+
+# Source name: (raw model, rollup model, aggregation)
+SOURCES = {
+    'sales': (Order, SalesRollup, sales_rows),
+    'payments': (PaymentTransaction, PaymentRollup, payment_rows),
+}
+
+
+def hour_ranges(hours):
+    # Sorted hour starts merged into [start, end) ranges
+    ranges = []
+    for hour in sorted(hours):
+        if ranges and ranges[-1][1] == hour:
+            ranges[-1][1] = hour + HOUR
+        else:
+            ranges.append([hour, hour + HOUR])
+    return ranges
+
+
+def recompute(source, hours):
+    """
+    Replaces the rollup buckets for hours (aware hour starts) with fresh
+    aggregates of the raw rows created in them. Returns the rows written.
+    """
+    raw, rollup, aggregate = SOURCES[source]
+    written = 0
+    ranges = hour_ranges(hours)
+    chunk = settings.ROLLUP_RANGES_PER_QUERY
+    for start in range(0, len(ranges), chunk):
+        where, buckets = Q(), Q()
+        for lo, hi in ranges[start:start + chunk]:
+            where |= Q(created_at__gte=lo, created_at__lt=hi)
+            buckets |= Q(bucket__gte=lo, bucket__lt=hi)
+        rollup.objects.filter(buckets).delete()
+        written += len(rollup.objects.bulk_create(aggregate(where)))
+    return written
+
+
+# ============================================================
+# REFRESH
+# ============================================================
+def watermark(source):
+    return RollupWatermark.objects.filter(source=source).values_list('value', flat=True).first()
+
+
+def hour_of(moment):
+    # The bucket TruncHour puts a row in
+    return timezone.localtime(moment).replace(minute=0, second=0, microsecond=0)
+
+
+def mark_dirty(source, moments):
+    """
+    Has the next refresh recompute the hours of moments (created_at values
+    of deleted rows).
+    """
+    RollupDirtyHour.objects.bulk_create([RollupDirtyHour(source=source, bucket=hour_of(m)) for m in moments if m],
+                                        ignore_conflicts=True)
+
+
+def refresh(source, upto=None):
+    """
+    Folds rows updated since the watermark, and the hours deleted rows were
+    created in, into the rollups. Returns {'hours': n, 'rows': n, 'watermark': datetime}.
+    """
+    raw = SOURCES[source][0]
+    upto = upto or timezone.now() - timedelta(seconds=settings.ROLLUP_LAG_SECONDS)
+    with write_atomic():
+        mark, created = RollupWatermark.objects.select_for_update().get_or_create(
+            source=source, defaults={'value': datetime.min.replace(tzinfo=dt_timezone.utc)})
+        dirty = dict(RollupDirtyHour.objects.filter(source=source).values_list('id', 'bucket'))
+        if mark.value >= upto and not dirty:
+            return {'hours': 0, 'rows': 0, 'watermark': mark.value}
+        hours = set(dirty.values())
+        if mark.value < upto:
+            hours |= set(raw.objects.filter(updated_at__gt=mark.value, updated_at__lte=upto)
+                         .annotate(bucket=TruncHour('created_at')).values_list('bucket', flat=True).distinct().order_by())
+            mark.value = upto
+            mark.save(update_fields=['value', 'refreshed_at'])
+        rows = recompute(source, hours) if hours else 0
+        if dirty:
+            RollupDirtyHour.objects.filter(id__in=list(dirty)).delete()
+    return {'hours': len(hours), 'rows': rows, 'watermark': mark.value}
+
+
+def rebuild(source, since=None):
+    """
+    Recomputes every bucket from since (a date; None for all history) in
+    REBUILD_SPAN slices, then sets the watermark to now.
+    """
+    raw, rollup, aggregate = SOURCES[source]
+    upto = timezone.now()
+    first = raw.objects.order_by('created_at').values_list('created_at', flat=True).first()
+    start = timezone.make_aware(datetime.combine(since, time.min)) if since else first
+    written = 0
+    with write_atomic():
+        RollupWatermark.objects.select_for_update().filter(source=source).first()
+        rollup.objects.filter(bucket__gte=start).delete() if since else rollup.objects.all().delete()
+        dirty = RollupDirtyHour.objects.filter(source=source)
+        (dirty.filter(bucket__gte=start) if since else dirty).delete()
+        if start is not None:
+            start = start.replace(minute=0, second=0, microsecond=0)
+            while start <= upto:
+                end = start + REBUILD_SPAN
+                written += len(rollup.objects.bulk_create(aggregate(Q(created_at__gte=start, created_at__lt=end))))
+                start = end
+        RollupWatermark.objects.update_or_create(source=source, defaults={'value': upto})
+    return {'rows': written, 'watermark': upto}
+
+
+# ============================================================
+# REPORTS — read only from the rollup tables
+# ============================================================
+SALES_METRICS = ('orders', 'items', 'subtotal', 'discount', 'tax', 'total')
+PAYMENT_METRICS = ('payments', 'amount', 'renewals')
+MONEY = {'subtotal', 'discount', 'tax', 'total', 'amount'}
+
+
+def report(source, qs, granularity, keys, metrics):
+    period = 'day' if granularity == 'day' else 'bucket'
+    rows = list(qs.values(period, *keys).annotate(**{m: Sum(m) for m in metrics}).order_by(period, *keys))
+    totals = {}
+    for row in rows:
+        row['period'] = row.pop(period)
+        total = totals.setdefault(row['status'], dict.fromkeys(metrics, 0))
+        for m in metrics:
+            total[m] += row[m]
+    # Money as "12.50" strings, like the serializers render prices
+    for row in (*rows, *totals.values()):
+        for m in MONEY.intersection(metrics):
+            row[m] = f"{row[m]:.2f}"
+    return {'granularity': granularity, 'as_of': watermark(source), 'rows': rows, 'totals': totals}
+
+
+def filtered(rollup, filters, user):
+    # Staff see every restaurant; anyone else only the restaurants they own
+    qs = rollup.objects.filter(day__gte=filters['start'], day__lte=filters['end'])
+    if not (user.is_staff or user.is_superuser):
+        qs = qs.filter(restaurant__in=Restaurant.objects.filter(owner=user).values('id'))
+    if filters.get('restaurant'):
+        qs = qs.filter(restaurant_id=filters['restaurant'])
+    if filters.get('status'):
+        qs = qs.filter(status=filters['status'])
+    return qs
+
+
+def sales_report(filters, user):
+    return report('sales', filtered(SalesRollup, filters, user), filters['granularity'], ('restaurant_id', 'status'), SALES_METRICS)
+
+
+def payment_report(filters, user):
+    return report('payments', filtered(PaymentRollup, filters, user), filters['granularity'],
+                  ('restaurant_id', 'plan_id', 'status'), PAYMENT_METRICS)
@@ -0,0 +1,148 @@
+"""
+Full-text menu search backed by an SQLite FTS5 table (product_search, see
+migrations 0016 and 0021). Each row mirrors one ProductItem: name,
+description, customizations and its category names, keyed by the product
+id as rowid. Signals keep it in sync; bulk writers call reindex_products()
+themselves.
+
+The tenant column holds the product's restaurant token (tenancy.partition),
+and every query is ANDed with it, so a search only walks its own
+restaurant's postings.
+
+Other database backends fall back to icontains filters.
+"""
+import re
+from functools import reduce
+from operator import and_
+from django.db import connection
+from django.db.models import Q
+from apps.restaurant import tenancy
+from apps.restaurant.models import MainCategory, SubCategory, ProductItem
+
+SEARCH_TABLE = 'product_search'
+# bm25 column weights: name, description, customizations, categories, tenant
+WEIGHTS = (10.0, 1.0, 1.0, 3.0, 0.0)
+COLUMNS = "rowid, name, description, customizations, categories, tenant"
+TEXT_COLUMNS = "{name description customizations categories}"
+MAX_TERMS = 8
+OVERFETCH = 4
+MIN_PREFIX = 2
+CHUNK = 500
+TOKEN = re.compile(r"\w+")
+
+
+def enabled():
+    return connection.vendor == 'sqlite'
+
+
+def match_expression(query, restaurant_id=tenancy.ALL):
+    # Every term is quoted (no FTS syntax from users) and prefix-matched for type-ahead
+    terms = TOKEN.findall(query.lower())[:MAX_TERMS]
+    if not terms:
+        return ""
+    if len(terms) == 1 and len(terms[0]) < MIN_PREFIX:
+        # A lone first keystroke matches half the catalog; only match names starting with it
+        expression = f'name : ^ "{terms[0]}"*'
+    else:
+        quoted = " ".join(f'"{term}"*' for term in terms)
+        expression = f'{TEXT_COLUMNS} : ({quoted})'
+    if restaurant_id is tenancy.ALL:
+        return expression
+    return f'tenant : "{tenancy.partition(restaurant_id)}" AND {expression}'
+
+
+def index_source(where):
+    return f"""
+        SELECT p.id, p.name, COALESCE(p.description, ''), COALESCE(p.customizations, ''),
+               m.name || ' ' || COALESCE(s.name, ''), 'r' || COALESCE(p.restaurant_id, 0)
+        FROM {ProductItem._meta.db_table} p
+        JOIN {MainCategory._meta.db_table} m ON m.id = p.main_category_id
+        LEFT JOIN {SubCategory._meta.db_table} s ON s.id = p.sub_category_id
+        WHERE {where}"""
+
+
+def reindex(where, params):
+    with connection.cursor() as cursor:
+        cursor.execute(f"DELETE FROM {SEARCH_TABLE} WHERE rowid IN (SELECT p.id FROM {ProductItem._meta.db_table} p WHERE {where})", params)
+        cursor.execute(f"INSERT INTO {SEARCH_TABLE} ({COLUMNS}) {index_source(where)}", params)
+        return cursor.rowcount
+
+
+def reindex_products(ids):
+    if not enabled():
+        return
+    ids = list(ids)
+    for start in range(0, len(ids), CHUNK):
+        chunk = ids[start:start + CHUNK]
+        reindex(f"p.id IN ({', '.join(['%s'] * len(chunk))})", chunk)
+
+
+def reindex_category(main_category_id=None, sub_category_id=None):
+    if not enabled():
+        return
+    if sub_category_id is not None:
+        return reindex("p.sub_category_id = %s", [sub_category_id])
+    return reindex("p.main_category_id = %s", [main_category_id])
+
+
+def remove_products(ids):
+    if not enabled():
+        return
+    ids = list(ids)
+    with connection.cursor() as cursor:
+        for start in range(0, len(ids), CHUNK):
+            chunk = ids[start:start + CHUNK]
+            cursor.execute(f"DELETE FROM {SEARCH_TABLE} WHERE rowid IN ({', '.join(['%s'] * len(chunk))})", chunk)
+
+
+def rebuild_index():
+    if not enabled():
+        return
+    with connection.cursor() as cursor:
+        cursor.execute(f"DELETE FROM {SEARCH_TABLE}")
+        cursor.execute(f"INSERT INTO {SEARCH_TABLE} ({COLUMNS}) {index_source('1 = 1')}")
+
+
+def search_products(query, limit=20, active_only=True, restaurant_id=None):
+    """
+    Returns product ids matching every term of query (prefix match), best
+    match first. Searches the active restaurant's catalog unless
+    restaurant_id is given; tenancy.ALL searches every restaurant.
+    """
+    if restaurant_id is None:
+        restaurant_id = tenancy.current()
+    expression = match_expression(query, restaurant_id)
+    if not expression:
+        return []
+    if not enabled():
+        terms = TOKEN.findall(query)[:MAX_TERMS]
+        qs = ProductItem.all_objects.all()
+        if restaurant_id is not tenancy.ALL:
+            qs = qs.filter(restaurant_id=restaurant_id)
+        qs = qs.filter(reduce(and_, [
+            Q(name__icontains=t) | Q(description__icontains=t) | Q(customizations__icontains=t)
+            | Q(main_category__name__icontains=t) | Q(sub_category__name__icontains=t) for t in terms]))
+        if active_only:
+            qs = qs.filter(is_active=True)
+        return list(qs.order_by('rank', 'id').values_list('id', flat=True)[:limit])
+    # Rank inside the FTS table first and join only the best candidates; inactive
+    # products are rare, so OVERFETCH x limit almost always leaves enough rows
+    bound = limit * OVERFETCH if active_only else limit
+    rows = ranked_rows(expression, bound)
+    if active_only and len(rows) == bound and sum(active for _, active in rows) < limit:
+        # The bound cut off candidates and too many were inactive: rank them all
+        rows = ranked_rows(expression, None)
+    return [product_id for product_id, active in rows if active or not active_only][:limit]
+
+
+def ranked_rows(expression, bound):
+    # (product id, is_active) for the best bound matches, best first; None for every match
+    with connection.cursor() as cursor:
+        cursor.execute(f"""
+            SELECT p.id, p.is_active FROM (
+                SELECT rowid AS id, bm25({SEARCH_TABLE}, {', '.join(map(str, WEIGHTS))}) AS score
+                FROM {SEARCH_TABLE} WHERE {SEARCH_TABLE} MATCH %s ORDER BY score, rowid {"" if bound is None else f"LIMIT {int(bound)}"}
+            ) m
+            JOIN {ProductItem._meta.db_table} p ON p.id = m.id
+            ORDER BY m.score, p.id""", [expression])
+        return cursor.fetchall()
@@ -1,6 +1,69 @@
+from datetime import timedelta
 from rest_framework import serializers
+from django.conf import settings
 from django.contrib.auth import get_user_model
+from django.core.exceptions import FieldDoesNotExist
+from django.core.files.storage import default_storage
+from django.utils import timezone
 from .models import *
+from .pricing import PriceBook
+from .images import derivative_urls
+
+# ============================================================
+# SPARSE FIELDSETS — ?fields=id,name,price
+# ============================================================
+class SparseFieldsMixin:
+    """
+    Renders only the fields passed as fields=[...], and trims a queryset's
+    SELECT list to the columns those fields read. field_sources maps
+    serializer fields to the model columns behind them when the names differ.
+    """
+    field_sources = {}
+
+    def __init__(self, *args, fields=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        if fields:
+            for name in set(self.fields) - set(fields):
+                self.fields.pop(name)
+
+    @classmethod
+    def restrict_queryset(cls, qs, fields):
+        if not fields:
+            return qs
+        columns, related, prefetch = {'id'}, set(), set()
+        for name in fields:
+            for source in cls.field_sources.get(name, [name]):
+                try:
+                    field = qs.model._meta.get_field(source.split('__')[0])
+                except FieldDoesNotExist:
+                    continue
+                if field.many_to_many:
+                    prefetch.add(source)
+                    continue
+                columns.add(source)
+                if '__' in source:
+                    related.add(source.split('__')[0])
+        qs = qs.select_related(None).prefetch_related(None).only(*columns)
+        if related:
+            qs = qs.select_related(*related)
+        return qs.prefetch_related(*prefetch) if prefetch else qs
+
+# ============================================================
+# TENANT UNIQUE NAMES
+# ============================================================
+class CatalogNameMixin:
+    """
+    Names are unique per restaurant. The restaurant column is not a
+    serializer field, so DRF adds no validator for that constraint; this
+    checks the name against the request's catalog (the default manager).
+    """
+    def validate_name(self, value):
+        qs = self.Meta.model.objects.filter(name=value)
+        if self.instance is not None:
+            qs = qs.exclude(pk=self.instance.pk)
+        if qs.exists():
+            raise serializers.ValidationError(f"{self.Meta.model._meta.verbose_name} with this name already exists.")
+        return value
 
 # ============================================================
 # USER SERIALIZER (Basic)
@@ -14,26 +77,29 @@ class UserBasicSerializer(serializers.ModelSerializer):
 # ============================================================
 # MAIN CATEGORY SERIALIZER
 # ============================================================
-class MainCategorySerializer(serializers.ModelSerializer):
+class MainCategorySerializer(CatalogNameMixin, serializers.ModelSerializer):
+    display_order = serializers.IntegerField(required=False, allow_null=True, min_value=0)
     class Meta:
         model = MainCategory
-        fields = '__all__'
+        exclude = ['rank']
         read_only_fields = ['id', 'created_at']
 
 # ============================================================
 # SUB CATEGORY SERIALIZER
 # ============================================================
-class SubCategorySerializer(serializers.ModelSerializer):
+class SubCategorySerializer(SparseFieldsMixin, serializers.ModelSerializer):
+    field_sources = {'main_category_name': ['main_category__name'], 'display_order': ['rank', 'main_category']}
     main_category_name = serializers.CharField(source='main_category.name', read_only=True)
+    display_order = serializers.IntegerField(required=False, allow_null=True, min_value=0)
     class Meta:
         model = SubCategory
-        fields = '__all__'
+        exclude = ['rank']
         read_only_fields = ['id']
 
 # ============================================================
 # OFFER SERIALIZER
 # ============================================================
-class OfferSerializer(serializers.ModelSerializer):
+class OfferSerializer(CatalogNameMixin, serializers.ModelSerializer):
     class Meta:
         model = Offer
         fields = '__all__'
@@ -42,14 +108,22 @@ class OfferSerializer(serializers.ModelSerializer):
 # ============================================================
 # PRODUCT ITEM SERIALIZER
 # ============================================================
-class ProductItemSerializer(serializers.ModelSerializer):
+class ProductItemSerializer(SparseFieldsMixin, serializers.ModelSerializer):
+    field_sources = {'image_url': ['image'], 'display_order': ['rank', 'main_category', 'sub_category'],
+                     'pricing': ['price', 'tax_percentage'], 'image_variants': ['image_derivatives'],
+                     'image_srcset': ['image_derivatives']}
     image_url = serializers.SerializerMethodField()
+    image_variants = serializers.SerializerMethodField()
+    image_srcset = serializers.SerializerMethodField()
+    pricing = serializers.SerializerMethodField()
     image = serializers.ImageField(required=False, allow_null=True, allow_empty_file=True)
+    display_order = serializers.IntegerField(required=False, allow_null=True, min_value=0)
 
     class Meta:
         model = ProductItem
-        fields = '__all__'
-        read_only_fields = ('image_url',)
+        exclude = ['rank', 'image_derivatives']
+        read_only_fields = ('image_url', 'rating_avg', 'rating_sum', 'rating_count',
+                            'rating_1', 'rating_2', 'rating_3', 'rating_4', 'rating_5')
 
     def get_image_url(self, obj):
         request = self.context.get('request')
@@ -57,6 +131,46 @@ class ProductItemSerializer(serializers.ModelSerializer):
             return request.build_absolute_uri(obj.image.url)
         return None
 
+    def get_image_variants(self, obj):
+        request = self.context.get('request')
+        if not obj.image_derivatives:
+            return None
+        return derivative_urls(obj.image_derivatives, lambda path: request.build_absolute_uri(default_storage.url(path)))
+
+    def get_image_srcset(self, obj):
+        variants = self.get_image_variants(obj)
+        if not variants:
+            return None
+        return ", ".join(f"{v['webp']} {v['width']}w" for v in variants.values())
+
+    def get_pricing(self, obj):
+        # One PriceBook per serialization, shared by every row of a list
+        if 'price_book' not in self.context:
+            self.context['price_book'] = PriceBook.current()
+        return self.context['price_book'].quote(obj)
+
+    # Same output from .values() rows, for apps.restaurant.fastpath
+    @staticmethod
+    def row_image_url(row, ctx):
+        return ctx.media_url(row['image']) if row['image'] else None
+
+    @staticmethod
+    def row_image_variants(row, ctx):
+        return derivative_urls(row['image_derivatives'], ctx.media_url) if row['image_derivatives'] else None
+
+    @classmethod
+    def row_image_srcset(cls, row, ctx):
+        variants = cls.row_image_variants(row, ctx)
+        if not variants:
+            return None
+        return ", ".join(f"{v['webp']} {v['width']}w" for v in variants.values())
+
+    @staticmethod
+    def row_pricing(row, ctx):
+        if 'price_book' not in ctx.context:
+            ctx.context['price_book'] = PriceBook.current()
+        return ctx.context['price_book'].quote_price(row['id'], row['price'], row['tax_percentage'])
+
     def create(self, validated_data):
         if not validated_data.get('image_alt'):
             validated_data['image_alt'] = validated_data.get('name', '')
@@ -78,13 +192,85 @@ class ProductItemSerializer(serializers.ModelSerializer):
             validated_data['image_alt'] = validated_data.get('name', instance.name)
         return super().update(instance, validated_data)
 
+# ============================================================
+# PRODUCT FILTERS — ?variant_type=Veg,Vegan&min_price=5&has_offer=true
+# ============================================================
+class CommaListField(serializers.ListField):
+    # Accepts repeated parameters and comma separated values
+    def to_internal_value(self, data):
+        values = [v.strip() for item in data for v in str(item).split(',') if v.strip()]
+        return super().to_internal_value(values)
+
+class OptionalBooleanField(serializers.BooleanField):
+    # BooleanField reads a missing query parameter as False; leave it unset instead
+    default_empty_html = serializers.empty
+
+class ProductFilterSerializer(serializers.Serializer):
+    main_category = serializers.IntegerField(required=False)
+    sub_category = CommaListField(child=serializers.IntegerField(), required=False)
+    variant_type = CommaListField(child=serializers.ChoiceField(choices=VARIANT_CHOICES), required=False)
+    min_price = serializers.DecimalField(max_digits=10, decimal_places=2, required=False)
+    max_price = serializers.DecimalField(max_digits=10, decimal_places=2, required=False)
+    is_available = OptionalBooleanField(required=False)
+    is_active = OptionalBooleanField(required=False)
+    has_offer = OptionalBooleanField(required=False)
+
+    def validate(self, attrs):
+        if attrs.get('min_price') is not None and attrs.get('max_price') is not None and attrs['min_price'] > attrs['max_price']:
+            raise serializers.ValidationError({'max_price': ["max_price must not be below min_price."]})
+        return attrs
+
 # ============================================================
 # PRODUCT REVIEW SERIALIZER
 # ============================================================
-class ProductReviewSerializer(serializers.ModelSerializer):
+class ProductReviewSerializer(SparseFieldsMixin, serializers.ModelSerializer):
+    field_sources = {'product_name': ['product__name']}
     product_name = serializers.CharField(source='product.name', read_only=True)
 
     class Meta:
         model = ProductReview
         fields = '__all__'
         read_only_fields = ['id', 'product_name', 'created_at']
+
+# ============================================================
+# ORDER SERIALIZERS
+# ============================================================
+class OrderLineSerializer(serializers.Serializer):
+    product = serializers.IntegerField()
+    quantity = serializers.IntegerField(min_value=1)
+
+class PlaceOrderSerializer(serializers.Serializer):
+    items = OrderLineSerializer(many=True, allow_empty=False)
+    notes = serializers.CharField(required=False, allow_blank=True, allow_null=True)
+
+class OrderItemSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = OrderItem
+        exclude = ['order']
+
+class OrderSerializer(serializers.ModelSerializer):
+    items = OrderItemSerializer(many=True, read_only=True)
+    class Meta:
+        model = Order
+        fields = '__all__'
+        read_only_fields = ['id', 'placed_by', 'status', 'subtotal', 'discount', 'tax', 'total', 'created_at', 'updated_at']
+
+# ============================================================
+# REPORT QUERY — ?granularity=day&start=2025-01-01&end=2025-01-31
+# ============================================================
+class ReportQuerySerializer(serializers.Serializer):
+    granularity = serializers.ChoiceField(choices=['day', 'hour'], default='day')
+    start = serializers.DateField(required=False)
+    end = serializers.DateField(required=False)
+    status = serializers.CharField(required=False)
+    restaurant = serializers.IntegerField(required=False)
+
+    def validate(self, attrs):
+        attrs.setdefault('end', timezone.localdate())
+        attrs.setdefault('start', attrs['end'] - timedelta(days=6))
+        if attrs['start'] > attrs['end']:
+            raise serializers.ValidationError({'end': ["end must not be before start."]})
+        if (attrs['end'] - attrs['start']).days >= settings.ROLLUP_MAX_DAYS:
+            raise serializers.ValidationError({'start': [f"A report covers at most {settings.ROLLUP_MAX_DAYS} days."]})
+        return attrs
+
@@ -0,0 +1,242 @@
+"""
+Gateway settlement files: upserts PaymentTransaction rows by transaction_id
+in chunks and returns a reconciliation report.
+
+Each chunk is read with one query. Rows that match what is stored are only
+counted, so replaying a file writes nothing. New rows and allowed status
+transitions (pending to success or failed) are written with one
+INSERT ... ON CONFLICT (transaction_id) DO UPDATE. Rows that disagree with
+a settled payment are reported as conflicts and left alone. In the same
+transaction, a successful payment activates or extends the restaurant's
+RestaurantSubscription, and a failed one deactivates the subscription it
+had paid for.
+"""
+import csv
+import json
+import time
+from datetime import timedelta
+from decimal import Decimal, InvalidOperation
+from django.core.exceptions import ValidationError
+from django.db import transaction
+from django.utils import timezone
+from core.transactions import write_atomic
+from apps.authentication.models import PaymentTransaction, Restaurant, RestaurantSubscription, SubscriptionPlan
+from apps.authentication.subscriptions import invalidate
+from apps.restaurant.importer import iter_csv_rows, iter_json_rows
+
+STATUSES = {value for value, _ in PaymentTransaction._meta.get_field('payment_status').choices}
+FINAL = {'success', 'failed'}
+# Written on conflict; restaurant and created_at stay as first recorded
+UPSERT_FIELDS = ['plan', 'amount', 'payment_status', 'payment_method', 'updated_at']
+SUBSCRIPTION_FIELDS = ['plan', 'start_date', 'end_date', 'is_active', 'payment_reference']
+CHANGE_REASON = "settlement import"
+
+
+class SettlementImporter:
+    """
+    Usage: SettlementImporter(user=request.user).run(stream, 'csv')
+    Rows carry transaction_id, restaurant (id), amount, status, and
+    optionally plan (name or id) and method.
+    """
+
+    def __init__(self, user=None, chunk_size=500):
+        self.user = user
+        self.chunk_size = chunk_size
+        self.plans = {}
+        for plan in SubscriptionPlan.objects.all():
+            self.plans[str(plan.id)] = self.plans[plan.name.lower()] = plan
+        self.report = {'rows': 0, 'created': 0, 'updated': 0, 'unchanged': 0, 'failed': 0, 'conflicts': [], 'errors': [],
+                       'subscriptions': {'activated': 0, 'deactivated': 0}, 'totals': {}}
+
+    # ---------------- row parsing ----------------
+    def parse(self, row):
+        errors = {}
+        transaction_id = str(row.get('transaction_id') or '').strip()
+        if not transaction_id:
+            errors['transaction_id'] = ['This field is required.']
+        elif len(transaction_id) > 200:
+            errors['transaction_id'] = ['Ensure this field has no more than 200 characters.']
+        restaurant = str(row.get('restaurant') or '').strip()
+        if not restaurant.isdigit():
+            errors['restaurant'] = ['A restaurant id is required.']
+        try:
+            amount = Decimal(str(row.get('amount', '')).strip()).quantize(Decimal('0.01'))
+            if amount < 0:
+                raise InvalidOperation
+        except InvalidOperation:
+            errors['amount'] = ['A valid non-negative amount is required.']
+        status = str(row.get('status') or row.get('payment_status') or '').strip().lower()
+        if status not in STATUSES:
+            errors['status'] = [f'Use one of: {", ".join(sorted(STATUSES))}.']
+        plan = str(row.get('plan') or '').strip().lower()
+        if plan and plan not in self.plans:
+            errors['plan'] = [f'Unknown plan "{plan}".']
+        if errors:
+            raise ValidationError(errors)
+        method = str(row.get('method') or row.get('payment_method') or '').strip() or None
+        obj = PaymentTransaction(transaction_id=transaction_id, restaurant_id=int(restaurant), amount=amount,
+                                 payment_status=status, payment_method=method,
+                                 plan=self.plans[plan] if plan else None)
+        # A blank plan or method means "as stored", not "clear it"
+        obj.keep_stored = {name for name, value in (('plan', plan), ('payment_method', method)) if not value}
+        return obj
+
+    def fill_from_stored(self, obj, stored):
+        if 'plan' in obj.keep_stored:
+            plan = self.plans.get(str(stored.plan_id))
+            if plan is not None:
+                obj.plan = plan
+            else:
+                obj.plan_id = stored.plan_id
+        if 'payment_method' in obj.keep_stored:
+            obj.payment_method = stored.payment_method
+
+    # ---------------- reconciliation ----------------
+    def classify(self, incoming, stored):
+        """
+        Returns 'create', 'update', 'unchanged' or a conflict message for one
+        row against the stored transaction (None when there is none).
+        """
+        if stored is None:
+            return 'create'
+        if stored.restaurant_id != incoming.restaurant_id:
+            return f"restaurant {incoming.restaurant_id} does not match stored {stored.restaurant_id}"
+        if stored.amount != incoming.amount:
+            return f"amount {incoming.amount} does not match stored {stored.amount}"
+        if stored.payment_status in FINAL and incoming.payment_status != stored.payment_status:
+            return f"status {incoming.payment_status} after settled {stored.payment_status}"
+        if (incoming.payment_status, incoming.plan_id, incoming.payment_method) == \
+                (stored.payment_status, stored.plan_id, stored.payment_method):
+            return 'unchanged'
+        return 'update'
+
+    def reconcile(self, rows, queryset):
+        stored = {p.transaction_id: p for p in queryset}
+        result = {'stored': stored, 'writes': [], 'created': set(), 'numbers': {}, 'unchanged': 0, 'conflicts': []}
+        for number, obj in rows:
+            result['numbers'][obj.transaction_id] = number
+            if obj.transaction_id in stored:
+                self.fill_from_stored(obj, stored[obj.transaction_id])
+            verdict = self.classify(obj, stored.get(obj.transaction_id))
+            if verdict == 'unchanged':
+                result['unchanged'] += 1
+            elif verdict in ('create', 'update'):
+                result['writes'].append(obj)
+                if verdict == 'create':
+                    result['created'].add(obj.transaction_id)
+            else:
+                result['conflicts'].append({'row': number, 'transaction_id': obj.transaction_id, 'reason': verdict})
+        return result
+
+    def flush(self, rows):
+        ids = [obj.transaction_id for _, obj in rows]
+        # A replayed chunk is settled by this one read, without taking the write lock
+        result = self.reconcile(rows, PaymentTransaction.objects.filter(transaction_id__in=ids))
+        if result['writes']:
+            with write_atomic():
+                result = self.reconcile(rows, PaymentTransaction.objects.select_for_update().filter(transaction_id__in=ids))
+                self.write(result)
+        self.report['unchanged'] += result['unchanged']
+        self.report['conflicts'].extend(result['conflicts'])
+
+    def write(self, result):
+        stored, created, writes = result['stored'], result['created'], result['writes']
+        # Restaurants are only looked up for chunks that write
+        owners = dict(Restaurant.objects.filter(id__in={obj.restaurant_id for obj in writes}).values_list('id', 'owner_id'))
+        missing = [obj for obj in writes if obj.restaurant_id not in owners]
+        for obj in missing:
+            self.report['errors'].append({'row': result['numbers'][obj.transaction_id],
+                                          'errors': {'restaurant': [f'Restaurant {obj.restaurant_id} does not exist.']}})
+        writes = [obj for obj in writes if obj.restaurant_id in owners]
+        self.report['failed'] += len(missing)
+        if not writes:
+            return
+        PaymentTransaction.objects.bulk_create(writes, update_conflicts=True, unique_fields=['transaction_id'],
+                                               update_fields=UPSERT_FIELDS)
+        for obj in writes:
+            if obj.transaction_id not in created:
+                # Kept by the upsert; the history rows should show the stored values
+                obj.pk, obj.created_at = stored[obj.transaction_id].pk, stored[obj.transaction_id].created_at
+        new = [obj for obj in writes if obj.transaction_id in created]
+        changed = [obj for obj in writes if obj.transaction_id not in created]
+        PaymentTransaction.history.bulk_history_create(new, default_user=self.user, default_change_reason=CHANGE_REASON)
+        PaymentTransaction.history.bulk_history_create(changed, update=True, default_user=self.user,
+                                                       default_change_reason=CHANGE_REASON)
+        self.report['created'] += len(new)
+        self.report['updated'] += len(changed)
+        self.apply_subscriptions([obj for obj in writes if obj.payment_status in FINAL])
+        # bulk writes send no post_save, so drop the cached subscription status here
+        owner_ids = {owners[obj.restaurant_id] for obj in writes}
+        transaction.on_commit(lambda: invalidate(*owner_ids))
+
+    def apply_subscriptions(self, settled):
+        if not settled:
+            return
+        subscriptions = {s.restaurant_id: s for s in RestaurantSubscription.objects.filter(
+            restaurant_id__in={obj.restaurant_id for obj in settled})}
+        now, touched, new = timezone.now(), {}, {}
+        for obj in settled:
+            subscription = subscriptions.get(obj.restaurant_id)
+            if obj.payment_status == 'failed':
+                if subscription is not None and subscription.is_active and subscription.payment_reference == obj.transaction_id:
+                    subscription.is_active = False
+                    touched[subscription.restaurant_id] = subscription
+                    self.report['subscriptions']['deactivated'] += 1
+                continue
+            plan = obj.plan or (subscription.plan if subscription else None)
+            if plan is None:
+                continue
+            if subscription is None:
+                subscription = subscriptions[obj.restaurant_id] = new[obj.restaurant_id] = \
+                    RestaurantSubscription(restaurant_id=obj.restaurant_id, start_date=now, end_date=now)
+            elif subscription.restaurant_id not in new:
+                touched[subscription.restaurant_id] = subscription
+            # A renewal paid before expiry extends the running period
+            running = subscription.is_active and subscription.end_date and subscription.end_date > now
+            if not running:
+                subscription.start_date = subscription.end_date = now
+            subscription.plan, subscription.is_active, subscription.payment_reference = plan, True, obj.transaction_id
+            subscription.end_date += timedelta(days=plan.duration_days)
+            self.report['subscriptions']['activated'] += 1
+        RestaurantSubscription.objects.bulk_create(new.values())
+        RestaurantSubscription.objects.bulk_update(touched.values(), SUBSCRIPTION_FIELDS)
+        RestaurantSubscription.history.bulk_history_create(new.values(), default_user=self.user, default_change_reason=CHANGE_REASON)
+        RestaurantSubscription.history.bulk_history_create(touched.values(), update=True, default_user=self.user,
+                                                           default_change_reason=CHANGE_REASON)
+
+    # ---------------- entry point ----------------
+    def run(self, stream, fmt):
+        started = time.monotonic()
+        rows = iter_csv_rows(stream) if fmt == 'csv' else iter_json_rows(stream)
+        pending, seen = [], {}
+        try:
+            for number, row in enumerate(rows, 1):
+                self.report['rows'] += 1
+                try:
+                    if not isinstance(row, dict):
+                        raise ValidationError('Each row must be an object.')
+                    obj = self.parse(row)
+                except ValidationError as e:
+                    self.report['failed'] += 1
+                    self.report['errors'].append({'row': number, 'errors': e.message_dict if hasattr(e, 'error_dict') else {'row': e.messages}})
+                    continue
+                total = self.report['totals'].setdefault(obj.payment_status, {'count': 0, 'amount': Decimal('0.00')})
+                total['count'] += 1
+                total['amount'] += obj.amount
+                # A transaction listed twice in one chunk keeps its last row
+                if obj.transaction_id in seen:
+                    pending[seen[obj.transaction_id]] = (number, obj)
+                else:
+                    seen[obj.transaction_id] = len(pending)
+                    pending.append((number, obj))
+                if len(pending) >= self.chunk_size:
+                    self.flush(pending)
+                    pending, seen = [], {}
+        except (csv.Error, json.JSONDecodeError, UnicodeDecodeError) as e:
+            self.report['errors'].append({'row': None, 'errors': {'file': [f'Could not parse file: {e}']}})
+        if pending:
+            self.flush(pending)
+        for total in self.report['totals'].values():
+            total['amount'] = f"{total['amount']:.2f}"
+        self.report['seconds'] = round(time.monotonic() - started, 3)
+        return self.report
@@ -0,0 +1,119 @@
+from django.db.models import QuerySet
+from django.db.models.signals import post_save, post_delete, pre_delete, m2m_changed
+from apps.authentication.models import PaymentTransaction, Restaurant, RestaurantMember
+from apps.restaurant.models import CatalogVersion, MainCategory, SubCategory, ProductItem, Offer, ProductReview, Order
+from apps.restaurant import cascades, rollups, tenancy
+from apps.restaurant.images import schedule_derivatives
+from apps.restaurant.search import reindex_category, reindex_products, remove_products
+
+# ============================================================
+# CATALOG VERSION — invalidates the owning restaurant's cached menu snapshots
+# ============================================================
+def bump_catalog_version(sender, instance, **kwargs):
+    if not kwargs.get('raw'):
+        CatalogVersion.bump(instance.restaurant_id)
+
+def bump_catalog_version_on_offers(sender, instance, action, **kwargs):
+    # instance is the product or the offer, whichever side was changed; both carry the restaurant
+    if action in ('post_add', 'post_remove', 'post_clear'):
+        CatalogVersion.bump(instance.restaurant_id)
+
+for model in (MainCategory, SubCategory, ProductItem, Offer, ProductReview):
+    post_save.connect(bump_catalog_version, sender=model, dispatch_uid=f'catalog_version_save_{model.__name__}')
+    post_delete.connect(bump_catalog_version, sender=model, dispatch_uid=f'catalog_version_delete_{model.__name__}')
+m2m_changed.connect(bump_catalog_version_on_offers, sender=ProductItem.offers.through, dispatch_uid='catalog_version_offers')
+
+# ============================================================
+# RATING COUNTERS — creates and edits are handled in ProductReview.save()
+# ============================================================
+def remove_review_rating(sender, instance, origin=None, **kwargs):
+    # Reviews deleted along with their product (a product, category or restaurant delete) leave no counters to fix
+    model = origin.model if isinstance(origin, QuerySet) else type(origin)
+    if origin is None or issubclass(model, ProductReview):
+        ProductItem.apply_rating(instance.product_id, removed=instance.rating)
+
+post_delete.connect(remove_review_rating, sender=ProductReview, dispatch_uid='rating_counters_delete')
+
+# ============================================================
+# IMAGE DERIVATIVES — built in the background after upload
+# ============================================================
+def queue_image_derivatives(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+    if instance.image and instance.image_derivatives.get('source') != instance.image.name:
+        schedule_derivatives(instance)
+    elif not instance.image and instance.image_derivatives:
+        ProductItem.objects.filter(pk=instance.pk).update(image_derivatives={})
+
+post_save.connect(queue_image_derivatives, sender=ProductItem, dispatch_uid='image_derivatives')
+
+# ============================================================
+# SEARCH INDEX — product_search FTS table mirrors products and category names
+# ============================================================
+# Product columns and foreign keys the index is built from
+INDEXED_FIELDS = {'name', 'description', 'customizations', 'main_category_id', 'sub_category_id'}
+
+def index_product(sender, instance, raw=False, **kwargs):
+    if not raw and not instance.saved_fields.isdisjoint(INDEXED_FIELDS):
+        reindex_products([instance.pk])
+
+def unindex_product(sender, instance, **kwargs):
+    remove_products([instance.pk])
+
+def index_category_products(sender, instance, created=False, raw=False, **kwargs):
+    # Products carry their category names; a new category has no products yet
+    if raw or created or 'name' not in instance.saved_fields:
+        return
+    if sender is SubCategory:
+        rows = reindex_category(sub_category_id=instance.pk)
+    else:
+        rows = reindex_category(main_category_id=instance.pk)
+    cascades.record('search.category', rows or 0)
+
+def remember_subcategory_products(sender, instance, **kwargs):
+    # Products are detached with SET_NULL (no signals); reindex them once the row is gone
+    instance._search_product_ids = list(ProductItem.all_objects.filter(sub_category=instance).values_list('id', flat=True))
+
+def index_detached_products(sender, instance, **kwargs):
+    reindex_products(getattr(instance, '_search_product_ids', []))
+
+post_save.connect(index_product, sender=ProductItem, dispatch_uid='search_index_product')
+post_delete.connect(unindex_product, sender=ProductItem, dispatch_uid='search_unindex_product')
+post_save.connect(index_category_products, sender=MainCategory, dispatch_uid='search_index_main_category')
+post_save.connect(index_category_products, sender=SubCategory, dispatch_uid='search_index_sub_category')
+pre_delete.connect(remember_subcategory_products, sender=SubCategory, dispatch_uid='search_subcategory_products')
+post_delete.connect(index_detached_products, sender=SubCategory, dispatch_uid='search_index_detached_products')
+
+# ============================================================
+# TENANTS — cached per restaurant: whether it is open, and who works there
+# ============================================================
+def forget_tenant(sender, instance, **kwargs):
+    tenancy.forget(instance.pk)
+
+def forget_tenant_staff(sender, instance, **kwargs):
+    tenancy.forget(instance.restaurant_id)
+
+post_save.connect(forget_tenant, sender=Restaurant, dispatch_uid='tenant_open_save')
+post_delete.connect(forget_tenant, sender=Restaurant, dispatch_uid='tenant_open_delete')
+post_save.connect(forget_tenant_staff, sender=RestaurantMember, dispatch_uid='tenant_staff_save')
+post_delete.connect(forget_tenant_staff, sender=RestaurantMember, dispatch_uid='tenant_staff_delete')
+
+# ============================================================
+# ROLLUPS — a deleted order or payment leaves no updated_at for refresh() to find
+# ============================================================
+def mark_deleted_order_hour(sender, instance, **kwargs):
+    rollups.mark_dirty('sales', [instance.created_at])
+
+def mark_deleted_payment_hours(sender, instance, origin=None, **kwargs):
+    moments = [instance.created_at]
+    # The restaurant's next success may have counted as a renewal because of this one;
+    # when the whole restaurant goes, its rollups go with it
+    model = origin.model if isinstance(origin, QuerySet) else type(origin)
+    if instance.payment_status == 'success' and (origin is None or issubclass(model, PaymentTransaction)):
+        moments.append(PaymentTransaction.objects.filter(restaurant_id=instance.restaurant_id, payment_status='success',
+                                                         created_at__gt=instance.created_at)
+                       .order_by('created_at').values_list('created_at', flat=True).first())
+    rollups.mark_dirty('payments', moments)
+
+post_delete.connect(mark_deleted_order_hour, sender=Order, dispatch_uid='rollups_deleted_order')
+post_delete.connect(mark_deleted_payment_hours, sender=PaymentTransaction, dispatch_uid='rollups_deleted_payment')
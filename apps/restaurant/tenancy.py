@@ -0,0 +1,106 @@
+"""
+Which restaurant's catalog the current request works on.
+
+TenantMiddleware (middleware/tenant.py) reads the restaurant from the
+X-Restaurant header, or ?restaurant_id= for QR menu links, and activates
+it for the request. Anyone may read an open restaurant's menu; writes,
+order handling and the kitchen need the permissions in permissions.py.
+Catalog managers (TenantManager) then filter every query to it, and new
+rows are stamped with it. Without a restaurant the request works on the
+default catalog: the rows with no restaurant, which is where catalogs
+created before restaurants were scoped still live.
+
+Menu snapshots, offer indexes and CatalogVersion counters are all kept per
+restaurant, so one restaurant's edit invalidates only its own caches.
+"""
+from contextlib import contextmanager
+from asgiref.local import Local
+from django.conf import settings
+from django.core.cache import cache
+from django.db import models
+
+_state = Local()
+# Passed where a caller wants every restaurant's rows (admin search, maintenance commands)
+ALL = object()
+
+
+def current():
+    """Restaurant id of the active catalog, or None for the default catalog."""
+    return getattr(_state, 'restaurant_id', None)
+
+
+@contextmanager
+def activate(restaurant_id):
+    outer = getattr(_state, 'restaurant_id', None)
+    _state.restaurant_id = restaurant_id
+    try:
+        yield
+    finally:
+        _state.restaurant_id = outer
+
+
+def partition(restaurant_id):
+    # Cache and search index token for a restaurant's catalog; 0 is the default catalog
+    return f"r{restaurant_id or 0}"
+
+
+# ============================================================
+# MANAGERS
+# ============================================================
+class TenantQuerySet(models.QuerySet):
+    def bulk_create(self, objs, *args, **kwargs):
+        # bulk_create skips save(), so stamp the restaurant here
+        objs = list(objs)
+        for obj in objs:
+            obj.assign_restaurant()
+        return super().bulk_create(objs, *args, **kwargs)
+
+
+class TenantManager(models.Manager.from_queryset(TenantQuerySet)):
+    def get_queryset(self):
+        return super().get_queryset().filter(restaurant_id=current())
+
+
+# ============================================================
+# REQUEST RESOLUTION
+# ============================================================
+def cache_key(restaurant_id):
+    return f"tenant:{restaurant_id}"
+
+
+def staff_ids(restaurant_id):
+    """
+    Ids of the owner and members of an open restaurant, or None if it does
+    not exist or is inactive. Cached until the restaurant or its members
+    change (see signals.py).
+    """
+    key = cache_key(restaurant_id)
+    found = cache.get(key)
+    if found is None:
+        from apps.authentication.models import Restaurant
+        rows = list(Restaurant.objects.filter(pk=restaurant_id, is_active=True).values_list('owner_id', 'members__user_id'))
+        found = {user_id for row in rows for user_id in row if user_id is not None} if rows else False
+        cache.set(key, found, settings.TENANT_CACHE_TIMEOUT)
+    return found or None
+
+
+def is_open(restaurant_id):
+    return staff_ids(restaurant_id) is not None
+
+
+def can_access(user, restaurant_id):
+    """
+    Whether user may write to the restaurant's catalog and work its orders:
+    staff, its owner or one of its members. Anyone may on the default
+    catalog, which has no owner.
+    """
+    if restaurant_id is None or user.is_staff or user.is_superuser:
+        return True
+    staff = staff_ids(restaurant_id)
+    # Token users carry their id as a string
+    return staff is not None and user.pk is not None and int(user.pk) in staff
+
+
+def forget(restaurant_id):
+    cache.delete(cache_key(restaurant_id))
+
@@ -1,3 +1,933 @@
-from django.test import TestCase
+import asyncio
+import io
+import json
+import os
+import subprocess
+import sys
+import tempfile
+from datetime import timedelta
+from decimal import Decimal
+from unittest import mock
+from asgiref.sync import async_to_sync, sync_to_async
+from django.conf import settings
+from django.core.cache import cache
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.core.management import CommandError, call_command
+from django.db import DEFAULT_DB_ALIAS, IntegrityError, connection, connections, transaction
+from django.db.models import Count, Sum
+from django.test import AsyncClient, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from PIL import Image as PILImage
+from rest_framework.test import APIClient
+from apps.authentication.authentication import ClaimsRefreshToken, ClaimsUser
+from apps.authentication.models import PaymentTransaction, Restaurant, RestaurantMember, RestaurantSubscription, Role, SubscriptionPlan, Users
+from apps.restaurant import cascades, fastpath, images, kitchen, menu, rollups, tenancy
+from apps.restaurant.facets import facet_counts
+from apps.restaurant.importer import CatalogImporter
+from apps.restaurant.benchmark import route_keys, run_benchmark, seed_menu
+from apps.restaurant.middleware.query_budget import QueryRecorder
+from apps.restaurant.models import (CatalogVersion, MainCategory, SubCategory, ProductItem, ProductReview, Offer, Order, PaymentRollup,
+                                    RollupDirtyHour, SalesRollup)
+from apps.restaurant.orders import OrderRejected, place_order, set_status
+from apps.restaurant.pagination import encode_cursor
+from apps.restaurant.pricing import PriceBook, get_offer_index
+from apps.restaurant.ranking import REBALANCE_LENGTH, rank_between, rank_sequence
+from apps.restaurant.search import search_products
+from apps.restaurant.serializers import SubCategorySerializer
+from apps.restaurant.settlements import SettlementImporter
+from core.routers import READ_ALIAS, ReadWriteRouter
+from core.transactions import write_atomic
 
-# Create your tests here.
+
+class RankingTests(TestCase):
+    def assertIncreasing(self, keys):
+        self.assertEqual(keys, sorted(set(keys)))
+
+    def test_rank_between_always_finds_a_key(self):
+        self.assertEqual(rank_between(), "i")
+        for lo, hi in (("a", "b"), ("a", "a1"), ("az", "b"), ("a0z", "a1"), ("i", "i01")):
+            key = rank_between(lo, hi)
+            self.assertTrue(lo < key < hi, (lo, hi, key))
+            self.assertFalse(key.endswith("0"))
+        for lo, hi in (("b", "a"), ("a", "a")):
+            with self.assertRaises(ValueError):
+                rank_between(lo, hi)
+
+    def test_head_and_tail_inserts_stay_ordered(self):
+        head = tail = rank_between()
+        keys = [head]
+        for _ in range(40):
+            head, tail = rank_between(None, head), rank_between(tail, None)
+            keys = [head] + keys + [tail]
+        self.assertIncreasing(keys)
+
+    def test_rank_sequence_is_even_and_fits_its_bounds(self):
+        for count in (1, 5, 36, 500):
+            keys = rank_sequence(count)
+            self.assertEqual(len(keys), count)
+            self.assertIncreasing(keys)
+            self.assertLessEqual(max(map(len, keys)), 3)
+        keys = rank_sequence(10, "a", "b")
+        self.assertIncreasing(["a"] + keys + ["b"])
+        self.assertIncreasing(rank_sequence(10, None, "0001") + ["0001"])
+
+    def ordered(self):
+        return list(MainCategory.objects.order_by("rank", "id").values_list("name", flat=True))
+
+    def test_display_order_places_rows_between_their_neighbours(self):
+        for name in "ABC":
+            MainCategory.objects.create(name=name)
+        MainCategory.objects.create(name="D", display_order=1)
+        c = MainCategory.objects.get(name="C")
+        c.display_order = 2
+        c.save()
+        MainCategory.objects.create(name="E", display_order=99)
+        self.assertEqual(self.ordered(), ["D", "C", "A", "B", "E"])
+        self.assertEqual([(m.name, m.position) for m in MainCategory.objects.with_display_order().order_by("rank", "id")],
+                         [("D", 1), ("C", 2), ("A", 3), ("B", 4), ("E", 5)])
+        self.assertEqual(MainCategory.objects.get(name="A").display_order, 3)
+        before = self.ordered()
+        self.assertEqual(MainCategory.rebalance(restaurant_id=None), 5)
+        self.assertEqual(self.ordered(), before)
+        self.assertEqual(list(MainCategory.objects.order_by("rank").values_list("rank", flat=True)), rank_sequence(5))
+
+    def test_products_without_a_sub_category_are_ordered_among_themselves(self):
+        main = MainCategory.objects.create(name="Mains")
+        curries = SubCategory.objects.create(main_category=main, name="Curries")
+        for name in ("Korma", "Dal Makhani"):
+            ProductItem.objects.create(main_category=main, sub_category=curries, name=name, price=5)
+        for name in ("Rice", "Roti"):
+            ProductItem.objects.create(main_category=main, name=name, price=5)
+        curry_ranks = list(ProductItem.objects.filter(sub_category=curries).order_by("rank").values_list("rank", flat=True))
+        ProductItem.objects.create(main_category=main, name="Naan", price=5, display_order=1)
+        rice = ProductItem.objects.get(name="Rice")
+        rice.display_order = 3
+        rice.save()
+        positions = {p.name: p.position for p in ProductItem.objects.with_display_order()}
+        self.assertEqual(positions, {"Korma": 1, "Dal Makhani": 2, "Naan": 1, "Roti": 2, "Rice": 3})
+        # Placing products without a sub category never moves the ones in it
+        self.assertEqual(list(ProductItem.objects.filter(sub_category=curries).order_by("rank").values_list("rank", flat=True)),
+                         curry_ranks)
+
+    def test_exhausted_gaps_are_respaced(self):
+        for name in "AB":
+            MainCategory.objects.create(name=name)
+        # Squeezing into the same gap lengthens keys until save() schedules a respacing
+        for n in range(80):
+            with self.captureOnCommitCallbacks(execute=True):
+                MainCategory.objects.create(name=f"x{n}", display_order=2)
+        self.assertLessEqual(max(len(r) for r in MainCategory.objects.values_list("rank", flat=True)), REBALANCE_LENGTH)
+        self.assertEqual(self.ordered()[:3], ["A", "x79", "x78"])
+        self.assertEqual(self.ordered()[-1], "B")
+        # Duplicate keys left by concurrent writers leave no gap at all: place() respaces first
+        MainCategory.objects.filter(name__in=["x0", "B"]).update(rank="zz")
+        self.assertEqual(self.ordered()[-2:], ["B", "x0"])
+        MainCategory.objects.create(name="C", display_order=len(self.ordered()))
+        self.assertEqual(self.ordered()[-3:], ["B", "C", "x0"])
+        self.assertIncreasing(list(MainCategory.objects.order_by("rank").values_list("rank", flat=True)))
+
+
+@override_settings(QUERY_BUDGET_STRICT=True)
+class ReorderTests(TestCase):
+    def setUp(self):
+        self.main = MainCategory.objects.create(name="Mains")
+        self.dishes = [ProductItem.objects.create(main_category=self.main, name=name, price=5) for name in ("Dal", "Rice", "Roti")]
+        user = Users.objects.create_user(email='admin@example.com', username='admin', phone='4', password='x')
+        self.client = APIClient()
+        self.client.force_authenticate(user)
+
+    def reorder(self, path, data):
+        return self.client.put(f'/api/restaurant/{path}/reorder/', data, format='json')
+
+    def test_a_full_ordering_is_written_with_one_update(self):
+        ids = [d.id for d in reversed(self.dishes)]
+        with CaptureQueriesContext(connection) as queries:
+            response = self.reorder('product-items', {'main_category': self.main.id, 'sub_category': None, 'ids': ids})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['data'], [{'id': i, 'display_order': n} for n, i in enumerate(ids, 1)])
+        self.assertEqual(len([q for q in queries if q['sql'].startswith('UPDATE "restaurant_productitem"')]), 1)
+        listed = self.client.get(f'/api/restaurant/product-items/?main_category={self.main.id}').json()
+        self.assertEqual([(p['id'], p['display_order']) for p in listed], [(i, n) for n, i in enumerate(ids, 1)])
+        other = MainCategory.objects.create(name="Sides")
+        self.assertEqual(self.reorder('main-categories', {'ids': [other.id, self.main.id]}).status_code, 200)
+        self.assertEqual(list(MainCategory.objects.values_list('name', flat=True)), ["Sides", "Mains"])
+
+    def test_partial_or_foreign_orderings_are_rejected(self):
+        ids = [d.id for d in self.dishes]
+        ranks = list(ProductItem.objects.values_list('rank', flat=True))
+        for data in ({'main_category': self.main.id, 'ids': ids[:2]},
+                     {'main_category': self.main.id, 'ids': ids + [ids[0]]},
+                     {'main_category': self.main.id, 'ids': ['x'] + ids[1:]},
+                     {'main_category': self.main.id, 'ids': []},
+                     {'ids': ids}):
+            self.assertEqual(self.reorder('product-items', data).status_code, 400, data)
+        self.assertEqual(list(ProductItem.objects.values_list('rank', flat=True)), ranks)
+
+
+class SlugTests(TestCase):
+    def setUp(self):
+        self.main = MainCategory.objects.create(name="Mains")
+
+    def make(self, name="Paneer Tikka"):
+        return ProductItem.objects.create(main_category=self.main, name=name, price=8)
+
+    def test_allocate_slug_takes_the_lowest_free_suffix(self):
+        self.assertEqual([self.make().slug for _ in range(3)], ["paneer-tikka", "paneer-tikka-1", "paneer-tikka-2"])
+        self.assertEqual(self.make("Paneer Tikka Masala").slug, "paneer-tikka-masala")
+        ProductItem.objects.get(slug="paneer-tikka-1").delete()
+        self.assertEqual(self.make().slug, "paneer-tikka-1")
+        # A rename that still fits keeps its slug; any other rename gets a fresh one
+        product = ProductItem.objects.get(slug="paneer-tikka-2")
+        product.name = "PANEER tikka"
+        product.save()
+        self.assertEqual(product.slug, "paneer-tikka-2")
+        product.name = "Malai Tikka"
+        product.save()
+        self.assertEqual(product.slug, "malai-tikka")
+        # Slugs are unique per restaurant
+        owner = Users.objects.create_user(email='owner@example.com', username='owner', phone='1', password='x')
+        with tenancy.activate(Restaurant.objects.create(owner=owner, name="Spice").id):
+            main = MainCategory.objects.create(name="Mains")
+            self.assertEqual(ProductItem.objects.create(main_category=main, name="Paneer Tikka", price=8).slug, "paneer-tikka")
+
+    def test_allocate_slug_reads_only_numbered_slugs(self):
+        for name in ("Paneer Tikka", "Paneer Tikka Masala", "Paneer Tikka 2 Go", "Paneer Tikka"):
+            self.make(name)
+        product = ProductItem(main_category=self.main, name="Paneer Tikka")
+        with CaptureQueriesContext(connection) as queries:
+            self.assertEqual(product.allocate_slug("paneer-tikka"), "paneer-tikka-2")
+        # paneer-tikka-masala and paneer-tikka-2-go fall in the range but not the pattern
+        self.assertEqual(len(queries), 1)
+        self.assertIn('REGEXP', queries[0]['sql'])
+
+    def test_a_slug_taken_meanwhile_is_allocated_again(self):
+        self.make()
+        allocate = ProductItem.allocate_slug
+        # The first pick is stale, as if a concurrent insert took it after it was read
+        picks = iter(["paneer-tikka"])
+        with mock.patch.object(ProductItem, 'allocate_slug', autospec=True,
+                               side_effect=lambda product, base: next(picks, None) or allocate(product, base)) as allocated:
+            self.assertEqual(self.make().slug, "paneer-tikka-1")
+        self.assertEqual(allocated.call_count, 2)
+        # A clash that persists through every retry is raised
+        with mock.patch.object(ProductItem, 'allocate_slug', return_value="paneer-tikka"):
+            with self.assertRaises(IntegrityError):
+                self.make()
+        self.assertEqual(ProductItem.objects.count(), 2)
+
+class ImporterTests(TestCase):
+    CSV = "name,main_category,price\nMasala Dosa,Tiffin,4\nIdli,Tiffin,2\nMasala Dosa,Tiffin,5\n"
+
+    def test_slugs_taken_during_an_import_are_allocated_again(self):
+        main = MainCategory.objects.create(name="Tiffin")
+        importer = CatalogImporter()
+        # Inserted after the importer read the taken slugs, as a concurrent writer would
+        ProductItem.objects.create(main_category=main, name="Masala Dosa", price=4)
+        report = importer.run(io.StringIO(self.CSV), 'csv')
+        self.assertEqual((report['created'], report['errors']), (3, []))
+        self.assertEqual(sorted(ProductItem.objects.values_list('slug', flat=True)),
+                         ["idli", "masala-dosa", "masala-dosa-1", "masala-dosa-2"])
+        self.assertEqual(len(search_products("dosa")), 3)
+
+    def test_a_chunk_that_cannot_be_written_is_reported(self):
+        with mock.patch.object(ProductItem.objects, 'bulk_create', side_effect=IntegrityError("CHECK constraint failed")):
+            report = CatalogImporter(chunk_size=2).run(io.StringIO(self.CSV), 'csv')
+        self.assertEqual((report['created'], report['failed']), (0, 3))
+        self.assertEqual([e['row'] for e in report['errors']], [1, 2, 3])
+        self.assertIn("CHECK constraint failed", report['errors'][0]['errors']['row'][0])
+        self.assertFalse(ProductItem.objects.exists())
+
+
+@override_settings(QUERY_BUDGET_STRICT=True)
+class MenuSnapshotTests(TestCase):
+    def setUp(self):
+        # Versions restart with each test's rolled-back database, so earlier snapshots would match
+        cache.clear()
+        main = MainCategory.objects.create(name="Mains")
+        self.dosa = ProductItem.objects.create(main_category=main, name="Dosa", price=4)
+        self.client = APIClient()
+
+    def get(self, etag=None):
+        headers = {'HTTP_IF_NONE_MATCH': etag} if etag else {}
+        with mock.patch.object(menu, 'build_menu', wraps=menu.build_menu) as built:
+            response = self.client.get('/api/restaurant/menu/', **headers)
+        return response, built.called
+
+    def prices(self, response):
+        return [p['pricing']['total_price'] for c in response.json()['categories'] for p in c['products']]
+
+    def test_snapshots_are_cached_and_revalidated_by_etag(self):
+        first, built = self.get()
+        self.assertEqual((first.status_code, built, self.prices(first)), (200, True, ['4.00']))
+        etag = first['ETag']
+        again, built = self.get()
+        self.assertEqual((again.status_code, built, again['ETag'], again.content), (200, False, etag, first.content))
+        for sent in (etag, f"W/{etag}", f'"stale", {etag}', '*'):
+            response, built = self.get(sent)
+            self.assertEqual((response.status_code, response.content, built), (304, b'', False), sent)
+            self.assertEqual(response['ETag'], etag)
+
+    def test_catalog_writes_and_offer_windows_change_the_etag(self):
+        etag = self.get()[0]['ETag']
+        self.dosa.price = 5
+        self.dosa.save()
+        response, built = self.get(etag)
+        self.assertEqual((response.status_code, built, self.prices(response)), (200, True, ['5.00']))
+        self.assertNotEqual(response['ETag'], etag)
+        # A new offer is a catalog write; opening its window later changes the menu again
+        opens = timezone.now() + timedelta(hours=1)
+        self.dosa.offers.add(Offer.objects.create(name="Breakfast", discount_value=1, start_date=opens))
+        etag = self.get()[0]['ETag']
+        self.assertEqual(self.get(etag)[0].status_code, 304)
+        with mock.patch('apps.restaurant.pricing.timezone.now', return_value=opens):
+            response, built = self.get(etag)
+        self.assertEqual((response.status_code, built, self.prices(response)), (200, True, ['4.00']))
+
+class PaginationTests(TestCase):
+    def setUp(self):
+        product = ProductItem.objects.create(main_category=MainCategory.objects.create(name="Mains"), name="Dosa", price=4)
+        ProductReview.objects.bulk_create(ProductReview(product=product, rating=n % 5 + 1) for n in range(10))
+        self.client = APIClient()
+        self.client.force_authenticate(Users.objects.create_user(email='admin@example.com', username='admin', phone='4', password='x'))
+
+    def test_pages_follow_the_cursor_and_bad_cursors_are_rejected(self):
+        seen, url = [], "/api/restaurant/product-reviews/?limit=4"
+        while url:
+            page = self.client.get(url).json()
+            seen += [r['id'] for r in page['results']]
+            url = page['next_cursor'] and f"/api/restaurant/product-reviews/?limit=4&cursor={page['next_cursor']}"
+        self.assertEqual(seen, list(ProductReview.objects.order_by('-created_at', '-id').values_list('id', flat=True)))
+        for cursor in (encode_cursor([5, 1]), encode_cursor([1]), "not-a-cursor"):
+            for fast in (True, False):
+                with mock.patch.object(fastpath, 'applies', return_value=fast):
+                    response = self.client.get(f"/api/restaurant/product-reviews/?cursor={cursor}")
+                self.assertEqual(response.status_code, 400, cursor)
+                self.assertEqual(response.json(), {"errors": {"pagination": ["Invalid cursor"]}})
+
+
+class ReviewRatingTests(TestCase):
+    def setUp(self):
+        self.main = MainCategory.objects.create(name="Mains")
+        self.curry = ProductItem.objects.create(main_category=self.main, name="Curry", price=9)
+        self.naan = ProductItem.objects.create(main_category=self.main, name="Naan", price=2)
+        user = Users.objects.create_user(email='guest@example.com', username='guest', phone='3', password='x')
+        self.client = APIClient()
+        self.client.force_authenticate(user)
+
+    def counters(self, product):
+        product.refresh_from_db()
+        return (product.rating_count, product.rating_sum, product.rating_avg,
+                [getattr(product, f"rating_{star}") for star in range(1, 6)])
+
+    def test_creating_editing_and_deleting_reviews_keep_counters(self):
+        for rating in (5, 3):
+            self.assertEqual(self.client.post('/api/restaurant/product-reviews/', {'product': self.curry.id, 'rating': rating}).status_code, 201)
+        self.assertEqual(self.counters(self.curry), (2, 8, Decimal('4.0'), [0, 0, 1, 0, 1]))
+        review = ProductReview.objects.get(rating=3)
+        review.rating = 1
+        review.save()
+        self.assertEqual(self.counters(self.curry), (2, 6, Decimal('3.0'), [1, 0, 0, 0, 1]))
+        review.product = self.naan
+        review.save()
+        self.assertEqual(self.counters(self.curry), (1, 5, Decimal('5.0'), [0, 0, 0, 0, 1]))
+        self.assertEqual(self.counters(self.naan), (1, 1, Decimal('1.0'), [1, 0, 0, 0, 0]))
+        five = ProductReview.objects.get(rating=5)
+        self.assertEqual(self.client.delete(f'/api/restaurant/product-reviews/delete/{five.id}/').status_code, 204)
+        self.assertEqual(self.counters(self.curry), (0, 0, Decimal('0.0'), [0, 0, 0, 0, 0]))
+        ProductReview.objects.filter(product=self.naan).delete()
+        self.assertEqual(self.counters(self.naan), (0, 0, Decimal('0.0'), [0, 0, 0, 0, 0]))
+
+    def test_reviews_deleted_with_their_product_skip_the_counters(self):
+        for product in (self.curry, self.naan):
+            ProductReview.objects.create(product=product, rating=4)
+        for doomed in (self.curry, self.main):
+            with CaptureQueriesContext(connection) as queries:
+                doomed.delete()
+            self.assertEqual([q['sql'] for q in queries if q['sql'].startswith('UPDATE "restaurant_productitem"')], [])
+        self.assertEqual(ProductReview.all_objects.count(), 0)
+
+    def test_recompute_ratings_repairs_drifted_counters(self):
+        for rating in (4, 4, 1):
+            ProductReview.objects.create(product=self.curry, rating=rating)
+        expected = self.counters(self.curry)
+        ProductItem.all_objects.filter(pk=self.curry.pk).update(rating_count=7, rating_avg=2, rating_4=0)
+        out = io.StringIO()
+        call_command('recompute_ratings', batch_size=1, stdout=out)
+        self.assertIn("2 products checked, 1 rating counters rebuilt", out.getvalue())
+        self.assertEqual(self.counters(self.curry), expected)
+        self.assertEqual(self.counters(self.naan), (0, 0, Decimal('0.0'), [0, 0, 0, 0, 0]))
+
+
+class PricingTests(TestCase):
+    def setUp(self):
+        main = MainCategory.objects.create(name="Mains")
+        self.thali = ProductItem.objects.create(main_category=main, name="Thali", price=100, tax_percentage=5)
+        self.lassi = ProductItem.objects.create(main_category=main, name="Lassi", price=Decimal('9.99'), tax_percentage=5)
+        self.now = timezone.now()
+        self.percent = Offer.objects.create(name="Lunch", offer_type='percent', discount_value=10, start_date=self.now - timedelta(days=1))
+        self.flat = Offer.objects.create(name="Happy hour", offer_type='flat', discount_value=15,
+                                         start_date=self.now + timedelta(hours=1), end_date=self.now + timedelta(hours=2))
+        unused = Offer.objects.create(name="Closed", offer_type='percent', discount_value=90, active=False)
+        for product in (self.thali, self.lassi):
+            product.offers.add(self.percent, self.flat, unused)
+
+    def book(self, when):
+        return PriceBook(get_offer_index(None, CatalogVersion.current()), when)
+
+    def quote(self, product, when):
+        quote = self.book(when).quote(product)
+        return quote['applied_offer'], quote['discount'], quote['tax'], quote['total_price']
+
+    def test_the_best_running_offer_applies_and_tax_follows_the_discount(self):
+        # 10% of 100; tax is 5% of the discounted 90
+        self.assertEqual(self.quote(self.thali, self.now), (self.percent.id, '10.00', '4.50', '94.50'))
+        # While both run the larger flat discount wins; it is capped at the price
+        happy_hour = self.now + timedelta(minutes=90)
+        self.assertEqual(self.quote(self.thali, happy_hour), (self.flat.id, '15.00', '4.25', '89.25'))
+        self.assertEqual(self.quote(self.lassi, happy_hour), (self.flat.id, '9.99', '0.00', '0.00'))
+        # Percent discounts round half up to the cent
+        self.assertEqual(self.quote(self.lassi, self.now), (self.percent.id, '1.00', '0.45', '9.44'))
+        self.assertEqual(PriceBook.current().quote(self.thali), self.book(self.now).quote(self.thali))
+
+    def test_offer_windows_open_at_start_and_close_at_end(self):
+        start, end = self.flat.start_date, self.flat.end_date
+        self.assertEqual(self.quote(self.thali, start - timedelta(microseconds=1))[0], self.percent.id)
+        self.assertEqual(self.quote(self.thali, start)[0], self.flat.id)
+        self.assertEqual(self.quote(self.thali, end - timedelta(microseconds=1))[0], self.flat.id)
+        self.assertEqual(self.quote(self.thali, end)[0], self.percent.id)
+        self.assertEqual(self.quote(self.thali, self.percent.start_date - timedelta(seconds=1)), (None, '0.00', '5.00', '105.00'))
+        # Each window edge starts a new pricing epoch, so cached menus expire when an offer opens or closes
+        self.assertNotEqual(self.book(start - timedelta(microseconds=1)).epoch, self.book(start).epoch)
+
+    def test_offer_changes_reload_the_index(self):
+        self.assertEqual(self.quote(self.thali, self.now)[1], '10.00')
+        self.percent.discount_value = 20
+        self.percent.save()
+        self.assertEqual(self.quote(self.thali, self.now)[1], '20.00')
+        self.thali.offers.remove(self.percent)
+        self.assertEqual(self.quote(self.thali, self.now)[0], None)
+
+
+class ImageDerivativeTests(TestCase):
+    def setUp(self):
+        media = tempfile.TemporaryDirectory()
+        self.addCleanup(media.cleanup)
+        self.enterContext(override_settings(MEDIA_ROOT=media.name))
+        # Run jobs inline, on the test's connection
+        self.enterContext(mock.patch.object(images, 'get_executor', return_value=mock.Mock(submit=lambda job, *args: job(*args))))
+        self.enterContext(mock.patch.object(images.connection, 'close'))
+        self.main = MainCategory.objects.create(name="Mains")
+        self.client = APIClient()
+        self.client.force_authenticate(Users.objects.create_user(email='cook@example.com', username='cook', phone='5', password='x'))
+
+    def upload(self, product, width, height):
+        buf = io.BytesIO()
+        PILImage.new('RGB', (width, height), (200, 80, 20)).save(buf, format='PNG')
+        product.image = ContentFile(buf.getvalue(), name='photo.png')
+        with self.captureOnCommitCallbacks(execute=True):
+            product.save()
+        product.refresh_from_db()
+        return product.image_derivatives
+
+    def test_uploads_get_resized_derivatives_rendered_alike_on_both_paths(self):
+        dish = ProductItem.objects.create(main_category=self.main, name="Dosa", price=4)
+        derivatives = self.upload(dish, 2000, 1000)
+        self.assertEqual(derivatives['source'], dish.image.name)
+        self.assertEqual({size: derivatives[size]['width'] for size in images.DERIVATIVE_SIZES}, images.DERIVATIVE_SIZES)
+        for size in images.DERIVATIVE_SIZES:
+            for fmt in ('webp', 'jpeg'):
+                self.assertTrue(default_storage.exists(derivatives[size][fmt]))
+        # Small uploads are not enlarged; the same bytes map to the same files
+        self.assertEqual(self.upload(ProductItem.objects.create(main_category=self.main, name="Idli", price=2), 100, 50)['full']['width'], 100)
+        self.assertEqual(self.upload(ProductItem.objects.create(main_category=self.main, name="Vada", price=2), 2000, 1000)['thumb'], derivatives['thumb'])
+        url = "/api/restaurant/product-items/?fields=id,image_url,image_variants,image_srcset"
+        with mock.patch.object(fastpath, 'applies', return_value=True):
+            fast = self.client.get(url)
+        with mock.patch.object(fastpath, 'applies', return_value=False):
+            slow = self.client.get(url)
+        self.assertEqual((fast.status_code, fast.content), (200, slow.content))
+        row = fast.json()[0]
+        self.assertTrue(row['image_variants']['thumb']['webp'].startswith('http://testserver/media/menu_items/derived/'))
+        self.assertEqual(row['image_srcset'].count('w, '), 2)
+        # Removing the image drops its derivatives
+        dish.image = None
+        dish.save()
+        dish.refresh_from_db()
+        self.assertEqual(dish.image_derivatives, {})
+
+
+class BenchmarkSuiteTests(TestCase):
+    # Every route runs under its QUERY_BUDGETS entry; going over raises QueryBudgetExceeded
+    @override_settings(QUERY_BUDGET_STRICT=True)
+    def test_every_route_has_a_passing_spec(self):
+        results = run_benchmark({'categories': 2, 'subcategories': 2, 'products': 3, 'offers': 2, 'reviews': 1}, iterations=2)
+        self.assertEqual(results['missing'], [])
+        self.assertEqual([key for key in route_keys() if key not in settings.QUERY_BUDGETS], [])
+        failing = {name: stats['status'] for name, stats in results['routes'].items() if max(stats['status']) >= 400}
+        self.assertEqual(failing, {})
+
+    def test_command_runs_on_its_own_database(self):
+        # A separate process, so the command sets up its database (and the read connection) from settings
+        with tempfile.TemporaryDirectory() as tmp:
+            done = subprocess.run([sys.executable, 'manage.py', 'benchmark_api', '--iterations', '1', '--categories', '1',
+                                   '--subcategories', '1', '--products', '1', '--offers', '1', '--reviews', '1',
+                                   '--output', os.path.join(tmp, 'results.json'), '--baseline', os.path.join(tmp, 'none.json')],
+                                  cwd=settings.BASE_DIR, capture_output=True, text=True)
+            self.assertEqual(done.returncode, 0, done.stderr)
+            with open(os.path.join(tmp, 'results.json')) as fh:
+                self.assertEqual(json.load(fh)['missing'], [])
+
+
+class QueryRecorderTests(TestCase):
+    def test_repeated_queries_name_the_serializer_field(self):
+        seed_menu(categories=6, subcategories=1, products=0, offers=0, reviews=0)
+        recorder = QueryRecorder(threshold=5)
+        with connection.execute_wrapper(recorder):
+            SubCategorySerializer(SubCategory.objects.all(), many=True).data
+        fields = {r['field'] for r in recorder.repeated()}
+        self.assertIn('SubCategorySerializer.main_category_name', fields)
+
+
+@override_settings(QUERY_BUDGET_STRICT=True)
+class FastPathTests(TestCase):
+    def setUp(self):
+        fixtures = seed_menu(categories=2, subcategories=2, products=4, offers=3, reviews=2)
+        ProductItem.objects.filter(pk=fixtures['product']).update(
+            name="Crème brûlée \u2028", quantity_value=1e-5, image='menu_items/dish.jpg',
+            image_derivatives={'source': 'menu_items/dish.jpg', 'thumb': {'width': 160, 'webp': 'd/a.webp', 'jpeg': 'd/a.jpg'}})
+        self.client = APIClient()
+        self.client.force_authenticate(fixtures['user'])
+
+    def test_output_matches_serializer_bytes(self):
+        urls = ['product-items/', 'product-items/?fields=id,name,pricing,display_order,image_srcset',
+                'product-items/?limit=3', 'sub-categories/', 'sub-categories/?limit=2', 'product-reviews/?limit=3',
+                'product-items/?fields=name,id,name,nope', 'product-items/?fields=nope']
+        for url in urls:
+            with mock.patch.object(fastpath, 'render_json', wraps=fastpath.render_json) as rendered:
+                fast = self.client.get(f"/api/restaurant/{url}")
+            self.assertTrue(rendered.called, url)
+            with mock.patch.object(fastpath, 'applies', return_value=False):
+                slow = self.client.get(f"/api/restaurant/{url}")
+            self.assertEqual(fast.status_code, 200, url)
+            self.assertEqual(fast.content, slow.content, url)
+
+
+    def test_plans_are_shared_and_bounded(self):
+        fastpath._plans.clear()
+        for fields in ('id,name', 'name,id', 'name,id,nope,nope2'):
+            self.client.get(f"/api/restaurant/product-items/?fields={fields}")
+        self.assertEqual(len(fastpath._plans), 1)
+        with mock.patch.object(fastpath, 'PLAN_CACHE_SIZE', 2):
+            for fields in ('id', 'name', 'price'):
+                self.client.get(f"/api/restaurant/product-items/?fields={fields}")
+        self.assertEqual([key[1] for key in fastpath._plans], [('name',), ('price',)])
+
+class SearchTests(TestCase):
+    def setUp(self):
+        self.main = MainCategory.objects.create(name="Mains")
+        self.biryani = ProductItem.objects.create(main_category=self.main, name="Chicken Biryani", price=10)
+        self.curry = ProductItem.objects.create(main_category=self.main, name="Chicken Curry", price=9,
+                                                description="Goes well with biryani rice")
+
+    def test_prefix_terms_rank_name_matches_first(self):
+        self.assertEqual(search_products("chick bir"), [self.biryani.id, self.curry.id])
+        self.assertEqual(search_products("bir")[0], self.biryani.id)
+
+    def test_index_follows_saves_deletes_and_category_names(self):
+        self.curry.name = "Paneer Tikka"
+        self.curry.save()
+        self.assertEqual(search_products("tikka"), [self.curry.id])
+        self.main.name = "Tandoor"
+        self.main.save()
+        self.assertEqual(len(search_products("tandoor")), 2)
+        self.biryani.delete()
+        self.assertEqual(search_products("tandoor"), [self.curry.id])
+
+    def test_saves_only_cascade_what_changed(self):
+        sub = SubCategory.objects.create(main_category=self.main, name="Rice")
+        ProductItem.objects.filter(id=self.biryani.id).update(sub_category=sub)
+        main = MainCategory.objects.get(id=self.main.id)
+        before = cascades.totals.copy()
+        with self.assertNumQueries(2):
+            # The row itself and the catalog version; no cascade, no reindex
+            main.description = "Curries and rice"
+            main.save()
+        self.assertEqual(cascades.totals, before)
+        main.is_active = False
+        main.save()
+        self.assertEqual(cascades.totals['main_category.is_active.rows'] - before['main_category.is_active.rows'], 3)
+        self.assertFalse(ProductItem.objects.filter(is_active=True).exists())
+        sub.name = "Biryanis"
+        sub.save()
+        self.assertEqual(cascades.totals['search.category'] - before['search.category'], 1)
+        self.assertEqual(search_products("biryanis", active_only=False), [self.biryani.id])
+
+
+@override_settings(QUERY_BUDGET_STRICT=True)
+class FacetTests(TestCase):
+    def setUp(self):
+        main = MainCategory.objects.create(name="Mains")
+        self.veg = ProductItem.objects.create(main_category=main, name="Dal", price=5, variant_type='Veg')
+        self.chicken = ProductItem.objects.create(main_category=main, name="Chicken", price=12, variant_type='Non-Veg')
+        self.paneer = ProductItem.objects.create(main_category=main, name="Paneer", price=9, variant_type='Veg', is_available=False)
+        self.paneer.offers.add(Offer.objects.create(name="Happy hour", discount_value=1))
+
+    def test_each_facet_ignores_its_own_filter(self):
+        result = facet_counts({'variant_type': ['Veg'], 'has_offer': True})
+        self.assertEqual(result['count'], 1)
+        variants = {f['value']: f['count'] for f in result['facets']['variant_type']}
+        self.assertEqual((variants['Veg'], variants['Non-Veg']), (1, 0))
+        self.assertEqual(result['facets']['has_offer'], [{'value': True, 'count': 1}, {'value': False, 'count': 1}])
+        self.assertEqual(result['facets']['price'], {'min': '9.00', 'max': '9.00'})
+
+    def test_filtered_list_keeps_sibling_positions(self):
+        client = APIClient()
+        client.force_authenticate(Users.objects.create_user(email='f@example.com', username='f', phone='1', password='x'))
+        for fast in (True, False):
+            with mock.patch.object(fastpath, 'applies', return_value=fast):
+                response = client.get("/api/restaurant/product-items/?variant_type=Veg&fields=id,display_order")
+            self.assertEqual(response.json(), [{'id': self.veg.id, 'display_order': 1}, {'id': self.paneer.id, 'display_order': 3}])
+            # Priced rows right after a catalog write also load a fresh offer index
+            CatalogVersion.bump()
+            with mock.patch.object(fastpath, 'applies', return_value=fast):
+                response = client.get("/api/restaurant/product-items/?variant_type=Veg")
+            self.assertEqual([(p['id'], p['pricing']['discount']) for p in response.json()], [(self.veg.id, '0.00'), (self.paneer.id, '1.00')])
+
+
+class OrderTests(TestCase):
+    def setUp(self):
+        main = MainCategory.objects.create(name="Mains")
+        self.dal = ProductItem.objects.create(main_category=main, name="Dal", price=10, tax_percentage=5, stock_available=3)
+        self.naan = ProductItem.objects.create(main_category=main, name="Naan", price=2, stock_available=10)
+
+    def test_placing_takes_stock_and_snapshots_prices(self):
+        order = place_order(None, [{'product': self.dal.id, 'quantity': 2}, {'product': self.naan.id, 'quantity': 1},
+                                   {'product': self.dal.id, 'quantity': 1}])
+        self.assertEqual((order.subtotal, order.tax, order.total), (32, Decimal('1.50'), Decimal('33.50')))
+        self.dal.refresh_from_db()
+        self.assertEqual(self.dal.stock_available, 0)
+        ProductItem.objects.filter(id=self.dal.id).update(price=99)
+        line = order.items.get(product=self.dal)
+        self.assertEqual((line.quantity, line.unit_price, line.line_total), (3, 10, Decimal('31.50')))
+
+    def test_shortfall_rejects_the_whole_order(self):
+        with self.assertRaises(OrderRejected) as raised:
+            place_order(None, [{'product': self.naan.id, 'quantity': 1}, {'product': self.dal.id, 'quantity': 4}])
+        self.assertIn(str(self.dal.id), raised.exception.errors['items'])
+        # A concurrent order emptied the shelf between the check and the update
+        with mock.patch('apps.restaurant.orders.check_lines', side_effect=[{}, {str(self.dal.id): ["Only 0 left."]}]):
+            ProductItem.objects.filter(id=self.dal.id).update(stock_available=0)
+            with self.assertRaises(OrderRejected):
+                place_order(None, [{'product': self.naan.id, 'quantity': 1}, {'product': self.dal.id, 'quantity': 1}])
+        self.assertEqual(Order.objects.count(), 0)
+        self.assertEqual(ProductItem.objects.get(id=self.naan.id).stock_available, 10)
+
+    def test_reads_leave_default_only_outside_transactions(self):
+        router = ReadWriteRouter()
+        with mock.patch.dict(connections.settings, {READ_ALIAS: connections.settings[DEFAULT_DB_ALIAS]}):
+            # The test case itself runs inside a transaction, whose writes only default can see
+            self.assertEqual(router.db_for_read(ProductItem), DEFAULT_DB_ALIAS)
+            with mock.patch.object(connection, 'in_atomic_block', False):
+                self.assertEqual(router.db_for_read(ProductItem), READ_ALIAS)
+                self.assertEqual(router.db_for_write(ProductItem), DEFAULT_DB_ALIAS)
+
+
+class RollupTests(TestCase):
+    def setUp(self):
+        main = MainCategory.objects.create(name="Mains")
+        self.dal = ProductItem.objects.create(main_category=main, name="Dal", price=10, stock_available=100)
+        self.owner = Users.objects.create_user(email='owner@example.com', username='owner', phone='1', password='x')
+        self.restaurant = Restaurant.objects.create(owner=self.owner, name="Spice")
+        self.orders = [place_order(None, [{'product': self.dal.id, 'quantity': n + 1}]) for n in range(4)]
+        # Spread over three hours of yesterday
+        for n, order in enumerate(self.orders):
+            Order.objects.filter(id=order.id).update(created_at=timezone.now() - timedelta(days=1, hours=n % 3))
+
+    def raw_sales(self):
+        return {(row['status'], row['orders'], row['total']) for row in
+                Order.objects.values('status').annotate(orders=Count('id'), total=Sum('total')).order_by()}
+
+    def rolled_sales(self):
+        return {(row['status'], row['orders'], row['total']) for row in
+                SalesRollup.objects.values('status').annotate(orders=Sum('orders'), total=Sum('total')).order_by()}
+
+    def test_refresh_recomputes_only_changed_hours(self):
+        first = rollups.refresh('sales', upto=timezone.now())
+        self.assertEqual((first['hours'], first['rows']), (3, 3))
+        self.assertEqual(self.rolled_sales(), self.raw_sales())
+        self.assertEqual(rollups.refresh('sales', upto=timezone.now())['hours'], 0)
+        # A status change lands in the bucket of the hour the order was created in
+        set_status(self.orders[0].id, 'cancelled')
+        second = rollups.refresh('sales', upto=timezone.now())
+        self.assertEqual(second['hours'], 1)
+        self.assertEqual(self.rolled_sales(), self.raw_sales())
+        self.assertEqual(SalesRollup.objects.aggregate(items=Sum('items'))['items'], 10)
+        before = set(SalesRollup.objects.values_list('bucket', 'status', 'orders', 'items', 'total'))
+        rollups.rebuild('sales')
+        self.assertEqual(set(SalesRollup.objects.values_list('bucket', 'status', 'orders', 'items', 'total')), before)
+
+    def test_deleted_rows_leave_their_hours_to_the_next_refresh(self):
+        rollups.refresh('sales', upto=timezone.now())
+        Order.objects.get(id=self.orders[0].id).delete()
+        Order.objects.filter(id=self.orders[1].id).delete()
+        refreshed = rollups.refresh('sales', upto=rollups.watermark('sales'))
+        self.assertEqual(refreshed['hours'], 2)
+        self.assertEqual(self.rolled_sales(), self.raw_sales())
+        self.assertFalse(RollupDirtyHour.objects.exists())
+        # Payments: the second success stops being a renewal once the first is gone
+        first, second = [PaymentTransaction.objects.create(restaurant=self.restaurant, transaction_id=f"tx{n}", amount=100,
+                                                           payment_status='success') for n in range(2)]
+        PaymentTransaction.objects.filter(id=second.id).update(created_at=first.created_at + timedelta(hours=2))
+        rollups.refresh('payments', upto=timezone.now())
+        self.assertEqual(PaymentRollup.objects.aggregate(renewals=Sum('renewals'))['renewals'], 1)
+        PaymentTransaction.objects.get(id=first.id).delete()
+        rollups.refresh('payments', upto=rollups.watermark('payments'))
+        self.assertEqual(list(PaymentRollup.objects.values_list('payments', 'renewals')), [(1, 0)])
+
+    def test_payment_report_is_limited_to_owned_restaurants(self):
+        other = Restaurant.objects.create(owner=Users.objects.create_user(email='b@example.com', username='b', phone='2', password='x'), name="Other")
+        for n, (restaurant, status_) in enumerate([(self.restaurant, 'success'), (self.restaurant, 'success'), (other, 'failed')]):
+            PaymentTransaction.objects.create(restaurant=restaurant, transaction_id=f"tx{n}", amount=100, payment_status=status_)
+        rollups.refresh('payments', upto=timezone.now())
+        self.owner.is_staff = True
+        staff = rollups.payment_report({'start': timezone.localdate(), 'end': timezone.localdate(), 'granularity': 'day'}, self.owner)
+        self.assertEqual(staff['totals']['failed']['payments'], 1)
+        self.owner.is_staff = False
+        owned = rollups.payment_report({'start': timezone.localdate(), 'end': timezone.localdate(), 'granularity': 'day'}, self.owner)
+        self.assertEqual(owned['totals'], {'success': {'payments': 2, 'amount': '200.00', 'renewals': 1}})
+
+    def test_sales_report_is_limited_to_owned_restaurants(self):
+        with tenancy.activate(self.restaurant.id):
+            main = MainCategory.objects.create(name="Mains")
+            naan = ProductItem.objects.create(main_category=main, name="Naan", price=2, stock_available=10)
+            order = place_order(None, [{'product': naan.id, 'quantity': 3}])
+        self.assertEqual(order.restaurant_id, self.restaurant.id)
+        rollups.refresh('sales', upto=timezone.now())
+        filters = {'start': timezone.localdate() - timedelta(days=1), 'end': timezone.localdate(), 'granularity': 'day'}
+        owned = rollups.sales_report(filters, self.owner)
+        self.assertEqual([(row['restaurant_id'], row['orders'], row['items']) for row in owned['rows']], [(self.restaurant.id, 1, 3)])
+        self.owner.is_staff = True
+        self.assertEqual(rollups.sales_report(filters, self.owner)['totals']['placed']['orders'], 5)
+        self.assertEqual(rollups.sales_report({**filters, 'restaurant': self.restaurant.id}, self.owner)['totals']['placed']['orders'], 1)
+
+
+class SettlementTests(TestCase):
+    def setUp(self):
+        owner = Users.objects.create_user(email='owner@example.com', username='owner', phone='1', password='x')
+        self.restaurant = Restaurant.objects.create(owner=owner, name="Spice")
+        SubscriptionPlan.objects.create(name='basic', price=499, duration_days=30)
+
+    def settle(self, *rows):
+        lines = ['transaction_id,restaurant,amount,status,plan'] + [','.join(map(str, row)) for row in rows]
+        return SettlementImporter(chunk_size=2).run(io.StringIO('\n'.join(lines)), 'csv')
+
+    def test_transitions_upsert_and_replays_write_nothing(self):
+        r = self.restaurant.id
+        first = self.settle(('tx1', r, '499', 'pending', 'basic'), ('tx2', r, '499', 'pending', 'basic'), ('tx3', 99, '10', 'success', ''))
+        self.assertEqual((first['created'], first['failed']), (2, 1))
+        rows = [('tx1', r, '499', 'success', 'basic'), ('tx2', r, '499.00', 'failed', 'basic'), ('tx4', r, '499', 'success', 'basic')]
+        second = self.settle(*rows)
+        self.assertEqual((second['created'], second['updated'], second['subscriptions']['activated']), (1, 2, 2))
+        self.assertEqual(dict(PaymentTransaction.objects.values_list('transaction_id', 'payment_status')),
+                         {'tx1': 'success', 'tx2': 'failed', 'tx4': 'success'})
+        self.assertEqual(PaymentTransaction.history.filter(transaction_id='tx1').count(), 2)
+        subscription = RestaurantSubscription.objects.get(restaurant=self.restaurant)
+        # Two successful payments buy two consecutive periods
+        self.assertEqual((subscription.is_active, subscription.payment_reference), (True, 'tx4'))
+        self.assertEqual(subscription.end_date - subscription.start_date, timedelta(days=60))
+        with self.assertNumQueries(3):
+            replay = self.settle(*rows)
+        self.assertEqual((replay['unchanged'], replay['created'], replay['updated']), (3, 0, 0))
+        conflict = self.settle(('tx1', r, '499', 'failed', 'basic'))
+        self.assertEqual(conflict['conflicts'], [{'row': 1, 'transaction_id': 'tx1', 'reason': "status failed after settled success"}])
+
+    def test_rows_without_plan_or_method_keep_the_stored_ones(self):
+        r = self.restaurant.id
+        SettlementImporter().run(io.StringIO(f"transaction_id,restaurant,amount,status,plan,method\ntx1,{r},499,pending,basic,card"), 'csv')
+        report = SettlementImporter().run(io.StringIO(f"transaction_id,restaurant,amount,status\ntx1,{r},499.00,success"), 'csv')
+        self.assertEqual((report['updated'], report['subscriptions']['activated']), (1, 1))
+        payment = PaymentTransaction.objects.select_related('plan').get(transaction_id='tx1')
+        self.assertEqual((payment.payment_status, payment.plan.name, payment.payment_method), ('success', 'basic', 'card'))
+        self.assertTrue(RestaurantSubscription.objects.get(restaurant=self.restaurant).is_active)
+
+
+@override_settings(QUERY_BUDGET_STRICT=True)
+class TenancyTests(TestCase):
+    def setUp(self):
+        self.owner = Users.objects.create_user(email='owner@example.com', username='owner', phone='1', password='x')
+        self.a = Restaurant.objects.create(owner=self.owner, name="Spice")
+        self.b = Restaurant.objects.create(owner=self.owner, name="Grill")
+        for restaurant, dish in ((self.a, "Chicken Biryani"), (self.b, "Chicken Burger")):
+            with tenancy.activate(restaurant.id):
+                main = MainCategory.objects.create(name="Mains")
+                ProductItem.objects.create(main_category=main, name=dish, price=10, stock_available=5)
+        # The default catalog has been written before; its first ever write also creates its version row
+        CatalogVersion.current()
+        self.client = APIClient()
+        self.client.force_authenticate(self.owner)
+
+    def get(self, path, restaurant):
+        return self.client.get(path, HTTP_X_RESTAURANT=str(restaurant))
+
+    def test_lists_search_and_writes_stay_in_their_restaurant(self):
+        names = [p['name'] for p in self.get('/api/restaurant/product-items/', self.a.id).json()]
+        self.assertEqual(names, ["Chicken Biryani"])
+        found = self.get('/api/restaurant/search/?q=chick', self.b.id).json()
+        self.assertEqual([p['name'] for p in found], ["Chicken Burger"])
+        self.assertEqual(self.client.get('/api/restaurant/product-items/').json(), [])
+        self.assertEqual(self.get('/api/restaurant/product-items/', 'x').status_code, 400)
+        self.assertEqual(self.get('/api/restaurant/product-items/', 999).status_code, 404)
+        duplicate = self.client.post('/api/restaurant/main-categories/', {'name': "Mains"}, HTTP_X_RESTAURANT=str(self.a.id))
+        self.assertEqual(duplicate.status_code, 400)
+        self.assertEqual(self.client.post('/api/restaurant/main-categories/', {'name': "Mains"}).status_code, 201)
+        self.assertEqual(MainCategory.all_objects.filter(name="Mains").count(), 3)
+
+    def test_a_write_only_invalidates_its_own_restaurant(self):
+        etags = {r.id: self.get('/api/restaurant/menu/', r.id)['ETag'] for r in (self.a, self.b)}
+        self.assertNotEqual(etags[self.a.id], etags[self.b.id])
+        version_b = CatalogVersion.current(self.b.id)
+        with tenancy.activate(self.a.id):
+            product = ProductItem.objects.get()
+            product.price = 12
+            product.save()
+        self.assertNotEqual(self.get('/api/restaurant/menu/', self.a.id)['ETag'], etags[self.a.id])
+        self.assertEqual(self.get('/api/restaurant/menu/', self.b.id)['ETag'], etags[self.b.id])
+        self.assertEqual(CatalogVersion.current(self.b.id), version_b)
+
+    def test_only_the_restaurants_people_may_change_it(self):
+        cook = Users.objects.create_user(email='cook@example.com', username='cook', phone='2', password='x')
+        client = APIClient()
+        client.force_authenticate(cook)
+        with tenancy.activate(self.a.id):
+            product, main = ProductItem.objects.get(), MainCategory.objects.get()
+        calls = {
+            'update': lambda: client.put(f'/api/restaurant/product-items/update/{product.id}/', {'description': "Mine"},
+                                         format='multipart', HTTP_X_RESTAURANT=str(self.a.id)),
+            'create': lambda: client.post('/api/restaurant/main-categories/', {'name': "Sides"}, HTTP_X_RESTAURANT=str(self.a.id)),
+            'detail': lambda: client.get(f'/api/restaurant/main-categories/{main.id}/', HTTP_X_RESTAURANT=str(self.a.id)),
+        }
+        for name, call in calls.items():
+            with self.subTest(name):
+                response = call()
+                self.assertEqual(response.status_code, 403)
+                self.assertIn('restaurant', response.json()['errors'])
+        # Reading the menu and the default catalog stay open to everyone
+        self.assertEqual(client.get('/api/restaurant/menu/', HTTP_X_RESTAURANT=str(self.a.id)).status_code, 200)
+        self.assertEqual(client.post('/api/restaurant/main-categories/', {'name': "Sides"}).status_code, 201)
+        membership = RestaurantMember.objects.create(restaurant=self.a, user=cook)
+        self.assertEqual({name: call().status_code for name, call in calls.items()}, {'update': 200, 'create': 201, 'detail': 200})
+        self.assertTrue(tenancy.can_access(ClaimsUser(ClaimsRefreshToken.for_user(cook).access_token), self.a.id))
+        self.assertFalse(tenancy.can_access(cook, self.b.id))
+        membership.delete()
+        self.assertEqual(calls['update']().status_code, 403)
+
+    def test_orders_and_the_kitchen_stay_in_their_restaurant(self):
+        Users.objects.filter(pk=self.owner.pk).update(is_staff=True)
+        self.owner.is_staff = True
+        with tenancy.activate(self.a.id):
+            order = place_order(self.owner, [{'product': ProductItem.objects.get().id, 'quantity': 1}])
+        self.assertEqual(order.restaurant_id, self.a.id)
+        self.assertEqual([o['id'] for o in self.get('/api/restaurant/orders/', self.a.id).json()['results']], [order.id])
+        self.assertEqual(self.get('/api/restaurant/orders/', self.b.id).json()['results'], [])
+        self.assertEqual(self.get(f'/api/restaurant/orders/{order.id}/', self.b.id).status_code, 404)
+        self.assertEqual(self.get('/api/restaurant/kitchen/queue/', self.b.id).json()['tickets'], [])
+        self.assertEqual(len(self.get('/api/restaurant/kitchen/queue/', self.a.id).json()['tickets']), 1)
+        with tenancy.activate(self.b.id), self.assertRaises(Order.DoesNotExist):
+            set_status(order.id, 'preparing')
+
+
+    def test_import_menu_fills_the_named_restaurants_catalog(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, 'menu.csv')
+            with open(path, 'w') as f:
+                f.write("name,main_category,price\nMutton Biryani,Mains,12\nLassi,Drinks,3\n")
+            call_command('import_menu', path, restaurant=self.a.id, stdout=io.StringIO())
+            with self.assertRaisesMessage(CommandError, "No open restaurant with id 999"):
+                call_command('import_menu', path, restaurant=999, stdout=io.StringIO())
+        with tenancy.activate(self.a.id):
+            self.assertEqual(sorted(ProductItem.objects.values_list('name', flat=True)), ["Chicken Biryani", "Lassi", "Mutton Biryani"])
+            # Imported under the restaurant's own "Mains", not a new one
+            self.assertEqual(sorted(MainCategory.objects.values_list('name', flat=True)), ["Drinks", "Mains"])
+        with tenancy.activate(self.b.id):
+            self.assertEqual(ProductItem.objects.count(), 1)
+        self.assertFalse(ProductItem.objects.exists())
+
+    def test_a_chef_only_works_their_own_restaurants_kitchen(self):
+        chef = Users.objects.create_user(email='chef@example.com', username='chef', phone='3', password='x')
+        chef.role = Role.objects.create(role_name="Chef", role_category='chef')
+        chef.save()
+        RestaurantMember.objects.create(restaurant=self.a, user=chef)
+        # Members work under their restaurant's subscription
+        RestaurantSubscription.objects.create(restaurant=self.a)
+        with tenancy.activate(self.b.id):
+            order = place_order(self.owner, [{'product': ProductItem.objects.get().id, 'quantity': 1}])
+        client = APIClient()
+        client.force_authenticate(chef)
+        self.assertEqual(client.get('/api/restaurant/kitchen/queue/', HTTP_X_RESTAURANT=str(self.a.id)).status_code, 200)
+        self.assertEqual(client.get('/api/restaurant/kitchen/queue/', HTTP_X_RESTAURANT=str(self.b.id)).status_code, 403)
+        self.assertEqual(client.get('/api/restaurant/orders/', HTTP_X_RESTAURANT=str(self.b.id)).json()['results'], [])
+        moved = client.put(f'/api/restaurant/orders/update/{order.id}/', {'status': 'preparing'}, format='json',
+                           HTTP_X_RESTAURANT=str(self.b.id))
+        self.assertEqual(moved.status_code, 403)
+        token = ClaimsRefreshToken.for_user(chef).access_token
+        stream = async_to_sync(AsyncClient().get)(f"/api/restaurant/kitchen/stream/?token={token}", headers={'X-Restaurant': str(self.b.id)})
+        self.assertEqual((stream.status_code, list(json.loads(stream.content)['errors'])), (403, ['permission']))
+
+
+class WriteAtomicTests(TransactionTestCase):
+    def test_only_transactions_that_read_first_begin_immediate(self):
+        with CaptureQueriesContext(connection) as queries:
+            with transaction.atomic():
+                ProductItem.objects.exists()
+            with write_atomic():
+                ProductItem.objects.exists()
+                with write_atomic():
+                    ProductItem.objects.exists()
+        self.assertEqual([q['sql'] for q in queries if q['sql'].startswith('BEGIN')], ['BEGIN', 'BEGIN IMMEDIATE'])
+        self.assertIsNone(connection.transaction_mode)
+
+class KitchenTests(TestCase):
+    def setUp(self):
+        main = MainCategory.objects.create(name="Mains")
+        self.curry = ProductItem.objects.create(main_category=main, name="Curry", price=9, prepare_time=20, stock_available=5)
+        self.naan = ProductItem.objects.create(main_category=main, name="Naan", price=2, prepare_time=5, stock_available=5)
+        self.chef = Users.objects.create_user(email='chef@example.com', username='chef', phone='2', password='x')
+        Users.objects.filter(pk=self.chef.pk).update(is_staff=True)
+        self.chef.is_staff = True
+        # The stream takes a token, so the chef needs a subscription like any token user
+        RestaurantSubscription.objects.create(restaurant=Restaurant.objects.create(owner=self.chef, name="Spice"))
+
+    def place(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            return place_order(self.chef, [{'product': self.naan.id, 'quantity': 2}, {'product': self.curry.id, 'quantity': 1}])
+
+    def test_items_fire_so_the_order_finishes_together(self):
+        order = self.place()
+        ticket = kitchen.kitchen_queue()['tickets'][0]
+        self.assertEqual(ticket['due_at'], order.created_at + timedelta(minutes=20))
+        self.assertEqual([(i['name'], i['fire_at']) for i in ticket['items']],
+                         [("Curry", order.created_at), ("Naan", order.created_at + timedelta(minutes=15))])
+        set_status(order.id, 'cancelled')
+        self.assertEqual(kitchen.kitchen_queue()['tickets'], [])
+        self.assertEqual(ProductItem.objects.get(id=self.naan.id).stock_available, 5)
+
+    async def test_stream_pushes_snapshot_then_tickets(self):
+        token = await sync_to_async(lambda: str(ClaimsRefreshToken.for_user(self.chef).access_token))()
+        response = await AsyncClient().get(f"/api/restaurant/kitchen/stream/?token={token}")
+        self.assertEqual(response['Content-Type'], 'text/event-stream')
+        events = aiter(response.streaming_content)
+        self.assertTrue((await anext(events)).startswith(b"retry:"))
+        self.assertIn(b'"tickets":[]', await anext(events))
+        order = await sync_to_async(self.place)()
+        pushed = await anext(events)
+        self.assertTrue(pushed.startswith(b"event: ticket"))
+        self.assertIn(f'"order":{order.id}'.encode(), pushed)
+        # A disconnecting screen cancels the task reading its stream, as the ASGI handler does
+        waiting = asyncio.ensure_future(anext(events))
+        await asyncio.sleep(0)
+        waiting.cancel()
+        with self.assertRaises(asyncio.CancelledError):
+            await waiting
+        self.assertEqual(kitchen.get_broker().subscribers, set())
@@ -3,21 +3,28 @@ from apps.restaurant.views import *
 
 urlpatterns = [
     path('product-choices/', get_product_choices, name='product-choices'),
+    path('menu/', menu_snapshot, name='menu_snapshot'),
+    path('search/', product_search, name='product_search'),
     # ================== PRODUCT ITEMS ==================
     path('product-items/', product_items_list_create, name='product_items_list_create'),
+    path('product-items/facets/', product_item_facets, name='product_item_facets'),
     path('product-items/<int:id>/', product_item_detail, name='product_item_detail'),
     path('product-items/update/<int:id>/', product_item_update, name='product_item_update'),
     path('product-items/delete/<int:id>/', product_item_delete, name='product_item_delete'),
+    path('product-items/reorder/', product_item_reorder, name='product_item_reorder'),
+    path('product-items/import/', product_items_import, name='product_items_import'),
     # ================== MAIN CATEGORIES ==================
     path('main-categories/', main_category_list_create, name='main_category_list_create'),
     path('main-categories/<int:id>/', main_category_detail, name='main_category_detail'),
     path('main-categories/update/<int:id>/', main_category_update, name='main_category_update'),
     path('main-categories/delete/<int:id>/', main_category_delete, name='main_category_delete'),
+    path('main-categories/reorder/', main_category_reorder, name='main_category_reorder'),
     # ================== SUB CATEGORIES ==================
     path('sub-categories/', sub_category_list_create, name='sub_category_list_create'),
     path('sub-categories/<int:id>/', sub_category_detail, name='sub_category_detail'),
     path('sub-categories/update/<int:id>/', sub_category_update, name='sub_category_update'),
     path('sub-categories/delete/<int:id>/', sub_category_delete, name='sub_category_delete'),
+    path('sub-categories/reorder/', sub_category_reorder, name='sub_category_reorder'),
     # ================== OFFERS ==================
     path('offers/', offer_list_create, name='offer_list_create'),
     path('offers/<int:id>/', offer_detail, name='offer_detail'),
@@ -27,4 +34,16 @@ urlpatterns = [
     path('product-reviews/', product_review_list_create, name='product_review_list_create'),
     path('product-reviews/<int:id>/', product_review_detail, name='product_review_detail'),
     path('product-reviews/delete/<int:id>/', product_review_delete, name='product_review_delete'),
+    # ================== ORDERS ==================
+    path('orders/', order_list_create, name='order_list_create'),
+    path('orders/<int:id>/', order_detail, name='order_detail'),
+    path('orders/update/<int:id>/', order_update, name='order_update'),
+    # ================== KITCHEN DISPLAY ==================
+    path('kitchen/queue/', kitchen_queue_view, name='kitchen_queue'),
+    path('kitchen/stream/', kitchen_stream, name='kitchen_stream'),
+    # ================== REPORTS ==================
+    path('reports/sales/', sales_report_view, name='sales_report'),
+    path('reports/payments/', payment_report_view, name='payment_report'),
+    # ================== PAYMENT SETTLEMENTS ==================
+    path('payments/settlements/', payment_settlements_import, name='payment_settlements_import'),
 ]
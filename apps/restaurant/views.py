@@ -1,24 +1,91 @@
+import asyncio
+import json
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.handlers.asgi import ASGIRequest
 from django.shortcuts import get_object_or_404
 from rest_framework.decorators import api_view, permission_classes, parser_classes
-from rest_framework.permissions import IsAuthenticated
+from rest_framework.permissions import IsAdminUser, IsAuthenticated
 from rest_framework.parsers import MultiPartParser, FormParser, JSONParser
 from rest_framework.response import Response
 from rest_framework import status
-from django.db.models import Max
-from django.http import QueryDict
+from rest_framework_simplejwt.exceptions import AuthenticationFailed, InvalidToken
+from django.http import HttpResponse, JsonResponse, QueryDict, StreamingHttpResponse
+from django.utils.http import parse_etags
+from apps.authentication.authentication import ClaimsJWTAuthentication
+from apps.authentication.subscriptions import EXPIRED, may_use_api
 from .models import *
 from .serializers import *
+from .importer import CatalogImporter, detect_format, to_text_stream
+from .menu import get_menu_snapshot, menu_etag
+from .pagination import keyset_page, wants_page
+from .pricing import PriceBook
+from .search import search_products
+from .facets import facet_counts, filter_products
+from .orders import OrderRejected, place_order, set_status
+from .kitchen import is_kitchen_user, kitchen_queue
+from .permissions import IsRestaurantMember, IsRestaurantMemberOrReadOnly
+from .rollups import is_report_user, payment_report, sales_report
+from .settlements import SettlementImporter
+from . import kitchen
+from . import fastpath
+from . import tenancy
+
+# display_order is resolved by RankedModel.save(): a missing or zero value
+# appends on create and keeps the current position on update.
+
+# ============================================================
+# HELPER FUNCTION — apply a full drag-and-drop ordering
+# ============================================================
+def reorder_siblings(request, model, parent_fields=()):
+    ids = request.data.get("ids")
+    if not isinstance(ids, list) or not ids:
+        return Response({"errors": {"ids": ["A non-empty list of ids is required."]}}, status=status.HTTP_400_BAD_REQUEST)
+    scope = {}
+    for field in parent_fields:
+        value = request.data.get(field)
+        if value in (None, "", "null"):
+            # Products may sit directly under a main category
+            if field == "main_category":
+                return Response({"errors": {field: ["This field is required."]}}, status=status.HTTP_400_BAD_REQUEST)
+            value = None
+        scope[f"{field}_id"] = value
+    try:
+        model.reorder([int(i) for i in ids], **scope)
+    except (TypeError, ValueError) as e:
+        return Response({"errors": {"ids": [str(e)]}}, status=status.HTTP_400_BAD_REQUEST)
+    order = [{"id": int(i), "display_order": n} for n, i in enumerate(ids, 1)]
+    return Response({"message": f"{model._meta.verbose_name.capitalize()} order updated", "data": order}, status=status.HTTP_200_OK)
 
 # ============================================================
-# HELPER FUNCTION — assign display order automatically
+# HELPER FUNCTION — list response with ?fields= and keyset pages
 # ============================================================
-def assign_display_order(model, data, parent_field=None):
-    if not data.get("display_order") or data.get("display_order") == 0:
-        qs = model.objects.all()
-        if parent_field and data.get(parent_field):
-            qs = qs.filter(**{parent_field: data[parent_field]})
-        data["display_order"] = (qs.aggregate(Max("display_order"))["display_order__max"] or 0) + 1
-    return data
+def list_response(request, qs, serializer_class, keys, context=None, filtered=False):
+    # filtered: qs skips siblings, so display_order cannot be counted from it
+    fields = [f.strip() for f in request.query_params.get('fields', '').split(',') if f.strip()] or None
+    qs = serializer_class.restrict_queryset(qs, fields)
+    ranked = issubclass(qs.model, RankedModel) and (not fields or 'display_order' in fields)
+    if fastpath.applies(request, serializer_class):
+        try:
+            return fastpath.list_response(request, qs, serializer_class, fields, keys, ranked, context, filtered)
+        except ValueError as e:
+            return Response({"errors": {"pagination": [str(e)]}}, status=status.HTTP_400_BAD_REQUEST)
+    if not wants_page(request):
+        if not ranked:
+            rows = qs
+        elif filtered:
+            rows = qs.model.assign_sparse_positions(list(qs))
+        else:
+            rows = qs.with_display_order()
+        return Response(serializer_class(rows, many=True, fields=fields, context=context).data)
+    try:
+        rows, next_cursor = keyset_page(request, qs, keys)
+    except ValueError as e:
+        return Response({"errors": {"pagination": [str(e)]}}, status=status.HTTP_400_BAD_REQUEST)
+    if ranked:
+        (qs.model.assign_sparse_positions if filtered else qs.model.assign_positions)(rows)
+    data = serializer_class(rows, many=True, fields=fields, context=context).data
+    return Response({"results": data, "next_cursor": next_cursor})
 
 # ============================================================
 # PRODUCT CHOICES
@@ -34,56 +101,98 @@ def get_product_choices(request):
     except Exception as e:
         return Response({"error": str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
+# ============================================================
+# MENU SNAPSHOT
+# ============================================================
+@api_view(['GET'])
+def menu_snapshot(request):
+    book = PriceBook.current()
+    etag = menu_etag(book)
+    client_etags = [e.removeprefix('W/') for e in parse_etags(request.headers.get('If-None-Match', ''))]
+    if etag in client_etags or '*' in client_etags:
+        response = HttpResponse(status=status.HTTP_304_NOT_MODIFIED)
+    else:
+        response = HttpResponse(get_menu_snapshot(request, book), content_type='application/json')
+    response['ETag'] = etag
+    response['Cache-Control'] = 'no-cache'
+    return response
+
+# ============================================================
+# MENU SEARCH — ?q=chick bir (prefix match, best first)
+# ============================================================
+SEARCH_FIELDS = ['id', 'name', 'slug', 'main_category', 'sub_category', 'price', 'currency_symbol',
+                 'is_available', 'image_url', 'pricing']
+SEARCH_LIMIT, MAX_SEARCH_LIMIT = 20, 100
+
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+def product_search(request):
+    limit = request.query_params.get('limit') or SEARCH_LIMIT
+    if not str(limit).isdigit() or int(limit) < 1:
+        return Response({"errors": {"limit": ["limit must be a positive integer"]}}, status=status.HTTP_400_BAD_REQUEST)
+    # display_order is a position in the full sibling list, which a result set does not have
+    fields = [f.strip() for f in request.query_params.get('fields', '').split(',') if f.strip() and f.strip() != 'display_order'] or SEARCH_FIELDS
+    ids = search_products(request.query_params.get('q', ''), min(int(limit), MAX_SEARCH_LIMIT))
+    qs = ProductItemSerializer.restrict_queryset(ProductItem.objects.filter(id__in=ids), fields)
+    if fastpath.applies(request, ProductItemSerializer):
+        return fastpath.ordered_response(qs, ProductItemSerializer, fields, ids, context={'request': request})
+    rows = sorted(qs, key=lambda p: ids.index(p.id))
+    return Response(ProductItemSerializer(rows, many=True, fields=fields, context={'request': request}).data)
+
 # ============================================================
 # MAIN CATEGORY
 # ============================================================
 @api_view(['GET', 'POST'])
-@permission_classes([IsAuthenticated])
+@permission_classes([IsAuthenticated, IsRestaurantMemberOrReadOnly])
 def main_category_list_create(request):
     if request.method == 'GET':
-        return Response(MainCategorySerializer(MainCategory.objects.all(), many=True).data)
+        return Response(MainCategorySerializer(MainCategory.objects.with_display_order(), many=True).data)
 
-    data = assign_display_order(MainCategory, request.data)
-    s = MainCategorySerializer(data=data)
+    s = MainCategorySerializer(data=request.data)
     if s.is_valid():
         s.save()
         return Response({"message": "Main category added", "data": s.data}, status=status.HTTP_201_CREATED)
     return Response({"errors": s.errors}, status=status.HTTP_400_BAD_REQUEST)
 
 @api_view(['GET'])
+@permission_classes([IsRestaurantMember])
 def main_category_detail(request, id):
     obj = get_object_or_404(MainCategory, id=id)
     return Response(MainCategorySerializer(obj).data)
 
 @api_view(['PUT'])
-@permission_classes([IsAuthenticated])
+@permission_classes([IsAuthenticated, IsRestaurantMember])
 def main_category_update(request, id):
     obj = get_object_or_404(MainCategory, id=id)
-    data = assign_display_order(MainCategory, request.data)
-    s = MainCategorySerializer(obj, data=data, partial=True)
+    s = MainCategorySerializer(obj, data=request.data, partial=True)
     if s.is_valid():
         s.save()
         return Response({"message": "Main category updated", "data": s.data}, status=status.HTTP_200_OK)
     return Response({"errors": s.errors}, status=status.HTTP_400_BAD_REQUEST)
 
 @api_view(['DELETE'])
-@permission_classes([IsAuthenticated])
+@permission_classes([IsAuthenticated, IsRestaurantMember])
 def main_category_delete(request, id):
     obj = get_object_or_404(MainCategory, id=id)
     obj.delete()
     return Response({"message": "Main category deleted"}, status=status.HTTP_204_NO_CONTENT)
 
+@api_view(['PUT'])
+@permission_classes([IsAuthenticated, IsRestaurantMember])
+def main_category_reorder(request):
+    return reorder_siblings(request, MainCategory)
+
 # ============================================================
 # SUB CATEGORY
 # ============================================================
 @api_view(['GET', 'POST'])
-@permission_classes([IsAuthenticated])
+@permission_classes([IsAuthenticated, IsRestaurantMemberOrReadOnly])
 def sub_category_list_create(request):
     if request.method == 'GET':
-        return Response(SubCategorySerializer(SubCategory.objects.all(), many=True).data)
+        qs = SubCategory.objects.select_related('main_category')
+        return list_response(request, qs, SubCategorySerializer, ('rank', 'id'))
 
-    data = assign_display_order(SubCategory, request.data, 'main_category')
-    s = SubCategorySerializer(data=data)
+    s = SubCategorySerializer(data=request.data)
     if s.is_valid():
         s.save()
         return Response({"message": "Sub category added", "data": s.data}, status=status.HTTP_201_CREATED)
@@ -91,58 +200,72 @@ def sub_category_list_create(request):
 
 @api_view(['GET'])
 def sub_category_detail(request, id):
-    obj = get_object_or_404(SubCategory, id=id)
+    obj = get_object_or_404(SubCategory.objects.select_related('main_category'), id=id)
     return Response(SubCategorySerializer(obj).data)
 
 @api_view(['PUT'])
-@permission_classes([IsAuthenticated])
+@permission_classes([IsAuthenticated, IsRestaurantMember])
 def sub_category_update(request, id):
     obj = get_object_or_404(SubCategory, id=id)
-    data = assign_display_order(SubCategory, request.data, 'main_category')
-    s = SubCategorySerializer(obj, data=data, partial=True)
+    s = SubCategorySerializer(obj, data=request.data, partial=True)
     if s.is_valid():
         s.save()
         return Response({"message": "Sub category updated", "data": s.data}, status=status.HTTP_200_OK)
     return Response({"errors": s.errors}, status=status.HTTP_400_BAD_REQUEST)
 
 @api_view(['DELETE'])
-@permission_classes([IsAuthenticated])
+@permission_classes([IsAuthenticated, IsRestaurantMember])
 def sub_category_delete(request, id):
     obj = get_object_or_404(SubCategory, id=id)
     obj.delete()
     return Response({"message": "Sub category deleted"}, status=status.HTTP_204_NO_CONTENT)
 
+@api_view(['PUT'])
+@permission_classes([IsAuthenticated, IsRestaurantMember])
+def sub_category_reorder(request):
+    return reorder_siblings(request, SubCategory, ('main_category',))
+
 # ============================================================
 # PRODUCT ITEMS
 # ============================================================
 @api_view(['GET', 'POST'])
-@permission_classes([IsAuthenticated])
+@permission_classes([IsAuthenticated, IsRestaurantMemberOrReadOnly])
 @parser_classes([MultiPartParser, FormParser, JSONParser])
 def product_items_list_create(request):
     if request.method == 'GET':
+        filters = ProductFilterSerializer(data=request.query_params)
+        if not filters.is_valid():
+            return Response({"errors": filters.errors}, status=status.HTTP_400_BAD_REQUEST)
         qs = ProductItem.objects.select_related('main_category', 'sub_category').prefetch_related('offers')
-        return Response(ProductItemSerializer(qs, many=True, context={'request': request}).data)
+        qs = filter_products(qs, filters.validated_data)
+        return list_response(request, qs, ProductItemSerializer, ('rank', 'id'), context={'request': request},
+                             filtered=bool(filters.validated_data))
 
-    data = {**request.data.dict(), **request.FILES} if isinstance(request.data, QueryDict) else {**request.data, **request.FILES}
-    data = assign_display_order(ProductItem, data, 'sub_category')
+    data = {**request.data.dict(), **request.FILES.dict()} if isinstance(request.data, QueryDict) else {**request.data, **request.FILES.dict()}
     serializer = ProductItemSerializer(data=data, context={'request': request})
     if serializer.is_valid():
         serializer.save(created_by=request.user)
         return Response({"message": "Product created", "data": serializer.data}, status=status.HTTP_201_CREATED)
     return Response({"errors": serializer.errors}, status=status.HTTP_400_BAD_REQUEST)
 
+@api_view(['GET'])
+def product_item_facets(request):
+    filters = ProductFilterSerializer(data=request.query_params)
+    if not filters.is_valid():
+        return Response({"errors": filters.errors}, status=status.HTTP_400_BAD_REQUEST)
+    return Response(facet_counts(filters.validated_data))
+
 @api_view(['GET'])
 def product_item_detail(request, id):
-    obj = get_object_or_404(ProductItem, id=id)
+    obj = get_object_or_404(ProductItem.objects.prefetch_related('offers'), id=id)
     return Response(ProductItemSerializer(obj, context={'request': request}).data)
 
 @api_view(['PUT'])
-@permission_classes([IsAuthenticated])
+@permission_classes([IsAuthenticated, IsRestaurantMember])
 @parser_classes([MultiPartParser, FormParser])
 def product_item_update(request, id):
     obj = get_object_or_404(ProductItem, id=id)
-    data = {**request.data.dict(), **request.FILES} if isinstance(request.data, QueryDict) else {**request.data, **request.FILES}
-    data = assign_display_order(ProductItem, data, 'sub_category')
+    data = {**request.data.dict(), **request.FILES.dict()} if isinstance(request.data, QueryDict) else {**request.data, **request.FILES.dict()}
     serializer = ProductItemSerializer(obj, data=data, partial=True, context={'request': request})
     if serializer.is_valid():
         serializer.save()
@@ -150,17 +273,40 @@ def product_item_update(request, id):
     return Response({"errors": serializer.errors}, status=status.HTTP_400_BAD_REQUEST)
 
 @api_view(['DELETE'])
-@permission_classes([IsAuthenticated])
+@permission_classes([IsAuthenticated, IsRestaurantMember])
 def product_item_delete(request, id):
     obj = get_object_or_404(ProductItem, id=id)
     obj.delete()
     return Response({"message": "Product deleted"}, status=status.HTTP_204_NO_CONTENT)
 
+@api_view(['POST'])
+@permission_classes([IsAuthenticated, IsRestaurantMember])
+@parser_classes([MultiPartParser])
+def product_items_import(request):
+    upload = request.FILES.get('file')
+    if not upload:
+        return Response({"errors": {"file": ["A CSV or JSON file is required."]}}, status=status.HTTP_400_BAD_REQUEST)
+    try:
+        fmt = request.data.get('format') or detect_format(upload.name)
+    except ValueError as e:
+        return Response({"errors": {"file": [str(e)]}}, status=status.HTTP_400_BAD_REQUEST)
+    if fmt not in ('csv', 'json'):
+        return Response({"errors": {"format": ["Use csv or json."]}}, status=status.HTTP_400_BAD_REQUEST)
+    create_categories = str(request.data.get('create_categories', 'true')).lower() != 'false'
+    report = CatalogImporter(user=request.user, create_categories=create_categories).run(to_text_stream(upload.file), fmt)
+    code = status.HTTP_201_CREATED if report['created'] else status.HTTP_400_BAD_REQUEST
+    return Response({"message": f"{report['created']} products imported", "data": report}, status=code)
+
+@api_view(['PUT'])
+@permission_classes([IsAuthenticated, IsRestaurantMember])
+def product_item_reorder(request):
+    return reorder_siblings(request, ProductItem, ('main_category', 'sub_category'))
+
 # ============================================================
 # OFFERS
 # ============================================================
 @api_view(['GET', 'POST'])
-@permission_classes([IsAuthenticated])
+@permission_classes([IsAuthenticated, IsRestaurantMemberOrReadOnly])
 def offer_list_create(request):
     if request.method == 'GET':
         return Response(OfferSerializer(Offer.objects.all(), many=True).data)
@@ -177,7 +323,7 @@ def offer_detail(request, id):
     return Response(OfferSerializer(obj).data)
 
 @api_view(['PUT'])
-@permission_classes([IsAuthenticated])
+@permission_classes([IsAuthenticated, IsRestaurantMember])
 def offer_update(request, id):
     obj = get_object_or_404(Offer, id=id)
     s = OfferSerializer(obj, data=request.data, partial=True)
@@ -187,7 +333,7 @@ def offer_update(request, id):
     return Response({"errors": s.errors}, status=status.HTTP_400_BAD_REQUEST)
 
 @api_view(['DELETE'])
-@permission_classes([IsAuthenticated])
+@permission_classes([IsAuthenticated, IsRestaurantMember])
 def offer_delete(request, id):
     obj = get_object_or_404(Offer, id=id)
     obj.delete()
@@ -200,7 +346,8 @@ def offer_delete(request, id):
 @permission_classes([IsAuthenticated])
 def product_review_list_create(request):
     if request.method == 'GET':
-        return Response(ProductReviewSerializer(ProductReview.objects.all(), many=True).data)
+        qs = ProductReview.objects.select_related('product')
+        return list_response(request, qs, ProductReviewSerializer, ('-created_at', '-id'))
 
     s = ProductReviewSerializer(data=request.data)
     if s.is_valid():
@@ -210,7 +357,7 @@ def product_review_list_create(request):
 
 @api_view(['GET'])
 def product_review_detail(request, id):
-    obj = get_object_or_404(ProductReview, id=id)
+    obj = get_object_or_404(ProductReview.objects.select_related('product'), id=id)
     return Response(ProductReviewSerializer(obj).data)
 
 @api_view(['DELETE'])
@@ -219,3 +366,148 @@ def product_review_delete(request, id):
     obj = get_object_or_404(ProductReview, id=id)
     obj.delete()
     return Response({"message": "Review deleted"}, status=status.HTTP_204_NO_CONTENT)
+
+# ============================================================
+# ORDERS
+# ============================================================
+def visible_orders(request):
+    qs = Order.objects.filter(restaurant_id=tenancy.current()).prefetch_related('items')
+    return qs if is_kitchen_user(request.user, tenancy.current()) else qs.filter(placed_by_id=request.user.id)
+
+@api_view(['GET', 'POST'])
+@permission_classes([IsAuthenticated])
+def order_list_create(request):
+    if request.method == 'GET':
+        try:
+            rows, next_cursor = keyset_page(request, visible_orders(request), ('-created_at', '-id'))
+        except ValueError as e:
+            return Response({"errors": {"pagination": [str(e)]}}, status=status.HTTP_400_BAD_REQUEST)
+        return Response({"results": OrderSerializer(rows, many=True).data, "next_cursor": next_cursor})
+
+    s = PlaceOrderSerializer(data=request.data)
+    if not s.is_valid():
+        return Response({"errors": s.errors}, status=status.HTTP_400_BAD_REQUEST)
+    try:
+        order = place_order(request.user, s.validated_data['items'], s.validated_data.get('notes'))
+    except OrderRejected as e:
+        return Response({"errors": e.errors}, status=status.HTTP_400_BAD_REQUEST)
+    return Response({"message": "Order placed", "data": OrderSerializer(order).data}, status=status.HTTP_201_CREATED)
+
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+def order_detail(request, id):
+    obj = get_object_or_404(visible_orders(request), id=id)
+    return Response(OrderSerializer(obj).data)
+
+@api_view(['PUT'])
+@permission_classes([IsAuthenticated, IsRestaurantMember])
+def order_update(request, id):
+    if not is_kitchen_user(request.user, tenancy.current()):
+        return Response({"errors": {"permission": ["Only restaurant staff can change an order's status."]}}, status=status.HTTP_403_FORBIDDEN)
+    try:
+        order = set_status(id, request.data.get('status'))
+    except Order.DoesNotExist:
+        return Response({"errors": {"order": ["Not found."]}}, status=status.HTTP_404_NOT_FOUND)
+    except OrderRejected as e:
+        return Response({"errors": e.errors}, status=status.HTTP_400_BAD_REQUEST)
+    return Response({"message": "Order updated", "data": OrderSerializer(order).data}, status=status.HTTP_200_OK)
+
+# ============================================================
+# KITCHEN DISPLAY
+# ============================================================
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+def kitchen_queue_view(request):
+    if not is_kitchen_user(request.user, tenancy.current()):
+        return Response({"errors": {"permission": ["Only restaurant staff can see the kitchen queue."]}}, status=status.HTTP_403_FORBIDDEN)
+    return Response(kitchen_queue())
+
+def stream_user(request):
+    # EventSource cannot send headers, so the access token may also come as ?token=
+    auth = ClaimsJWTAuthentication()
+    header = auth.get_header(request)
+    raw = auth.get_raw_token(header) if header else request.GET.get('token', '').encode() or None
+    if raw is None:
+        return None
+    try:
+        return auth.get_user(auth.get_validated_token(raw))
+    except (InvalidToken, AuthenticationFailed):
+        return None
+
+async def kitchen_events(restaurant_id):
+    # Subscribe on the loop serving the stream, before the snapshot is read, so no change falls between them
+    subscription = kitchen.get_broker().subscribe()
+    try:
+        yield "retry: 3000\n\n"
+        yield f"event: snapshot\ndata: {kitchen.encode(await sync_to_async(kitchen_queue)(restaurant_id))}\n\n"
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + settings.KITCHEN_STREAM_MAX_SECONDS
+        while loop.time() < deadline:
+            data = await subscription.get(min(settings.KITCHEN_HEARTBEAT_SECONDS, max(deadline - loop.time(), 0)))
+            if data is None:
+                yield ": keep-alive\n\n"
+            elif data == kitchen.RESYNC:
+                yield f"event: snapshot\ndata: {kitchen.encode(await sync_to_async(kitchen_queue)(restaurant_id))}\n\n"
+            elif json.loads(data).get('restaurant') == restaurant_id:
+                yield f"event: ticket\ndata: {data}\n\n"
+    finally:
+        await subscription.close()
+
+async def kitchen_stream(request):
+    if not isinstance(request, ASGIRequest):
+        return JsonResponse({"errors": {"stream": ["The kitchen stream needs an ASGI server; poll kitchen/queue/ instead."]}}, status=501)
+    user = await sync_to_async(stream_user)(request)
+    if user is None:
+        return JsonResponse({"errors": {"token": ["A valid access token is required."]}}, status=401)
+    if not await sync_to_async(may_use_api)(user):
+        return JsonResponse(EXPIRED, status=403)
+    # The restaurant is read now: the middleware has deactivated it by the time the stream runs
+    restaurant_id = tenancy.current()
+    if not await sync_to_async(is_kitchen_user)(user, restaurant_id):
+        return JsonResponse({"errors": {"permission": ["Only restaurant staff can see the kitchen queue."]}}, status=403)
+    response = StreamingHttpResponse(kitchen_events(restaurant_id), content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    response['X-Accel-Buffering'] = 'no'
+    return response
+
+# ============================================================
+# REPORTS — served from the rollup tables (see rollups.py)
+# ============================================================
+def report_response(request, build):
+    if not is_report_user(request.user):
+        return Response({"errors": {"permission": ["Only restaurant owners and staff can see reports."]}}, status=status.HTTP_403_FORBIDDEN)
+    s = ReportQuerySerializer(data=request.query_params)
+    if not s.is_valid():
+        return Response({"errors": s.errors}, status=status.HTTP_400_BAD_REQUEST)
+    return Response({"message": "Report", "data": build(s.validated_data)})
+
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+def sales_report_view(request):
+    return report_response(request, lambda filters: sales_report(filters, request.user))
+
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+def payment_report_view(request):
+    return report_response(request, lambda filters: payment_report(filters, request.user))
+
+# ============================================================
+# PAYMENT SETTLEMENTS — gateway files upserted by transaction_id
+# ============================================================
+@api_view(['POST'])
+@permission_classes([IsAdminUser])
+@parser_classes([MultiPartParser])
+def payment_settlements_import(request):
+    upload = request.FILES.get('file')
+    if not upload:
+        return Response({"errors": {"file": ["A CSV or JSON settlement file is required."]}}, status=status.HTTP_400_BAD_REQUEST)
+    try:
+        fmt = request.data.get('format') or detect_format(upload.name)
+    except ValueError as e:
+        return Response({"errors": {"file": [str(e)]}}, status=status.HTTP_400_BAD_REQUEST)
+    if fmt not in ('csv', 'json'):
+        return Response({"errors": {"format": ["Use csv or json."]}}, status=status.HTTP_400_BAD_REQUEST)
+    report = SettlementImporter(user=request.user).run(to_text_stream(upload.file), fmt)
+    message = f"{report['created']} payments created, {report['updated']} updated, {report['unchanged']} unchanged"
+    return Response({"message": message, "data": report}, status=status.HTTP_200_OK)
+
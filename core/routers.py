@@ -0,0 +1,28 @@
+"""
+Read/write split over the two SQLite connections in DATABASES.
+
+Writes go to default. Reads go to the query-only 'readonly' connection, so
+with WAL they never queue behind a writer, except inside a transaction on
+default, where they stay on default to see that transaction's own writes.
+Without a 'readonly' alias everything uses default.
+"""
+from django.db import DEFAULT_DB_ALIAS, connections
+
+READ_ALIAS = 'readonly'
+
+
+class ReadWriteRouter:
+    def db_for_read(self, model, **hints):
+        if READ_ALIAS not in connections.settings or connections[DEFAULT_DB_ALIAS].in_atomic_block:
+            return DEFAULT_DB_ALIAS
+        return READ_ALIAS
+
+    def db_for_write(self, model, **hints):
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Both aliases are the same database
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        return db == DEFAULT_DB_ALIAS
@@ -58,6 +58,7 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'apps.restaurant.middleware.query_budget.QueryBudgetMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -65,8 +66,10 @@ MIDDLEWARE = [
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
+    'apps.restaurant.middleware.tenant.TenantMiddleware',
     'apps.restaurant.middleware.subscription_check.SubscriptionCheckMiddleware',
     'simple_history.middleware.HistoryRequestMiddleware',
+    'apps.authentication.history.HistoryBufferMiddleware',
     'corsheaders.middleware.CorsMiddleware',
 ]
 
@@ -74,7 +77,7 @@ ROOT_URLCONF = 'core.urls'
 AUTH_USER_MODEL = 'authentication.Users'
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': (
-        'rest_framework_simplejwt.authentication.JWTAuthentication',
+        'apps.authentication.authentication.ClaimsJWTAuthentication',
     ),
 }
 
@@ -99,12 +102,68 @@ WSGI_APPLICATION = 'core.wsgi.application'
 # Database
 # https://docs.djangoproject.com/en/5.2/ref/settings/#databases
 
+# Run on every new SQLite connection. WAL lets readers work while a write
+# commits; synchronous=NORMAL is durable in WAL mode up to a power cut.
+SQLITE_PRAGMAS = (
+    "PRAGMA journal_mode=WAL;"
+    "PRAGMA synchronous=NORMAL;"
+    "PRAGMA temp_store=MEMORY;"
+    "PRAGMA mmap_size=268435456;"
+    "PRAGMA cache_size=-65536;"
+)
+DB_CONN_MAX_AGE = config('DB_CONN_MAX_AGE', default=600, cast=int)
+# Seconds a connection waits for the write lock before "database is locked"
+DB_BUSY_TIMEOUT = config('DB_BUSY_TIMEOUT', default=20, cast=int)
+
 DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',
         'NAME': BASE_DIR / 'db.sqlite3',
+        'CONN_MAX_AGE': DB_CONN_MAX_AGE,
+        'CONN_HEALTH_CHECKS': True,
+        'OPTIONS': {
+            'timeout': DB_BUSY_TIMEOUT,
+            # Transactions stay DEFERRED; the ones that read before they write
+            # begin IMMEDIATE through core.transactions.write_atomic
+            'init_command': SQLITE_PRAGMAS,
+        },
+    },
+    # Same file, opened query-only; core.routers.ReadWriteRouter sends reads here
+    'readonly': {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'NAME': BASE_DIR / 'db.sqlite3',
+        'CONN_MAX_AGE': DB_CONN_MAX_AGE,
+        'CONN_HEALTH_CHECKS': True,
+        'OPTIONS': {
+            'timeout': DB_BUSY_TIMEOUT,
+            'init_command': SQLITE_PRAGMAS + "PRAGMA query_only=ON;",
+        },
+        'TEST': {'MIRROR': 'default'},
+    },
+}
+DATABASE_ROUTERS = ['core.routers.ReadWriteRouter']
+
+
+# Cache
+# Menu snapshots are keyed by restaurant and CatalogVersion, so a per-process cache stays
+# correct; point this at Redis/Memcached to share snapshots between workers.
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'restaurant-pos',
     }
 }
+MENU_CACHE_TIMEOUT = 60 * 60 * 24
+# Tenancy (apps/restaurant/tenancy.py): how long "restaurant N exists and is active" is cached,
+# and how many restaurants' offer indexes each process keeps in memory
+TENANT_CACHE_TIMEOUT = 60 * 5
+OFFER_INDEX_RESTAURANTS = 256
+# Subscription status: shared cache lifetime, how long each process trusts its own copy, and for how many users
+SUBSCRIPTION_CACHE_TIMEOUT = 60 * 60
+SUBSCRIPTION_LOCAL_TIMEOUT = 30
+SUBSCRIPTION_LOCAL_USERS = 10000
+# Access token revocations live in the database; each process reloads its copy this often (seconds)
+TOKEN_REVOCATION_REFRESH = 10
 
 
 # Password validation
@@ -153,6 +212,64 @@ else:
 
 MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
 
+# Background threads that build resized menu item images (apps/restaurant/images.py)
+IMAGE_DERIVATIVE_WORKERS = 2
+
+# OTP delivery queue (apps/authentication/delivery.py), drained by `python manage.py otp_worker`
+FAST2SMS_API_KEY = config('FAST2SMS_API_KEY', default='')
+EMAIL_TIMEOUT = config('EMAIL_TIMEOUT', default=10, cast=int)
+OTP_CONNECT_TIMEOUT = 3
+OTP_SEND_TIMEOUT = 10
+OTP_BATCH_SIZE = 50
+OTP_MAX_ATTEMPTS = 5
+OTP_RETRY_BASE_SECONDS = 2
+OTP_RETRY_MAX_SECONDS = 120
+# Codes not delivered within this long are dropped rather than sent stale
+OTP_MAX_AGE_SECONDS = 600
+# A job claimed this long ago by a worker that never finished it is picked up again
+OTP_CLAIM_TIMEOUT_SECONDS = 120
+OTP_WORKER_POLL_SECONDS = 1
+
+# Kitchen display stream (apps/restaurant/kitchen.py); RedisBroker shares events between processes
+KITCHEN_BROKER = config('KITCHEN_BROKER', default='apps.restaurant.kitchen.InProcessBroker')
+KITCHEN_REDIS_URL = config('KITCHEN_REDIS_URL', default='redis://localhost:6379/0')
+KITCHEN_HEARTBEAT_SECONDS = 15
+# Streams end after this long and EventSource reconnects, picking up a fresh snapshot
+KITCHEN_STREAM_MAX_SECONDS = 600
+KITCHEN_QUEUE_SIZE = 100
+
+# Reporting rollups (apps/restaurant/rollups.py), refreshed by `python manage.py rebuild_rollups` (run it every few minutes)
+# Rows touched this recently wait for the next refresh, so transactions still committing are not skipped
+ROLLUP_LAG_SECONDS = 60
+ROLLUP_RANGES_PER_QUERY = 200
+ROLLUP_MAX_DAYS = 366
+
+# Query budgets per (URL name, method), enforced by QueryBudgetMiddleware (strict mode raises; the test suite turns it on)
+# Budgets cover the first request after a catalog write, e.g. a filtered product list then reads its rows, their
+# sibling positions, offer ids, the catalog version and a fresh offer index
+QUERY_BUDGETS = {
+    ('product-choices', 'GET'): 0, ('menu_snapshot', 'GET'): 7, ('product_search', 'GET'): 4,
+    ('product_items_list_create', 'GET'): 5, ('product_items_list_create', 'POST'): 16, ('product_item_facets', 'GET'): 1,
+    ('product_item_detail', 'GET'): 4, ('product_item_update', 'PUT'): 12, ('product_item_delete', 'DELETE'): 8,
+    ('product_item_reorder', 'PUT'): 5, ('product_items_import', 'POST'): 16,
+    ('main_category_list_create', 'GET'): 1, ('main_category_list_create', 'POST'): 5, ('main_category_detail', 'GET'): 2,
+    ('main_category_update', 'PUT'): 8, ('main_category_delete', 'DELETE'): 7, ('main_category_reorder', 'PUT'): 5,
+    ('sub_category_list_create', 'GET'): 2, ('sub_category_list_create', 'POST'): 6, ('sub_category_detail', 'GET'): 2,
+    ('sub_category_update', 'PUT'): 8, ('sub_category_delete', 'DELETE'): 7, ('sub_category_reorder', 'PUT'): 5,
+    ('offer_list_create', 'GET'): 1, ('offer_list_create', 'POST'): 3, ('offer_detail', 'GET'): 1,
+    ('offer_update', 'PUT'): 3, ('offer_delete', 'DELETE'): 6,
+    ('product_review_list_create', 'GET'): 1, ('product_review_list_create', 'POST'): 6,
+    ('product_review_detail', 'GET'): 1, ('product_review_delete', 'DELETE'): 6,
+    ('order_list_create', 'GET'): 2, ('order_list_create', 'POST'): 10, ('order_detail', 'GET'): 2,
+    ('order_update', 'PUT'): 5, ('kitchen_queue', 'GET'): 2, ('kitchen_stream', 'GET'): 0,
+    ('sales_report', 'GET'): 2, ('payment_report', 'GET'): 2, ('payment_settlements_import', 'POST'): 10,
+    ('register', 'POST'): 10, ('login', 'POST'): 2, ('otp-metrics', 'GET'): 5,
+    ('user-profile', 'GET'): 1, ('user-profile', 'PUT'): 2, ('user-profile', 'PATCH'): 2,
+}
+QUERY_BUDGET_DEFAULT = None
+QUERY_BUDGET_STRICT = config('QUERY_BUDGET_STRICT', default=False, cast=bool)
+QUERY_REPEAT_THRESHOLD = 5
+
 # Default primary key field type
 # https://docs.djangoproject.com/en/5.2/ref/settings/#default-auto-field
 
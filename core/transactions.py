@@ -0,0 +1,35 @@
+"""
+Transactions that read before they write.
+
+SQLite begins a transaction DEFERRED and takes the write lock at its first
+write. If another connection commits in between, a transaction that has
+already read cannot upgrade: SQLite fails it at once with "database is
+locked" instead of waiting out the busy timeout. write_atomic() begins such
+transactions with BEGIN IMMEDIATE, so they wait for the write lock up
+front. Everything else stays DEFERRED and never queues behind a writer just
+to read.
+
+On other databases write_atomic() is transaction.atomic(); the
+select_for_update() inside these blocks takes the row locks there.
+"""
+from contextlib import contextmanager
+from django.db import DEFAULT_DB_ALIAS, transaction
+
+
+@contextmanager
+def write_atomic(using=None):
+    connection = transaction.get_connection(using or DEFAULT_DB_ALIAS)
+    if connection.vendor != 'sqlite' or connection.in_atomic_block:
+        # A nested block joins a transaction that has already begun
+        with transaction.atomic(using=using):
+            yield
+        return
+    # transaction_mode is read from OPTIONS when the connection opens, so open it first
+    connection.ensure_connection()
+    mode, connection.transaction_mode = connection.transaction_mode, 'IMMEDIATE'
+    try:
+        with transaction.atomic(using=using):
+            connection.transaction_mode = mode
+            yield
+    finally:
+        connection.transaction_mode = mode